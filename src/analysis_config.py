@@ -0,0 +1,82 @@
+import copy
+import json
+import os
+
+# Defaults shared by the desktop app and the headless batch runner.
+# Any key can be overridden from config/analysis_config.json.
+DEFAULT_ANALYSIS_CONFIG = {
+    'yolo_model_path': os.path.join('models', 'yolov8m_for_ocr', 'weights', 'best.pt'),
+    'ocr_params': {
+        'lang': 'en',
+        'use_textline_orientation': False,
+        'use_doc_orientation_classify': False,
+        'use_doc_unwarping': False,
+    },
+    # Run YOLO and PaddleOCR at the same time in the desktop app.
+    # Thread budgets of null split the CPU cores evenly between the two stages.
+    'concurrent_stages': True,
+    'yolo_threads': None,
+    'ocr_threads': None,
+    # 'full' runs PaddleOCR on the whole page; 'crop' only reads text inside the
+    # YOLO element boxes (grown by crop_padding pixels), skipping empty background.
+    'ocr_mode': 'full',
+    'crop_padding': 8,
+    # OCR-to-element matcher: 'grid' (spatial index) or 'numpy' (vectorized matrices)
+    'association_engine': 'grid',
+    # Warm both models up on a synthetic [width, height] screenshot while loading,
+    # so the first real analysis runs at steady-state speed. null disables it.
+    'warmup_size': [1920, 1080],
+    'warmup_runs': 2,
+    # YOLO runtime: 'torch' (the .pt weights), 'onnx' (ONNX Runtime), 'openvino', or
+    # 'onnx_int8' (quantized, built by src/quantize_report.py). Non-torch backends
+    # export the weights once into models/.../weights/exported/.
+    'detector_backend': 'torch',
+    # Split screenshots larger than tile_size into overlapping tiles for YOLO, so small
+    # widgets on 4K or very tall screenshots are detected at full resolution.
+    'yolo_tiling': False,
+    'tile_size': 640,
+    'tile_overlap': 128,
+    # Run PaddleOCR text detection on a copy downscaled to this longest side (e.g. 1280)
+    # while recognition still reads full-resolution crops. null detects at full size.
+    'ocr_det_max_side': None,
+    # Where results are kept: 'json' (a cache file per analysis plus output/<image>_output.json)
+    # or 'sqlite' (a single indexed output/results.sqlite3, better for large batch runs).
+    'result_store': 'json',
+    # Memory budget in MB for analyses kept in RAM; older ones are dropped (least recently
+    # used first) and reloaded from the result store when needed. null means unbounded.
+    'memory_cache_mb': 256,
+    # Reuse the stored analysis of a perceptually identical screenshot (re-encoded, resized)
+    # if its 256-bit difference hash is within this many bits, e.g. 8. null disables it:
+    # small text changes can stay within a few bits, so only enable it for re-encoded copies.
+    'near_duplicate_distance': None,
+}
+
+
+def load_analysis_config(base_dir):
+    """Loads the analysis settings, merging config/analysis_config.json over the defaults."""
+    config = copy.deepcopy(DEFAULT_ANALYSIS_CONFIG)
+    config_path = os.path.join(base_dir, 'config', 'analysis_config.json')
+    if os.path.exists(config_path):
+        try:
+            with open(config_path, 'r') as f:
+                overrides = json.load(f)
+            for key, value in overrides.items():
+                # Nested sections (e.g. ocr_params) are merged key by key
+                if isinstance(value, dict) and isinstance(config.get(key), dict):
+                    config[key].update(value)
+                else:
+                    config[key] = value
+            print(f"Analysis config loaded from {config_path}")
+        except Exception as e:
+            print(f"Error loading analysis config from {config_path}: {e}")
+
+    # Model paths in the config are relative to the project root
+    if not os.path.isabs(config['yolo_model_path']):
+        config['yolo_model_path'] = os.path.join(base_dir, config['yolo_model_path'])
+    return config
+
+
+def memory_budget_bytes(config):
+    """The in-memory analysis cache budget in bytes, or None for no limit."""
+    memory_cache_mb = config.get('memory_cache_mb')
+    return None if memory_cache_mb is None else int(memory_cache_mb * 1024 * 1024)
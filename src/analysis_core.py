@@ -1,20 +1,287 @@
 import cv2
 import numpy as np
-import json
-from ultralytics import YOLO
+import os
+import time
+import torch
+from concurrent.futures import ThreadPoolExecutor
+import paddleocr
 from paddleocr import PaddleOCR
-from PyQt6.QtCore import QRectF # Import QRectF for IoU calculation
+import box_geometry
+from compact_results import ELEMENT_KEYS, OCR_KEYS, CompactAnalysis, _MISSING
+from detector_backends import DETECTOR_BACKENDS, detector_digest, load_detector
+from spatial_index import GridIndex
+
+OCR_MODES = ('full', 'crop')
+# Bump when result parsing or association changes, so persisted cache entries are not reused
+ANALYSIS_CACHE_VERSION = 1
+IOU_THRESHOLD = 0.3 # Minimum IoU for an OCR box that is not fully inside any element
+ASSOCIATION_ENGINES = ('grid', 'numpy')
+NUMPY_ASSOCIATION_CHUNK = 1024 # OCR rows per broadcast block, bounds the matrix memory
+
+
+def _association_rects(bboxes):
+    """Rects used for association, as (N, 4) [left, top, right, bottom] edges.
+
+    Association has always read a bbox the way QRectF(*bbox) does, i.e. as
+    (x, y, width, height). That reading is kept here so results don't change.
+    """
+    boxes = box_geometry.as_array(bboxes)
+    x, y = boxes[:, 0], boxes[:, 1]
+    right, bottom = x + boxes[:, 2], y + boxes[:, 3]
+    return np.stack([np.minimum(x, right), np.minimum(y, bottom), np.maximum(x, right), np.maximum(y, bottom)], axis=1)
+
+
+def _match_grid(element_bboxes, ocr_bboxes):
+    """Returns the associated element index (or -1) for each OCR box, using a grid index over the elements."""
+    # Build the element rects once and index them on a grid, so each OCR box is only
+    # compared with the elements it can actually touch instead of every element
+    element_rects = _association_rects(element_bboxes).tolist()
+    element_index = GridIndex(element_rects)
+
+    assignments = []
+    for ocr_rect in _association_rects(ocr_bboxes).tolist():
+        best_match_element_index = -1
+        best_iou = 0.0
+        contained_in_element_index = -1 # To store the index of element that fully contains this text
+
+        # Candidates come back in ascending index order, so the first-containment and
+        # first-best-IoU tie-breaking is the same as scanning every element
+        for elem_index in element_index.query(*ocr_rect):
+            element_rect = element_rects[elem_index]
+
+            # Check for full containment of the OCR bbox within the element bbox
+            if box_geometry.contains(element_rect, ocr_rect):
+                 contained_in_element_index = elem_index
+                 break # Prioritize containment, stop searching for this OCR
+
+            # If not contained, use IoU for the overlap check
+            iou = box_geometry.iou(element_rect, ocr_rect)
+            if iou > IOU_THRESHOLD and iou > best_iou:
+                 best_iou = iou
+                 best_match_element_index = elem_index
+
+        assignments.append(contained_in_element_index if contained_in_element_index != -1 else best_match_element_index)
+    return assignments
+
+
+def _match_numpy(element_bboxes, ocr_bboxes):
+    """Vectorized equivalent of _match_grid: containment and IoU matrices via broadcasting."""
+    if not element_bboxes or not ocr_bboxes:
+        return [-1] * len(ocr_bboxes)
+
+    element_rects = _association_rects(element_bboxes)
+    ocr_rects = _association_rects(ocr_bboxes)
+
+    assignments = np.full(len(ocr_rects), -1, dtype=np.int64)
+    for start in range(0, len(ocr_rects), NUMPY_ASSOCIATION_CHUNK):
+        rows = slice(start, start + NUMPY_ASSOCIATION_CHUNK)
+        contained = box_geometry.pairwise_contains(element_rects, ocr_rects[rows])
+        iou = box_geometry.pairwise_iou(ocr_rects[rows], element_rects)
+        iou[iou <= IOU_THRESHOLD] = 0.0
+
+        # argmax picks the first maximum, matching the lowest-index tie-breaking of the loop
+        block = np.where(iou.max(axis=1) > 0, iou.argmax(axis=1), -1)
+        has_container = contained.any(axis=1)
+        block[has_container] = contained.argmax(axis=1)[has_container]
+        assignments[rows] = block
+    return assignments.tolist()
+
+
+TILE_MERGE_IOU = 0.5 # Same-class boxes overlapping this much are duplicates
+TILE_MERGE_IOS = 0.5 # Seam-cut boxes mostly inside a kept box (intersection over own area) are fragments
+SEAM_MARGIN = 2 # Pixels from an interior tile edge at which a box counts as cut by the seam
+
+
+def _merge_tiled_detections(full_image_elements, tiles, width, height):
+    """Merges the whole-image pass with per-tile detections into one list in image coordinates.
+
+    tiles is a list of (window, elements) with element bboxes relative to the window. Boxes that
+    touch an interior tile edge may be cut off by the seam, so they are ranked after complete boxes
+    and dropped if they are mostly covered by a kept box of the same type; everything else goes
+    through class-aware greedy NMS by confidence.
+    """
+    candidates = [(False, element) for element in full_image_elements]
+    for (tile_x1, tile_y1, tile_x2, tile_y2), elements in tiles:
+        for element in elements:
+            x1, y1, x2, y2 = element['bbox']
+            bbox = [x1 + tile_x1, y1 + tile_y1, x2 + tile_x1, y2 + tile_y1]
+            cut_by_seam = ((tile_x1 > 0 and bbox[0] <= tile_x1 + SEAM_MARGIN)
+                           or (tile_y1 > 0 and bbox[1] <= tile_y1 + SEAM_MARGIN)
+                           or (tile_x2 < width and bbox[2] >= tile_x2 - SEAM_MARGIN)
+                           or (tile_y2 < height and bbox[3] >= tile_y2 - SEAM_MARGIN))
+            candidates.append((cut_by_seam, dict(element, bbox=bbox)))
+
+    candidates.sort(key=lambda candidate: (candidate[0], -candidate[1]['confidence']))
+    kept = []
+    for cut_by_seam, element in candidates:
+        duplicate = False
+        for kept_element in kept:
+            if kept_element['type'] != element['type']:
+                continue
+            if box_geometry.iou(kept_element['bbox'], element['bbox']) >= TILE_MERGE_IOU:
+                duplicate = True
+                break
+            if cut_by_seam:
+                overlap = box_geometry.intersection(kept_element['bbox'], element['bbox'])
+                element_area = box_geometry.area(element['bbox'])
+                if overlap is not None and element_area > 0 and box_geometry.area(overlap) / element_area >= TILE_MERGE_IOS:
+                    duplicate = True
+                    break
+        if not duplicate:
+            kept.append(element)
+    return kept
+
+
+DIFF_THRESHOLD = 16 # Per-pixel channel difference that counts as a change (ignores JPEG noise)
+INCREMENTAL_MARGIN = 32 # Context pixels added around each changed region before re-analysis
+INCREMENTAL_MAX_CHANGED = 0.5 # Above this changed-area fraction a full analysis is cheaper
+
+
+def _changed_regions(previous_image, image_cv, threshold=DIFF_THRESHOLD, margin=INCREMENTAL_MARGIN):
+    """Bounding boxes [x1, y1, x2, y2] of the areas that differ between two same-sized images.
+    Changes closer than margin pixels are grouped into one region."""
+    diff = cv2.absdiff(previous_image, image_cv)
+    if diff.ndim == 3:
+        diff = diff.max(axis=2)
+    mask = (diff > threshold).astype(np.uint8)
+    if not mask.any():
+        return []
+    if margin > 0:
+        mask = cv2.dilate(mask, np.ones((margin, margin), dtype=np.uint8))
+    contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    regions = []
+    for contour in contours:
+        x, y, w, h = cv2.boundingRect(contour)
+        regions.append([x, y, x + w, y + h])
+    return _merge_regions(regions)
+
+
+def _merge_regions(regions):
+    """Unions overlapping or touching boxes until no two of them intersect."""
+    regions = [list(region) for region in regions]
+    merged = True
+    while merged:
+        merged = False
+        for i in range(len(regions)):
+            for j in range(i + 1, len(regions)):
+                a, b = regions[i], regions[j]
+                if a[0] <= b[2] and b[0] <= a[2] and a[1] <= b[3] and b[1] <= a[3]:
+                    regions[i] = [min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3])]
+                    del regions[j]
+                    merged = True
+                    break
+            if merged:
+                break
+    return regions
+
+
+def _overlaps(box, region):
+    """True if a bbox [x1, y1, x2, y2] overlaps a region (touching edges count)."""
+    return box[0] <= region[2] and region[0] <= box[2] and box[1] <= region[3] and region[1] <= box[3]
+
+
+def _compact_compatible(yolo_results, ocr_results):
+    """True if the results use the standard schema the compact associator reproduces exactly:
+    float element boxes without prior associated text, integer OCR boxes with only the parser's keys."""
+    for element in yolo_results:
+        if element.get('associated_text') or not all(isinstance(value, float) for value in element['bbox']):
+            return False
+    for ocr_res in ocr_results:
+        if len(ocr_res) != len(OCR_KEYS) or not all(type(value) is int for value in ocr_res['bbox']):
+            return False
+    return True
+
+
+def _synthetic_screenshot(width, height):
+    """Builds a UI-like test image (panels, buttons and text lines) for model warm-up."""
+    image_cv = np.full((height, width, 3), 240, dtype=np.uint8)
+    cv2.rectangle(image_cv, (0, 0), (width, max(1, height // 12)), (60, 60, 60), -1) # Title bar
+    row_height = max(40, height // 16)
+    for row, y in enumerate(range(height // 8, height - row_height, row_height)):
+        cv2.putText(image_cv, f"Sample label {row}: settings value", (width // 20, y + row_height // 2),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.8, (20, 20, 20), 2)
+        button_x = width // 2
+        cv2.rectangle(image_cv, (button_x, y + 4), (button_x + width // 8, y + row_height - 4), (200, 120, 40), -1)
+        cv2.putText(image_cv, "Apply", (button_x + 10, y + row_height // 2 + 6),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 255), 2)
+    return image_cv
+
 
 class AnalysisCore:
-    def __init__(self, yolo_model_path, ocr_params):
+    def __init__(self, yolo_model_path, ocr_params, concurrent=False, yolo_threads=None, ocr_threads=None,
+                 ocr_mode='full', crop_padding=8, association_engine='grid', warmup_size=None, warmup_runs=2,
+                 detector_backend='torch', yolo_tiling=False, tile_size=640, tile_overlap=128,
+                 ocr_det_max_side=None, progress_callback=None):
         self.yolo_model = None
+        self.detector_backend = None
+        self.detector_digest = None
+        self.warmup_timings = None
         self.yolo_class_names = None
         self.ocr_model = None
+        self._executor = None
+        ocr_params = dict(ocr_params)
+
+        if ocr_mode not in OCR_MODES:
+            print(f"Warning: Unknown OCR mode '{ocr_mode}', falling back to 'full'.")
+            ocr_mode = 'full'
+        self.ocr_mode = ocr_mode
+        self.crop_padding = crop_padding
+
+        if association_engine not in ASSOCIATION_ENGINES:
+            print(f"Warning: Unknown association engine '{association_engine}', falling back to 'grid'.")
+            association_engine = 'grid'
+        self.association_engine = association_engine
+
+        # Tiled YOLO for images larger than one tile (see run_yolo_batch)
+        self.yolo_tiling = yolo_tiling
+        self.tile_size = tile_size
+        self.tile_overlap = min(tile_overlap, tile_size // 2)
+
+        # Multi-resolution OCR: PaddleOCR detects text on a copy whose longest side is at most
+        # ocr_det_max_side, maps the polygons back to the original image and recognizes the
+        # full-resolution crops, so the ocr_results schema and coordinates are unchanged.
+        self._ocr_predict_kwargs = {}
+        if ocr_det_max_side:
+            self._ocr_predict_kwargs = {'text_det_limit_type': 'max', 'text_det_limit_side_len': int(ocr_det_max_side)}
+
+        if concurrent:
+            # Split the cores between the two stages so they don't oversubscribe the CPU
+            cpu_count = os.cpu_count() or 2
+            if yolo_threads is None:
+                yolo_threads = max(1, cpu_count // 2)
+            if ocr_threads is None:
+                ocr_threads = max(1, cpu_count - yolo_threads)
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ocr-stage")
+
+        if yolo_threads:
+            torch.set_num_threads(yolo_threads)
+        if ocr_threads:
+            ocr_params.setdefault('cpu_threads', ocr_threads)
+        self.ocr_params = ocr_params
+        if concurrent:
+            print(f"Concurrent analysis enabled: YOLO threads={yolo_threads}, OCR threads={ocr_params.get('cpu_threads')}")
+
+        # progress_callback(message, percent) lets a UI follow the load
+        report_progress = progress_callback or (lambda message, percent: None)
 
         try:
             # Load YOLO model locally
-            print(f"Loading YOLO model from {yolo_model_path}")
-            self.yolo_model = YOLO(yolo_model_path)
+            print(f"Loading YOLO model from {yolo_model_path} ({detector_backend} backend)")
+            report_progress("Loading YOLO model...", 10)
+            if detector_backend not in DETECTOR_BACKENDS:
+                print(f"Warning: Unknown detector backend '{detector_backend}', falling back to 'torch'.")
+                detector_backend = 'torch'
+            try:
+                self.yolo_model = load_detector(yolo_model_path, detector_backend)
+            except Exception as backend_e:
+                if detector_backend == 'torch':
+                    raise
+                # A missing runtime or failed export shouldn't leave the app without a detector
+                print(f"Error loading {detector_backend} detector: {backend_e}. Falling back to 'torch'.")
+                detector_backend = 'torch'
+                self.yolo_model = load_detector(yolo_model_path, detector_backend)
+            self.detector_backend = detector_backend
+            self.detector_digest = detector_digest(yolo_model_path, detector_backend)
             self.yolo_class_names = self.yolo_model.names
             print("YOLO model loaded.")
         except Exception as yolo_e:
@@ -25,6 +292,7 @@ class AnalysisCore:
 
         try:
              print("Initializing PaddleOCR model...")
+             report_progress("Initializing PaddleOCR...", 50)
              self.ocr_model = PaddleOCR(**ocr_params)
              print("PaddleOCR model initialized.")
         except Exception as ocr_e:
@@ -33,154 +301,454 @@ class AnalysisCore:
 
         if self.yolo_model and self.ocr_model:
              print("All models loaded successfully in AnalysisCore.")
+             if warmup_size:
+                  report_progress("Warming up models...", 80)
+                  self.warmup(*warmup_size, runs=warmup_runs)
+             report_progress("Models ready", 100)
         else:
              print("One or more models failed to load in AnalysisCore.")
+             report_progress("Model loading failed", 100)
+
+    @classmethod
+    def from_config(cls, config, **overrides):
+        """Builds an AnalysisCore from a load_analysis_config() dict; keyword overrides win."""
+        options = {
+            'concurrent': config.get('concurrent_stages', False),
+            'yolo_threads': config.get('yolo_threads'),
+            'ocr_threads': config.get('ocr_threads'),
+            'ocr_mode': config.get('ocr_mode', 'full'),
+            'crop_padding': config.get('crop_padding', 8),
+            'association_engine': config.get('association_engine', 'grid'),
+            'warmup_size': config.get('warmup_size'),
+            'warmup_runs': config.get('warmup_runs', 2),
+            'detector_backend': config.get('detector_backend', 'torch'),
+            'yolo_tiling': config.get('yolo_tiling', False),
+            'tile_size': config.get('tile_size', 640),
+            'tile_overlap': config.get('tile_overlap', 128),
+            'ocr_det_max_side': config.get('ocr_det_max_side'),
+        }
+        options.update(overrides)
+        return cls(config['yolo_model_path'], config['ocr_params'], **options)
+
+
+    def cache_signature(self):
+        """Everything apart from the image that determines the analysis output.
+        Used in the persistent cache key (see data_manager.make_cache_key)."""
+        return {
+            'version': ANALYSIS_CACHE_VERSION,
+            'detector_backend': self.detector_backend,
+            'detector_digest': self.detector_digest,
+            # Thread counts don't change results
+            'ocr_params': {key: value for key, value in self.ocr_params.items() if key != 'cpu_threads'},
+            'paddleocr_version': getattr(paddleocr, '__version__', None),
+            'ocr_mode': self.ocr_mode,
+            'crop_padding': self.crop_padding if self.ocr_mode == 'crop' else None,
+            'ocr_predict': self._ocr_predict_kwargs,
+            'yolo_tiling': [self.tile_size, self.tile_overlap] if self.yolo_tiling else None,
+        }
+
+    def warmup(self, width=1920, height=1080, runs=2):
+        """Runs a synthetic screenshot through both models so that torch/Paddle finish their lazy
+        initialization before the first real image. Returns per-run timings in seconds."""
+        image_cv = _synthetic_screenshot(width, height)
+        timings = {'yolo': [], 'ocr': []}
+        for _ in range(max(1, runs)):
+            start_time = time.perf_counter()
+            self.run_yolo(image_cv)
+            timings['yolo'].append(time.perf_counter() - start_time)
+
+            # Full-page OCR warms up both the detector and the recognizer whatever the OCR mode.
+            # In concurrent mode real OCR runs on the ocr-stage thread, so warm up that thread.
+            start_time = time.perf_counter()
+            if self._executor is not None:
+                self._executor.submit(self.run_ocr, image_cv).result()
+            else:
+                self.run_ocr(image_cv)
+            timings['ocr'].append(time.perf_counter() - start_time)
+
+        self.warmup_timings = timings
+        print(f"Warm-up at {width}x{height}: YOLO cold {timings['yolo'][0]:.2f}s / warm {timings['yolo'][-1]:.2f}s, "
+              f"OCR cold {timings['ocr'][0]:.2f}s / warm {timings['ocr'][-1]:.2f}s")
+        return timings
 
+    def run_analysis(self, image_cv, stage_callback=None):
+        """Runs YOLO and PaddleOCR inference and returns raw results.
 
-    def run_analysis(self, image_cv):
-        """Runs YOLO and PaddleOCR inference and returns raw results."""
+        stage_callback, if given, is called as stage_callback('yolo', yolo_results) and then
+        stage_callback('ocr', ocr_results) as each stage finishes. An exception raised by the
+        callback aborts the analysis.
+        """
         if self.yolo_model is None or self.ocr_model is None:
              print("Models not loaded. Cannot run analysis.")
              return None, None # Return empty results
 
+        def stage_finished(stage, results):
+            if stage_callback is not None:
+                stage_callback(stage, results)
+
+        if self.ocr_mode == 'crop':
+            # Text is only searched for inside the detected elements, so OCR has to wait for YOLO
+            yolo_results = self.run_yolo(image_cv)
+            stage_finished('yolo', yolo_results)
+            ocr_results = self.run_crop_ocr(image_cv, yolo_results)
+        elif self._executor is not None:
+            # OCR runs on the helper thread while YOLO runs here; both release the GIL during inference
+            ocr_future = self._executor.submit(self.run_ocr, image_cv)
+            yolo_results = self.run_yolo(image_cv)
+            stage_finished('yolo', yolo_results)
+            ocr_results = ocr_future.result()
+        else:
+            yolo_results = self.run_yolo(image_cv)
+            stage_finished('yolo', yolo_results)
+            ocr_results = self.run_ocr(image_cv)
+        stage_finished('ocr', ocr_results)
+
+        return yolo_results, ocr_results
+
+    def run_analysis_batch(self, images, batch_size=8):
+        """Runs YOLO and PaddleOCR on a list of images, batch_size frames per predict call.
+
+        Returns a list of (yolo_results, ocr_results) pairs in the same order as images.
+        """
+        if batch_size < 1:
+            raise ValueError("batch_size must be >= 1")
+        if self.yolo_model is None or self.ocr_model is None:
+             print("Models not loaded. Cannot run analysis.")
+             return [(None, None) for _ in images]
+
+        analysis_results = []
+        for start in range(0, len(images), batch_size):
+            batch = list(images[start:start + batch_size])
+            if self.ocr_mode == 'crop':
+                yolo_batch = self.run_yolo_batch(batch)
+                ocr_batch = self.run_crop_ocr_batch(batch, yolo_batch)
+            elif self._executor is not None:
+                ocr_future = self._executor.submit(self.run_ocr_batch, batch)
+                yolo_batch = self.run_yolo_batch(batch)
+                ocr_batch = ocr_future.result()
+            else:
+                yolo_batch = self.run_yolo_batch(batch)
+                ocr_batch = self.run_ocr_batch(batch)
+            analysis_results.extend(zip(yolo_batch, ocr_batch))
+        return analysis_results
+
+    def run_incremental(self, previous_image, previous_yolo, previous_ocr, image_cv, margin=INCREMENTAL_MARGIN):
+        """Re-analyzes only the parts of image_cv that changed since previous_image.
+
+        previous_yolo/previous_ocr are the raw results for previous_image. Changed regions are grown
+        to cover every previous element or text box they touch, re-run through YOLO and OCR with
+        margin pixels of context, and the new detections replace the old ones in those regions.
+        Falls back to run_analysis when the sizes differ or most of the screen changed.
+        Returns (yolo_results, ocr_results, regions); pass the first two to associate_results.
+        """
+        if self.yolo_model is None or self.ocr_model is None:
+             print("Models not loaded. Cannot run analysis.")
+             return None, None, []
+
+        height, width = image_cv.shape[:2]
+        if previous_image is None or previous_yolo is None or previous_ocr is None or previous_image.shape != image_cv.shape:
+            yolo_results, ocr_results = self.run_analysis(image_cv)
+            return yolo_results, ocr_results, [[0, 0, width, height]]
+
+        start_time = time.perf_counter()
+        regions = _changed_regions(previous_image, image_cv, margin=margin)
+        if not regions:
+            print("Incremental analysis: no changes, reusing previous results.")
+            return ([dict(element, bbox=list(element['bbox'])) for element in previous_yolo],
+                    [dict(ocr_res, bbox=list(ocr_res['bbox'])) for ocr_res in previous_ocr], [])
+
+        # A region that cuts through an old element or text line must re-read all of it.
+        # Boxes are clamped to the image first: a region can't grow past the image edge, so a box
+        # sticking out of it would never count as covered.
+        previous_boxes = []
+        for box in [element['bbox'] for element in previous_yolo] + [ocr_res['bbox'] for ocr_res in previous_ocr]:
+            x1, y1 = max(0, int(np.floor(box[0]))), max(0, int(np.floor(box[1])))
+            x2, y2 = min(width, int(np.ceil(box[2]))), min(height, int(np.ceil(box[3])))
+            if x1 <= x2 and y1 <= y2:
+                previous_boxes.append([x1, y1, x2, y2])
+        while True:
+            previous_regions = [list(region) for region in regions]
+            for region in regions:
+                for box in previous_boxes:
+                    if _overlaps(box, region) and not (region[0] <= box[0] and region[1] <= box[1]
+                                                       and box[2] <= region[2] and box[3] <= region[3]):
+                        region[0], region[1] = min(region[0], box[0]), min(region[1], box[1])
+                        region[2], region[3] = max(region[2], box[2]), max(region[3], box[3])
+            regions = _merge_regions(regions)
+            if sorted(regions) == sorted(previous_regions):
+                break
+
+        changed_area = sum((x2 - x1) * (y2 - y1) for x1, y1, x2, y2 in regions)
+        if changed_area > INCREMENTAL_MAX_CHANGED * width * height:
+            print(f"Incremental analysis: {changed_area / (width * height):.0%} of the image changed, running a full analysis.")
+            yolo_results, ocr_results = self.run_analysis(image_cv)
+            return yolo_results, ocr_results, [[0, 0, width, height]]
+
+        windows = [[max(0, x1 - margin), max(0, y1 - margin), min(width, x2 + margin), min(height, y2 + margin)]
+                   for x1, y1, x2, y2 in regions]
+        crops = [np.ascontiguousarray(image_cv[y1:y2, x1:x2]) for x1, y1, x2, y2 in windows]
+
+        # Detect at the scale the full-image pass would use, so elements look the same size to YOLO
+        # (the predictor would otherwise letterbox a small crop up to 640 pixels)
+        detection_scale = 1.0 if self.yolo_tiling else min(1.0, 640 / max(width, height))
+        crop_yolo = []
+        for crop in crops:
+            imgsz = max(32, int(np.ceil(max(crop.shape[:2]) * detection_scale / 32)) * 32)
+            try:
+                result = self.yolo_model.predict(source=crop, imgsz=imgsz, conf=0.25, verbose=False)[0]
+                crop_yolo.append(self._parse_yolo_result(result))
+            except Exception as e:
+                print(f"Error during incremental YOLO inference: {e}")
+                crop_yolo.append([])
+        if self.ocr_mode == 'crop':
+            crop_ocr = self.run_crop_ocr_batch(crops, crop_yolo)
+        else:
+            crop_ocr = self.run_ocr_batch(crops)
+
+        # Old results outside the changed regions are kept; inside them the new ones take over.
+        # A new box belongs to the region holding its center, so overlapping windows can't duplicate it.
+        yolo_results = [dict(element, bbox=list(element['bbox'])) for element in previous_yolo
+                        if not any(_overlaps(element['bbox'], region) for region in regions)]
+        ocr_results = [dict(ocr_res, bbox=list(ocr_res['bbox'])) for ocr_res in previous_ocr
+                       if not any(_overlaps(ocr_res['bbox'], region) for region in regions)]
+        for region, (offset_x, offset_y, _, _), elements, texts in zip(regions, windows, crop_yolo, crop_ocr):
+            for item, target in [(element, yolo_results) for element in elements] + [(ocr_res, ocr_results) for ocr_res in texts]:
+                x1, y1, x2, y2 = item['bbox']
+                bbox = [x1 + offset_x, y1 + offset_y, x2 + offset_x, y2 + offset_y]
+                center_x, center_y = (bbox[0] + bbox[2]) / 2, (bbox[1] + bbox[3]) / 2
+                if region[0] <= center_x <= region[2] and region[1] <= center_y <= region[3]:
+                    target.append(dict(item, bbox=bbox))
+
+        print(f"Incremental analysis: {len(regions)} changed region(s), {changed_area / (width * height):.1%} of the image "
+              f"({time.perf_counter() - start_time:.2f}s)")
+        return yolo_results, ocr_results, regions
+
+    def run_yolo(self, image_cv):
+        """Runs YOLO detection on one image and returns the element list."""
+        return self.run_yolo_batch([image_cv])[0]
+
+    def run_yolo_batch(self, images):
+        """Runs YOLO detection on several images in a single predict call.
+
+        With yolo_tiling, images larger than one tile are also split into overlapping tiles
+        that go through the same predict call at full resolution; see _merge_tiled_detections.
+        """
         # --- YOLO Detection ---
-        print("Running YOLO inference...")
-        yolo_results = []
+        print(f"Running YOLO inference on {len(images)} image(s)...")
+        start_time = time.perf_counter()
+        yolo_batch = [[] for _ in images]
         try:
-            results_yolo = self.yolo_model.predict(source=image_cv, imgsz=640, conf=0.25, verbose=False)
-            if results_yolo and len(results_yolo) > 0:
-                result = results_yolo[0]
-                if result.boxes is not None:
-                    for box in result.boxes:
-                        x1, y1, x2, y2 = box.xyxy[0].tolist()
-                        conf = box.conf[0].item()
-                        cls = box.cls[0].item()
-                        class_name = self.yolo_class_names[int(cls)] if self.yolo_class_names and int(cls) < len(self.yolo_class_names) else f"unknown_{int(cls)}"
-
-                        yolo_results.append({
-                            "type": class_name,
-                            "confidence": conf,
-                            "bbox": [x1, y1, x2, y2],
-                            "associated_text": []
-                        })
-            print(f"Total YOLO elements detected: {len(yolo_results)}")
+            # Each source is (image index, tile window or None for the whole image)
+            sources, source_owners = [], []
+            for image_index, image_cv in enumerate(images):
+                sources.append(image_cv)
+                source_owners.append((image_index, None))
+                height, width = image_cv.shape[:2]
+                if self.yolo_tiling and max(height, width) > self.tile_size:
+                    for window in self._tile_windows(width, height):
+                        x1, y1, x2, y2 = window
+                        sources.append(np.ascontiguousarray(image_cv[y1:y2, x1:x2]))
+                        source_owners.append((image_index, window))
+
+            results_yolo = self.yolo_model.predict(source=sources, imgsz=self.tile_size if self.yolo_tiling else 640, conf=0.25, verbose=False)
+            tiled_detections = [[] for _ in images]
+            for (image_index, window), result in zip(source_owners, results_yolo or []):
+                if window is None:
+                    yolo_batch[image_index] = self._parse_yolo_result(result)
+                else:
+                    tiled_detections[image_index].append((window, self._parse_yolo_result(result)))
+
+            for image_index, tiles in enumerate(tiled_detections):
+                if tiles:
+                    height, width = images[image_index].shape[:2]
+                    yolo_batch[image_index] = _merge_tiled_detections(yolo_batch[image_index], tiles, width, height)
+            print(f"Total YOLO elements detected: {sum(len(r) for r in yolo_batch)} ({time.perf_counter() - start_time:.2f}s)")
         except Exception as e:
              print(f"Error during YOLO inference: {e}")
              # Continue with empty YOLO results if inference fails
 
+        return yolo_batch
+
+    def _tile_windows(self, width, height):
+        """(x1, y1, x2, y2) tile windows of tile_size pixels covering the image with tile_overlap."""
+        def starts(length):
+            if length <= self.tile_size:
+                return [0]
+            positions = list(range(0, length - self.tile_size, self.tile_size - self.tile_overlap))
+            return positions + [length - self.tile_size] # Last tile is flush with the far edge
 
+        return [(x, y, min(x + self.tile_size, width), min(y + self.tile_size, height))
+                for y in starts(height) for x in starts(width)]
+
+    def _parse_yolo_result(self, result):
+        """Converts one ultralytics result into the element dicts used throughout the app."""
+        yolo_results = []
+        if result.boxes is not None:
+            for box in result.boxes:
+                x1, y1, x2, y2 = box.xyxy[0].tolist()
+                conf = box.conf[0].item()
+                cls = box.cls[0].item()
+                class_name = self.yolo_class_names[int(cls)] if self.yolo_class_names and int(cls) < len(self.yolo_class_names) else f"unknown_{int(cls)}"
+
+                yolo_results.append({
+                    "type": class_name,
+                    "confidence": conf,
+                    "bbox": [x1, y1, x2, y2],
+                    "associated_text": []
+                })
+        return yolo_results
+
+    def run_ocr(self, image_cv):
+        """Runs PaddleOCR on one image and returns the text block list."""
+        return self.run_ocr_batch([image_cv])[0]
+
+    def run_ocr_batch(self, images):
+        """Runs PaddleOCR on several images in a single predict call."""
         # --- PaddleOCR Detection ---
-        print("Running PaddleOCR inference using predict()...")
-        ocr_results = []
+        print(f"Running PaddleOCR inference using predict() on {len(images)} image(s)...")
+        start_time = time.perf_counter()
+        ocr_batch = [[] for _ in images]
         try:
-            raw_ocr_results = self.ocr_model.predict(image_cv)
+            raw_ocr_results = self.ocr_model.predict(list(images), **self._ocr_predict_kwargs)
             if raw_ocr_results:
-                result_obj = raw_ocr_results[0]
-                if result_obj and 'rec_polys' in result_obj and 'rec_texts' in result_obj and 'rec_scores' in result_obj:
-                    polys = result_obj['rec_polys']
-                    texts = result_obj['rec_texts']
-                    scores = result_obj['rec_scores']
-
-                    print(f"Processing OCR results from predict(). Found {len(polys)} text detections.")
-
-                    if len(polys) == len(texts) == len(scores):
-                         for i in range(len(polys)):
-                            bbox_points = polys[i]
-                            text = texts[i]
-                            confidence = scores[i]
-
-                            if text and text.strip():
-                                 if (isinstance(bbox_points, list) or isinstance(bbox_points, np.ndarray)) and len(bbox_points) == 4 and all(isinstance(p, (list, tuple, np.ndarray)) and len(p) == 2 for p in bbox_points):
-                                      if isinstance(bbox_points, np.ndarray):
-                                           bbox_points = bbox_points.tolist()
-
-                                      x_coords = [p[0] for p in bbox_points]
-                                      y_coords = [p[1] for p in bbox_points]
-                                      x1_ocr, y1_ocr, x2_ocr, y2_ocr = min(x_coords), min(y_coords), max(x_coords), max(y_coords)
-
-                                      ocr_results.append({
-                                          'text': text.strip(),
-                                          'bbox': [int(x1_ocr), int(y1_ocr), int(x2_ocr), int(y2_ocr)],
-                                          'confidence': float(confidence)
-                                      })
-                                 else:
-                                      print(f"Warning: Skipping detection at index {i} due to unexpected bbox_points format or size: {bbox_points}")
-                    else:
-                         print(f"Warning: Mismatch in lengths of polys ({len(polys)}), texts ({len(texts)}), and scores ({len(scores)}).")
-                else:
-                    print("Warning: Raw OCR predict results object does not contain expected keys.")
+                for i, result_obj in enumerate(raw_ocr_results):
+                    ocr_batch[i] = self._parse_ocr_result(result_obj)
             else:
                 print("No raw OCR predict results returned.")
 
-            print(f"Total valid OCR text blocks (after filtering and parsing from predict output): {len(ocr_results)}")
+            print(f"Total valid OCR text blocks (after filtering and parsing from predict output): {sum(len(r) for r in ocr_batch)} ({time.perf_counter() - start_time:.2f}s)")
 
         except Exception as e:
             print(f"Error running PaddleOCR predict(): {e}")
             # Continue with empty OCR results if inference fails
             pass
 
-        return yolo_results, ocr_results
-
-    def associate_results(self, yolo_results, ocr_results):
-        """Associates OCR results with YOLO elements and generates the final structured data."""
+        return ocr_batch
+
+    def run_crop_ocr(self, image_cv, yolo_results):
+        """Runs PaddleOCR only inside the (padded) YOLO element boxes of one image."""
+        return self.run_crop_ocr_batch([image_cv], [yolo_results])[0]
+
+    def run_crop_ocr_batch(self, images, yolo_batch):
+        """Crops the padded element boxes of every image, OCRs all crops in one predict call and
+        maps the text boxes back to page coordinates. Output has the same schema as run_ocr_batch."""
+        crops = []
+        crop_owners = [] # (image index, x offset, y offset) for each crop
+        for image_index, (image_cv, yolo_results) in enumerate(zip(images, yolo_batch)):
+            height, width = image_cv.shape[:2]
+            for element in yolo_results or []:
+                x1, y1, x2, y2 = element['bbox']
+                crop_x1 = max(0, int(x1) - self.crop_padding)
+                crop_y1 = max(0, int(y1) - self.crop_padding)
+                crop_x2 = min(width, int(np.ceil(x2)) + self.crop_padding)
+                crop_y2 = min(height, int(np.ceil(y2)) + self.crop_padding)
+                if crop_x2 - crop_x1 < 4 or crop_y2 - crop_y1 < 4:
+                    continue
+                crops.append(np.ascontiguousarray(image_cv[crop_y1:crop_y2, crop_x1:crop_x2]))
+                crop_owners.append((image_index, crop_x1, crop_y1))
+
+        ocr_batch = [[] for _ in images]
+        if not crops:
+            return ocr_batch
+
+        print(f"Running crop-guided OCR on {len(crops)} element crops...")
+        for (image_index, offset_x, offset_y), crop_results in zip(crop_owners, self.run_ocr_batch(crops)):
+            page_results = ocr_batch[image_index]
+            for ocr_res in crop_results:
+                x1, y1, x2, y2 = ocr_res['bbox']
+                ocr_res['bbox'] = [x1 + offset_x, y1 + offset_y, x2 + offset_x, y2 + offset_y]
+                # Nested or overlapping elements can read the same line twice; keep the first copy
+                if any(existing['text'] == ocr_res['text'] and box_geometry.iou(existing['bbox'], ocr_res['bbox']) > 0.5
+                       for existing in page_results):
+                    continue
+                page_results.append(ocr_res)
+        return ocr_batch
+
+    def _parse_ocr_result(self, result_obj):
+        """Converts one PaddleOCR predict() result into text block dicts with axis-aligned bboxes."""
+        ocr_results = []
+        if result_obj and 'rec_polys' in result_obj and 'rec_texts' in result_obj and 'rec_scores' in result_obj:
+            polys = result_obj['rec_polys']
+            texts = result_obj['rec_texts']
+            scores = result_obj['rec_scores']
+
+            print(f"Processing OCR results from predict(). Found {len(polys)} text detections.")
+
+            if len(polys) == len(texts) == len(scores):
+                 for i in range(len(polys)):
+                    bbox_points = polys[i]
+                    text = texts[i]
+                    confidence = scores[i]
+
+                    if text and text.strip():
+                         if (isinstance(bbox_points, list) or isinstance(bbox_points, np.ndarray)) and len(bbox_points) == 4 and all(isinstance(p, (list, tuple, np.ndarray)) and len(p) == 2 for p in bbox_points):
+                              if isinstance(bbox_points, np.ndarray):
+                                   bbox_points = bbox_points.tolist()
+
+                              x_coords = [p[0] for p in bbox_points]
+                              y_coords = [p[1] for p in bbox_points]
+                              x1_ocr, y1_ocr, x2_ocr, y2_ocr = min(x_coords), min(y_coords), max(x_coords), max(y_coords)
+
+                              ocr_results.append({
+                                  'text': text.strip(),
+                                  'bbox': [int(x1_ocr), int(y1_ocr), int(x2_ocr), int(y2_ocr)],
+                                  'confidence': float(confidence)
+                              })
+                         else:
+                              print(f"Warning: Skipping detection at index {i} due to unexpected bbox_points format or size: {bbox_points}")
+            else:
+                 print(f"Warning: Mismatch in lengths of polys ({len(polys)}), texts ({len(texts)}), and scores ({len(scores)}).")
+        else:
+            print("Warning: Raw OCR predict results object does not contain expected keys.")
+        return ocr_results
+
+    def close(self):
+        """Shuts down the helper thread used for concurrent stages."""
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+    def associate_results(self, yolo_results, ocr_results, engine=None, compact=False):
+        """Associates OCR results with YOLO elements and generates the final structured data.
+
+        engine selects the matcher ('grid' or 'numpy', default self.association_engine);
+        both apply the same containment-first, IoU > 0.3 rule and give identical output.
+        With compact=True the result is a CompactAnalysis (same items, stored as arrays); results
+        outside the standard schema (e.g. float OCR boxes) still come back as a list of dicts.
+        """
         if yolo_results is None and ocr_results is None:
-             return []
-
-        json_output_elements = json.loads(json.dumps(yolo_results)) if yolo_results else [] # Simple deep copy
-        ocr_results_copy = json.loads(json.dumps(ocr_results)) if ocr_results else [] # Simple deep copy for processing
+             return CompactAnalysis.empty() if compact else []
+        engine = engine or self.association_engine
+        if compact and _compact_compatible(yolo_results or [], ocr_results or []):
+             return self._associate_compact(yolo_results or [], ocr_results or [], engine)
 
+        # Per-item copies are enough here: only top-level keys and the associated_text lists are modified
+        json_output_elements = [dict(element, bbox=list(element['bbox']), associated_text=list(element.get('associated_text', [])))
+                                for element in yolo_results or []]
 
         associated_ocr_indices = set()
 
-        # Sort YOLO elements and OCR results spatially for more consistent processing order
+        # Sort YOLO elements and OCR results spatially for more consistent processing order.
+        # OCR items are sorted by position index so each one still knows its place in ocr_results.
         json_output_elements.sort(key=lambda x: (x['bbox'][1], x['bbox'][0]))
-        ocr_results_copy.sort(key=lambda x: (x['bbox'][1], x['bbox'][0]))
+        ocr_order = sorted(range(len(ocr_results or [])), key=lambda k: (ocr_results[k]['bbox'][1], ocr_results[k]['bbox'][0]))
+        ocr_results_copy = [dict(ocr_results[k], bbox=list(ocr_results[k]['bbox'])) for k in ocr_order]
 
         # Add index to YOLO elements
         for idx, element in enumerate(json_output_elements):
             element['index'] = idx
 
-        for i, ocr_res in enumerate(ocr_results_copy):
-            ocr_bbox_rect = QRectF(*ocr_res['bbox'])
-
-            best_match_element_index = -1
-            best_iou = 0.0
-            contained_in_element_index = -1 # To store the index of element that fully contains this text
-
-            for elem_index, element in enumerate(json_output_elements):
-                element_bbox_rect = QRectF(*element['bbox'])
-
-                # Check for full containment of the OCR bbox within the element bbox
-                if element_bbox_rect.contains(ocr_bbox_rect):
-                     contained_in_element_index = elem_index
-                     break # Prioritize containment, stop searching for this OCR
-
-                # If not contained, calculate IoU for overlap check
-                intersection_rect = element_bbox_rect.intersected(ocr_bbox_rect)
-                if not intersection_rect.isEmpty():
-                     intersection_area = intersection_rect.width() * intersection_rect.height()
-                     ocr_area = ocr_bbox_rect.width() * ocr_bbox_rect.height()
-                     element_area = element_bbox_rect.width() * element_bbox_rect.height()
-
-                     # Calculate IoU
-                     union_area = ocr_area + element_area - intersection_area
-                     iou = intersection_area / union_area if union_area > 0 else 0
-
-                     iou_threshold = 0.3 # Adjusted IoU threshold slightly
-                     if contained_in_element_index == -1 and iou > iou_threshold and iou > best_iou:
-                          best_iou = iou
-                          best_match_element_index = elem_index
-
-            associated_element_index = contained_in_element_index if contained_in_element_index != -1 else best_match_element_index
+        element_bboxes = [element['bbox'] for element in json_output_elements]
+        ocr_bboxes = [ocr_res['bbox'] for ocr_res in ocr_results_copy]
+        if engine == 'numpy':
+            assignments = _match_numpy(element_bboxes, ocr_bboxes)
+        else:
+            assignments = _match_grid(element_bboxes, ocr_bboxes)
 
+        for position, associated_element_index in enumerate(assignments):
             if associated_element_index != -1:
-                json_output_elements[associated_element_index]['associated_text'].append(ocr_res)
-                # Find the index in the original ocr_results list
-                try:
-                    original_ocr_index = ocr_results.index(next(item for item in ocr_results if item['bbox'] == ocr_res['bbox'] and item['text'] == ocr_res['text']))
-                    associated_ocr_indices.add(original_ocr_index)
-                except (ValueError, StopIteration):
-                    print(f"Warning: Could not find original index for OCR result: {ocr_res}")
+                json_output_elements[associated_element_index]['associated_text'].append(ocr_results_copy[position])
+                associated_ocr_indices.add(ocr_order[position])
 
 
         final_json_output_data = []
@@ -214,4 +782,79 @@ class AnalysisCore:
 
         print(f"Total items in final JSON data: {len(final_json_output_data)}")
 
-        return final_json_output_data
\ No newline at end of file
+        return final_json_output_data
+
+    def _associate_compact(self, yolo_results, ocr_results, engine):
+        """associate_results on arrays: same matching, same ordering, no per-item dict copies."""
+        element_boxes = box_geometry.as_array([element['bbox'] for element in yolo_results])
+        ocr_boxes = box_geometry.as_array([ocr_res['bbox'] for ocr_res in ocr_results])
+
+        # np.lexsort is stable, so ties keep list order exactly like sort(key=(y, x))
+        element_order = np.lexsort((element_boxes[:, 0], element_boxes[:, 1]))
+        ocr_order = np.lexsort((ocr_boxes[:, 0], ocr_boxes[:, 1]))
+        sorted_element_boxes = element_boxes[element_order].tolist()
+        sorted_ocr_boxes = ocr_boxes[ocr_order].tolist()
+        if engine == 'numpy':
+            assignments = np.asarray(_match_numpy(sorted_element_boxes, sorted_ocr_boxes), dtype=np.int64)
+        else:
+            assignments = np.asarray(_match_grid(sorted_element_boxes, sorted_ocr_boxes), dtype=np.int64)
+
+        # Associated OCR positions grouped by element, ascending within each group (the append order)
+        associated_positions = np.flatnonzero(assignments != -1)
+        groups = assignments[associated_positions]
+        associated_positions = associated_positions[np.argsort(groups, kind='stable')]
+        group_starts = np.concatenate(([0], np.cumsum(np.bincount(groups, minlength=len(yolo_results)))))
+
+        # Unassociated OCR blocks become standalone text items, sorted by position
+        standalone = np.setdiff1d(np.arange(len(ocr_results)), ocr_order[associated_positions])
+        standalone = standalone[np.lexsort((ocr_boxes[standalone, 0], ocr_boxes[standalone, 1]))]
+
+        # Rows are sorted elements then sorted standalone text; final order puts non-text types first
+        types = []
+        type_lookup = {}
+        def type_id(type_name):
+            if type_name not in type_lookup:
+                type_lookup[type_name] = len(types)
+                types.append(type_name)
+            return type_lookup[type_name]
+
+        element_types = [yolo_results[k]['type'] for k in element_order]
+        row_boxes = np.concatenate((element_boxes[element_order], ocr_boxes[standalone]))
+        row_type_ids = np.array([type_id(type_name) for type_name in element_types] + [type_id('text')] * len(standalone),
+                                dtype=np.int32)
+        row_type_order = np.array([0 if type_name != 'text' else 1 for type_name in element_types] + [1] * len(standalone))
+        final_order = np.lexsort((row_boxes[:, 0], row_boxes[:, 1], row_type_order))
+
+        element_count = len(element_order)
+        confidences = np.array([yolo_results[k]['confidence'] for k in element_order]
+                               + [ocr_results[k]['confidence'] for k in standalone], dtype=np.float64)
+        texts = [None] * element_count + [ocr_results[k]['text'] for k in standalone]
+        extra_keys = []
+        for element in yolo_results:
+            extra_keys.extend(key for key in element if key not in ELEMENT_KEYS and key != 'index' and key not in extra_keys)
+
+        final_texts = []
+        offsets = [0]
+        associated = []
+        extras = {key: [] for key in extra_keys}
+        for row in final_order.tolist():
+            final_texts.append(texts[row])
+            if row < element_count:
+                positions = associated_positions[group_starts[row]:group_starts[row + 1]]
+                associated.append(ocr_order[positions])
+                offsets.append(offsets[-1] + len(positions))
+                element = yolo_results[element_order[row]]
+            else:
+                offsets.append(offsets[-1])
+                element = {}
+            for key in extra_keys:
+                extras[key].append(element.get(key, _MISSING))
+
+        associated = np.concatenate(associated) if associated else np.zeros(0, dtype=np.int64)
+        result = CompactAnalysis(types, row_type_ids[final_order], row_boxes[final_order], confidences[final_order],
+                                 final_texts, np.asarray(offsets, dtype=np.int64),
+                                 [ocr_results[k]['text'] for k in associated],
+                                 ocr_boxes[associated].astype(np.int32).reshape(-1, 4),
+                                 np.array([ocr_results[k]['confidence'] for k in associated], dtype=np.float64), extras)
+        print(f"Total items in final JSON data: {len(result)}")
+        return result
\ No newline at end of file
@@ -0,0 +1,278 @@
+import argparse
+import glob
+import multiprocessing
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+
+from analysis_config import load_analysis_config, memory_budget_bytes
+from data_manager import DataManager, compute_image_hash, image_fingerprint, make_cache_key, output_names
+from jsonl_sink import JsonlWriter
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp', '.gif')
+
+# Per-process state, created once by _init_worker and reused for every image
+_worker_core = None
+_worker_data_manager = None
+_worker_signature = None
+_worker_incremental = False
+_worker_near_duplicate_distance = None
+_worker_return_records = False
+# Output file names for images whose file name is shared with another input (see output_names)
+_worker_output_names = {}
+
+
+def collect_image_paths(inputs):
+    """Expands directories, glob patterns and file paths into a sorted list of image files."""
+    image_paths = set()
+    for entry in inputs:
+        if os.path.isdir(entry):
+            for root, _, files in os.walk(entry):
+                for name in files:
+                    if name.lower().endswith(IMAGE_EXTENSIONS):
+                        image_paths.add(os.path.abspath(os.path.join(root, name)))
+        elif os.path.isfile(entry):
+            image_paths.add(os.path.abspath(entry))
+        else:
+            matches = glob.glob(entry, recursive=True)
+            if not matches:
+                print(f"Warning: No files match {entry}")
+            for match in matches:
+                if os.path.isfile(match) and match.lower().endswith(IMAGE_EXTENSIONS):
+                    image_paths.add(os.path.abspath(match))
+    return sorted(image_paths)
+
+
+def _init_worker(analysis_config, output_dir, threads_per_worker, incremental=False, return_records=False,
+                 renamed_outputs=None):
+    """Loads the models once per worker process."""
+    global _worker_core, _worker_data_manager, _worker_signature, _worker_incremental, _worker_near_duplicate_distance
+    global _worker_return_records, _worker_output_names
+    _worker_incremental = incremental
+    _worker_return_records = return_records
+    _worker_output_names = renamed_outputs or {}
+    _worker_near_duplicate_distance = analysis_config['near_duplicate_distance']
+    start_time = time.perf_counter()
+
+    # Thread limits must be set before torch/paddle are imported in this process
+    if threads_per_worker:
+        for var in ('OMP_NUM_THREADS', 'MKL_NUM_THREADS', 'OPENBLAS_NUM_THREADS'):
+            os.environ[var] = str(threads_per_worker)
+        cv2.setNumThreads(threads_per_worker)
+
+    from analysis_core import AnalysisCore
+    # The pool already keeps every core busy, so stages run sequentially inside a worker.
+    # Warm-up is skipped: over a whole corpus the first slow image doesn't matter.
+    _worker_core = AnalysisCore.from_config(analysis_config, concurrent=False,
+                                            yolo_threads=threads_per_worker, ocr_threads=threads_per_worker,
+                                            warmup_size=None)
+    _worker_data_manager = DataManager(output_dir=output_dir, store_backend=analysis_config['result_store'],
+                                       memory_budget_bytes=memory_budget_bytes(analysis_config))
+    if _worker_core.yolo_model is not None and _worker_core.ocr_model is not None:
+        _worker_signature = _worker_core.cache_signature()
+    print(f"Worker {os.getpid()} ready in {time.perf_counter() - start_time:.1f}s")
+
+
+def _model_version(signature):
+    """The parts of the analysis signature that identify the models, for JSONL records."""
+    return {
+        'analysis_version': signature['version'],
+        'detector_backend': signature['detector_backend'],
+        'detector_digest': (signature['detector_digest'] or '')[:16],
+        'paddleocr_version': signature['paddleocr_version'],
+    }
+
+
+def _finish_image(image_path, image_hash, analysis_data, seconds, source):
+    """Writes an image's result and returns its outcome tuple.
+
+    With JSONL output the record goes back to the parent process, which owns the single
+    writer, instead of into an <image>_output.json file.
+    """
+    record = None
+    if _worker_return_records:
+        record = {
+            'image_path': image_path,
+            'image_hash': image_hash,
+            'source': source, # 'analysis', 'cache' or 'near_duplicate'
+            'seconds': round(seconds, 4),
+            'model': _model_version(_worker_signature),
+            'analysis_data': analysis_data,
+        }
+    else:
+        _worker_data_manager.save_analysis(image_path, analysis_data, _worker_output_names.get(image_path))
+    return (image_path, len(analysis_data), seconds, None, record)
+
+
+def _process_batch(image_paths):
+    """Analyzes a batch of images in a worker.
+    Returns (image_path, item_count, seconds, error, jsonl_record or None) per image."""
+    start_time = time.perf_counter()
+    if _worker_core.yolo_model is None or _worker_core.ocr_model is None:
+        return [(image_path, 0, 0.0, "models failed to load", None) for image_path in image_paths]
+
+    outcomes = []
+    loaded_paths = []
+    images = []
+    image_hashes = []
+    fingerprints = []
+    for image_path in image_paths:
+        try:
+            with open(image_path, 'rb') as f:
+                image_bytes = f.read()
+        except OSError as e:
+            outcomes.append((image_path, 0, 0.0, str(e), None))
+            continue
+        image_hash = compute_image_hash(image_bytes)
+        cache_key = make_cache_key(image_hash, _worker_signature)
+        cached_data = _worker_data_manager.get_cached_analysis(image_path, cache_key)
+        if cached_data:
+            # Same pixels, same models: reuse the stored result, but still write this path's output
+            outcomes.append(_finish_image(image_path, image_hash, cached_data['analysis_data'], 0.0, 'cache'))
+            continue
+
+        image_cv = cv2.imdecode(np.frombuffer(image_bytes, dtype=np.uint8), cv2.IMREAD_COLOR)
+        if image_cv is None:
+            outcomes.append((image_path, 0, 0.0, "cannot load image file using OpenCV", None))
+            continue
+        fingerprint = image_fingerprint(image_cv, _worker_signature)
+        if _worker_near_duplicate_distance is not None:
+            # Re-encoded or resized copy of an analyzed screenshot: reuse its rescaled result.
+            # Only this worker's and earlier runs' results are visible to the lookup.
+            cached_data = _worker_data_manager.find_near_duplicate(fingerprint, _worker_near_duplicate_distance)
+            if cached_data:
+                if not _worker_data_manager.store_analysis(cache_key, image_path, cached_data['analysis_data'],
+                                                           cached_data['yolo_results'], cached_data['ocr_results'], image_hash):
+                    outcomes.append((image_path, 0, 0.0, "could not write the result store", None))
+                    continue
+                outcomes.append(_finish_image(image_path, image_hash, cached_data['analysis_data'], 0.0, 'near_duplicate'))
+                continue
+        loaded_paths.append(image_path)
+        images.append(image_cv)
+        image_hashes.append(image_hash)
+        fingerprints.append(fingerprint)
+    if not images:
+        return outcomes
+
+    try:
+        if _worker_incremental:
+            # Consecutive screenshots of one application: only the changed regions are re-analyzed
+            batch_results = []
+            for image_cv in images:
+                if batch_results:
+                    yolo_results, ocr_results, _ = _worker_core.run_incremental(previous_image, *batch_results[-1], image_cv)
+                else:
+                    yolo_results, ocr_results = _worker_core.run_analysis(image_cv)
+                batch_results.append((yolo_results, ocr_results))
+                previous_image = image_cv
+        else:
+            batch_results = _worker_core.run_analysis_batch(images, batch_size=len(images))
+    except Exception as e:
+        return outcomes + [(image_path, 0, 0.0, str(e), None) for image_path in loaded_paths]
+    # Inference is shared by the whole batch, so report the per-image average
+    seconds = (time.perf_counter() - start_time) / len(images)
+
+    store_entries = []
+    for image_path, image_hash, fingerprint, (yolo_results, ocr_results) in zip(loaded_paths, image_hashes, fingerprints, batch_results):
+        try:
+            analysis_data = _worker_core.associate_results(yolo_results, ocr_results)
+            store_entries.append((make_cache_key(image_hash, _worker_signature), image_path,
+                                  analysis_data, yolo_results, ocr_results, image_hash, fingerprint))
+            outcomes.append(_finish_image(image_path, image_hash, analysis_data, seconds, 'analysis'))
+        except Exception as e:
+            outcomes.append((image_path, 0, seconds, str(e), None))
+    # One bulk write per batch keeps store transactions (and lock waits between workers) few
+    failed_keys = _worker_data_manager.store_analyses(store_entries)
+    if failed_keys:
+        failed_paths = {entry[1] for entry in store_entries if entry[0] in failed_keys}
+        # The JSONL record (if any) is still written; the image is reported as failed
+        outcomes = [(outcome[0], outcome[1], outcome[2], "could not write the result store", outcome[4])
+                    if outcome[0] in failed_paths and not outcome[3] else outcome for outcome in outcomes]
+    return outcomes
+
+
+def main(argv=None):
+    base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    cpu_count = os.cpu_count() or 1
+
+    parser = argparse.ArgumentParser(description="Analyze UI screenshots headlessly with YOLO and PaddleOCR.")
+    parser.add_argument('inputs', nargs='+', help="Image files, directories or glob patterns (quote globs).")
+    parser.add_argument('-o', '--output-dir', default=os.path.join(base_dir, 'output'),
+                        help="Directory for the <image>_output.json files.")
+    parser.add_argument('-w', '--workers', type=int, default=max(1, cpu_count // 4),
+                        help="Number of worker processes, each holding its own models.")
+    parser.add_argument('-t', '--threads-per-worker', type=int, default=None,
+                        help="CPU threads per worker (default: cores / workers).")
+    parser.add_argument('-b', '--batch-size', type=int, default=4,
+                        help="Images sent through the models together in one predict call.")
+    parser.add_argument('--jsonl', default=None,
+                        help="Append one JSON record per image to this JSON Lines file instead of writing "
+                             "<image>_output.json files. A .gz or .zst extension compresses it.")
+    parser.add_argument('--incremental', action='store_true',
+                        help="Treat the sorted inputs as a screen recording: each image in a batch only re-analyzes "
+                             "the regions that changed since the previous one. Use a larger --batch-size.")
+    args = parser.parse_args(argv)
+    if args.batch_size < 1:
+        parser.error("--batch-size must be >= 1")
+
+    image_paths = collect_image_paths(args.inputs)
+    if not image_paths:
+        print("No images found.")
+        return 1
+
+    workers = max(1, min(args.workers, len(image_paths)))
+    threads_per_worker = args.threads_per_worker or max(1, cpu_count // workers)
+    analysis_config = load_analysis_config(base_dir)
+    # Export and hash the detector once here; the workers then load the cached artifact and
+    # digest instead of all exporting and re-reading the model files at the same time
+    from detector_backends import detector_digest, export_detector
+    try:
+        if analysis_config['detector_backend'] in ('onnx', 'openvino'):
+            export_detector(analysis_config['yolo_model_path'], analysis_config['detector_backend'])
+        detector_digest(analysis_config['yolo_model_path'], analysis_config['detector_backend'])
+    except Exception as e:
+        print(f"Error preparing the {analysis_config['detector_backend']} detector: {e}")
+    # Images from different directories may share a file name; only those get other output names
+    renamed_outputs = {image_path: name for image_path, name in output_names(image_paths).items()
+                       if name != os.path.splitext(os.path.basename(image_path))[0]}
+    # Create the output directory (and database schema) once here so workers don't race on it
+    DataManager(output_dir=args.output_dir, store_backend=analysis_config['result_store']).close()
+
+    print(f"Analyzing {len(image_paths)} images with {workers} workers x {threads_per_worker} threads")
+    start_time = time.perf_counter()
+    failures = []
+
+    # 'spawn' keeps workers independent of the parent's state and matches Windows behaviour
+    context = multiprocessing.get_context('spawn')
+    jsonl_writer = JsonlWriter(args.jsonl) if args.jsonl else None
+    with context.Pool(processes=workers, initializer=_init_worker,
+                      initargs=(analysis_config, args.output_dir, threads_per_worker, args.incremental,
+                                bool(args.jsonl), renamed_outputs)) as pool:
+        batches = [image_paths[i:i + args.batch_size] for i in range(0, len(image_paths), args.batch_size)]
+        done = 0
+        for outcomes in pool.imap_unordered(_process_batch, batches):
+            for image_path, item_count, seconds, error, record in outcomes:
+                done += 1
+                if record is not None:
+                    jsonl_writer.write(record)
+                if error:
+                    failures.append((image_path, error))
+                    print(f"[{done}/{len(image_paths)}] FAILED {image_path}: {error}")
+                else:
+                    print(f"[{done}/{len(image_paths)}] {image_path}: {item_count} items in {seconds:.2f}s")
+
+    if jsonl_writer is not None:
+        jsonl_writer.close()
+        print(f"{jsonl_writer.records_written} records written to {args.jsonl}")
+
+    elapsed = time.perf_counter() - start_time
+    print(f"Processed {len(image_paths) - len(failures)}/{len(image_paths)} images in {elapsed:.1f}s "
+          f"({len(image_paths) / elapsed:.2f} images/s)")
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,266 @@
+import argparse
+import json
+import os
+import struct
+import sys
+from collections.abc import Sequence
+
+import numpy as np
+
+from compact_results import _MISSING, OCR_KEYS, TEXT_ITEM_KEYS, CompactAnalysis, json_default
+
+# File layout: MAGIC, format version (uint32), header length (uint64), JSON header, then the
+# column arrays as raw little-endian data, each starting on an ALIGNMENT-byte boundary.
+# The header gives every array's dtype, shape and offset, so a reader maps the file once and
+# views the columns in place; nothing is parsed except the (small) header.
+MAGIC = b'UIAB'
+FORMAT_VERSION = 1
+ALIGNMENT = 64
+_PREAMBLE = struct.Struct('<4sIQ')
+
+# Numeric columns of a CompactAnalysis; strings are stored packed (see _pack_strings)
+_ARRAY_COLUMNS = ('type_ids', 'bboxes', 'confidences', 'text_offsets', 'ocr_bboxes', 'ocr_confidences')
+
+
+class StringColumn(Sequence):
+    """Read-only sequence of strings packed into one UTF-8 byte array plus end offsets.
+
+    Strings are decoded on access, so a memory-mapped column costs nothing until it is read.
+    Rows whose present flag is 0 are None (elements have no text of their own).
+    """
+
+    def __init__(self, blob, offsets, present=None):
+        self.blob = blob
+        self.offsets = offsets
+        self.present = present
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('StringColumn index out of range')
+        if self.present is not None and not self.present[index]:
+            return None
+        return self.blob[self.offsets[index]:self.offsets[index + 1]].tobytes().decode('utf-8')
+
+    @property
+    def nbytes(self):
+        return self.blob.nbytes + self.offsets.nbytes + (self.present.nbytes if self.present is not None else 0)
+
+
+def _pack_strings(strings, with_present):
+    encoded = [text.encode('utf-8') if text is not None else b'' for text in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(text) for text in encoded])
+    arrays = {'blob': np.frombuffer(b''.join(encoded), dtype=np.uint8), 'offsets': offsets}
+    if with_present:
+        arrays['present'] = np.array([text is not None for text in strings], dtype=np.uint8)
+    return arrays
+
+
+def _section_arrays(result):
+    """The arrays and header metadata that describe one CompactAnalysis."""
+    arrays = {column: np.ascontiguousarray(getattr(result, column)) for column in _ARRAY_COLUMNS}
+    for prefix, strings, with_present in (('texts', result.texts, True), ('ocr_texts', result.ocr_texts, False)):
+        for name, array in _pack_strings(strings, with_present).items():
+            arrays[f'{prefix}_{name}'] = array
+    meta = {
+        'types': list(result.types),
+        'int_text_boxes': bool(result.int_text_boxes),
+        # Extra element keys (e.g. track_id) are sparse and small: kept in the header as [row, value] pairs
+        'extras': {key: [[row, value] for row, value in enumerate(values) if value is not _MISSING]
+                   for key, values in result.extras.items()}
+    }
+    return arrays, meta
+
+
+def write_binary(path, sections):
+    """Writes named CompactAnalysis sections (e.g. {'analysis': ..., 'yolo': ...}) to one file.
+    The file is written to a temporary name first and moved into place."""
+    header = {'sections': {}}
+    blocks = []
+    offset = 0
+    for name, result in sections.items():
+        arrays, meta = _section_arrays(result)
+        meta['arrays'] = {}
+        for column, array in arrays.items():
+            array = array.astype(array.dtype.newbyteorder('<'), copy=False)
+            meta['arrays'][column] = {'dtype': array.dtype.str, 'shape': list(array.shape), 'offset': offset}
+            blocks.append((offset, array))
+            offset += -(-array.nbytes // ALIGNMENT) * ALIGNMENT
+        header['sections'][name] = meta
+
+    header_bytes = json.dumps(header, separators=(',', ':'), default=json_default).encode('utf-8')
+    data_start = -(-(_PREAMBLE.size + len(header_bytes)) // ALIGNMENT) * ALIGNMENT
+    temp_path = f'{path}.{os.getpid()}.tmp'
+    try:
+        with open(temp_path, 'wb') as f:
+            f.write(_PREAMBLE.pack(MAGIC, FORMAT_VERSION, data_start - _PREAMBLE.size))
+            f.write(header_bytes.ljust(data_start - _PREAMBLE.size, b' '))
+            for block_offset, array in blocks:
+                f.seek(data_start + block_offset)
+                f.write(array.tobytes())
+            f.truncate(data_start + offset)
+        os.replace(temp_path, path)
+    except Exception:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+def _read_header(path):
+    with open(path, 'rb') as f:
+        magic, version, header_length = _PREAMBLE.unpack(f.read(_PREAMBLE.size))
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a binary analysis file")
+        if version != FORMAT_VERSION:
+            raise ValueError(f"{path} has unsupported format version {version}")
+        header = json.loads(f.read(header_length))
+    return header, _PREAMBLE.size + header_length
+
+
+def _column_reader(path, data_start):
+    """Returns a function mapping a header array entry to a read-only view of the memory-mapped file."""
+    mapped = np.memmap(path, dtype=np.uint8, mode='r')
+
+    def read(entry):
+        dtype = np.dtype(entry['dtype'])
+        count = int(np.prod(entry['shape'], dtype=np.int64))
+        start = data_start + entry['offset']
+        return mapped[start:start + count * dtype.itemsize].view(dtype).reshape(entry['shape'])
+    return read
+
+
+def read_binary(path, sections=None):
+    """Loads sections of a file written by write_binary as CompactAnalysis objects whose columns
+    are memory-mapped views (like np.load(..., mmap_mode='r')): pages are read on first access."""
+    header, data_start = _read_header(path)
+    read = _column_reader(path, data_start)
+    results = {}
+    for name, meta in header['sections'].items():
+        if sections is not None and name not in sections:
+            continue
+        arrays = {column: read(entry) for column, entry in meta['arrays'].items()}
+        rows = len(arrays['type_ids'])
+        extras = {}
+        for key, pairs in meta['extras'].items():
+            values = [_MISSING] * rows
+            for row, value in pairs:
+                values[row] = value
+            extras[key] = values
+        results[name] = CompactAnalysis(
+            meta['types'], arrays['type_ids'], arrays['bboxes'], arrays['confidences'],
+            StringColumn(arrays['texts_blob'], arrays['texts_offsets'], arrays['texts_present']),
+            arrays['text_offsets'],
+            StringColumn(arrays['ocr_texts_blob'], arrays['ocr_texts_offsets']),
+            arrays['ocr_bboxes'], arrays['ocr_confidences'], extras, meta['int_text_boxes'])
+    return results
+
+
+def _check_representable(items):
+    """Raises ValueError for item dicts the columnar layout would not reproduce exactly."""
+    for item in items:
+        if 'text' in item:
+            if not set(item) <= set(TEXT_ITEM_KEYS + ('index',)):
+                raise ValueError(f"Unsupported keys in text item: {sorted(item)}")
+        elif any(set(ocr_res) != set(OCR_KEYS) for ocr_res in item.get('associated_text', [])):
+            raise ValueError("Unsupported keys in associated text")
+
+
+def save_analysis_binary(path, analysis_data, yolo_results=None, ocr_results=None):
+    """Writes analysis data (CompactAnalysis or list of item dicts) and optionally the raw
+    YOLO/OCR results to a binary analysis file. Raises ValueError for results outside the
+    standard schema; keep those as JSON."""
+    if not isinstance(analysis_data, CompactAnalysis):
+        _check_representable(analysis_data)
+    _check_representable(yolo_results or [])
+    if any(set(ocr_res) != set(OCR_KEYS) for ocr_res in ocr_results or []):
+        raise ValueError("Unsupported keys in OCR results")
+    sections = {'analysis': analysis_data if isinstance(analysis_data, CompactAnalysis)
+                else CompactAnalysis.from_items(analysis_data)}
+    if yolo_results is not None:
+        sections['yolo'] = CompactAnalysis.from_items(yolo_results)
+    if ocr_results is not None:
+        # Raw OCR blocks are stored as standalone text rows
+        sections['ocr'] = CompactAnalysis.from_items(
+            [{'type': 'text', 'confidence': ocr_res['confidence'], 'bbox': ocr_res['bbox'], 'text': ocr_res['text']}
+             for ocr_res in ocr_results])
+    write_binary(path, sections)
+
+
+def load_analysis_binary(path):
+    """Loads a file written by save_analysis_binary. Returns (analysis_data, yolo_results, ocr_results):
+    analysis_data stays memory-mapped; the raw results (None if not stored) are rebuilt as plain
+    dicts in their original schema, since they get copied and modified downstream."""
+    sections = read_binary(path)
+    yolo_results = ocr_results = None
+    if 'yolo' in sections:
+        yolo_results = [{key: value for key, value in item.to_dict().items() if key != 'index'}
+                        for item in sections['yolo']]
+    if 'ocr' in sections:
+        ocr_results = [{'text': item['text'], 'bbox': item['bbox'], 'confidence': item['confidence']}
+                       for item in sections['ocr']]
+    return sections['analysis'], yolo_results, ocr_results
+
+
+def scan_statistics(directory, recursive=False):
+    """Element statistics over every .abin file in a directory. Only the headers and a few
+    numeric columns are touched; no text is decoded and no JSON result is parsed."""
+    stats = {'files': 0, 'unreadable': 0, 'items': 0, 'elements': 0, 'texts': 0, 'associated_texts': 0,
+             'confidence_sum': 0.0, 'type_counts': {}}
+    for root, dirs, files in os.walk(directory):
+        if not recursive:
+            dirs[:] = []
+        for name in sorted(files):
+            if not name.endswith('.abin'):
+                continue
+            path = os.path.join(root, name)
+            try:
+                header, data_start = _read_header(path)
+                meta = header['sections']['analysis']
+                read = _column_reader(path, data_start)
+                type_ids = read(meta['arrays']['type_ids'])
+                present = read(meta['arrays']['texts_present'])
+                text_offsets = read(meta['arrays']['text_offsets'])
+                confidences = read(meta['arrays']['confidences'])
+            except Exception as e:
+                print(f"Error reading binary analysis {path}: {e}")
+                stats['unreadable'] += 1
+                continue
+            stats['files'] += 1
+            stats['items'] += len(type_ids)
+            text_rows = int(np.count_nonzero(present))
+            stats['texts'] += text_rows
+            stats['elements'] += len(type_ids) - text_rows
+            stats['associated_texts'] += int(text_offsets[-1])
+            stats['confidence_sum'] += float(confidences.sum())
+            for type_name, count in zip(meta['types'], np.bincount(type_ids, minlength=len(meta['types']))):
+                stats['type_counts'][type_name] = stats['type_counts'].get(type_name, 0) + int(count)
+
+    stats['mean_confidence'] = stats['confidence_sum'] / stats['items'] if stats['items'] else None
+    del stats['confidence_sum']
+    return stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Summarize the binary analysis files (.abin) in a directory.")
+    parser.add_argument('directory', help="Directory with .abin files (e.g. output, or output/cache with --recursive).")
+    parser.add_argument('--recursive', action='store_true', help="Also scan subdirectories.")
+    args = parser.parse_args(argv)
+
+    stats = scan_statistics(args.directory, recursive=args.recursive)
+    print(f"Files: {stats['files']} ({stats['unreadable']} unreadable)")
+    print(f"Items: {stats['items']} ({stats['elements']} elements, {stats['texts']} standalone texts, "
+          f"{stats['associated_texts']} associated texts)")
+    if stats['mean_confidence'] is not None:
+        print(f"Mean confidence: {stats['mean_confidence']:.3f}")
+    for type_name, count in sorted(stats['type_counts'].items(), key=lambda entry: -entry[1]):
+        print(f"  {type_name}: {count}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
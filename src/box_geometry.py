@@ -0,0 +1,79 @@
+import numpy as np
+
+# Boxes are [left, top, right, bottom] with left <= right and top <= bottom.
+# A box with zero width or height is "null": like QRectF, it never contains
+# or intersects anything.
+
+
+def area(box):
+    """Area of a box."""
+    return (box[2] - box[0]) * (box[3] - box[1])
+
+
+def is_null(box):
+    """True if the box has zero width or zero height."""
+    return box[0] == box[2] or box[1] == box[3]
+
+
+def contains(outer, inner):
+    """True if inner lies entirely within outer (edges may touch)."""
+    if is_null(outer) or is_null(inner):
+        return False
+    return outer[0] <= inner[0] and inner[2] <= outer[2] and outer[1] <= inner[1] and inner[3] <= outer[3]
+
+
+def intersection(box_a, box_b):
+    """Overlapping box of two boxes, or None if they don't strictly overlap."""
+    if is_null(box_a) or is_null(box_b):
+        return None
+    if box_a[0] >= box_b[2] or box_b[0] >= box_a[2] or box_a[1] >= box_b[3] or box_b[1] >= box_a[3]:
+        return None
+    return [max(box_a[0], box_b[0]), max(box_a[1], box_b[1]), min(box_a[2], box_b[2]), min(box_a[3], box_b[3])]
+
+
+def iou(box_a, box_b):
+    """Intersection over union of two boxes (0.0 when they don't overlap)."""
+    overlap = intersection(box_a, box_b)
+    if overlap is None:
+        return 0.0
+    intersection_area = area(overlap)
+    union_area = area(box_a) + area(box_b) - intersection_area
+    return intersection_area / union_area if union_area > 0 else 0.0
+
+
+def as_array(boxes):
+    """Converts a list of boxes to an (N, 4) float64 array."""
+    return np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+
+
+def pairwise_contains(outer, inner):
+    """(N, M) bool matrix: inner[i] lies within outer[j]. Takes (M, 4) and (N, 4) arrays."""
+    outer, inner = as_array(outer), as_array(inner)
+    valid = ~_null_mask(inner)[:, None] & ~_null_mask(outer)[None, :]
+    return (valid
+            & (inner[:, None, 0] >= outer[None, :, 0]) & (inner[:, None, 2] <= outer[None, :, 2])
+            & (inner[:, None, 1] >= outer[None, :, 1]) & (inner[:, None, 3] <= outer[None, :, 3]))
+
+
+def pairwise_iou(boxes_a, boxes_b):
+    """(N, M) IoU matrix between (N, 4) and (M, 4) arrays (0.0 where boxes don't overlap)."""
+    boxes_a, boxes_b = as_array(boxes_a), as_array(boxes_b)
+    left = np.maximum(boxes_a[:, None, 0], boxes_b[None, :, 0])
+    top = np.maximum(boxes_a[:, None, 1], boxes_b[None, :, 1])
+    right = np.minimum(boxes_a[:, None, 2], boxes_b[None, :, 2])
+    bottom = np.minimum(boxes_a[:, None, 3], boxes_b[None, :, 3])
+    overlapping = ((left < right) & (top < bottom)
+                   & ~_null_mask(boxes_a)[:, None] & ~_null_mask(boxes_b)[None, :])
+
+    intersection_area = (right - left) * (bottom - top)
+    union_area = _areas(boxes_a)[:, None] + _areas(boxes_b)[None, :] - intersection_area
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(overlapping & (union_area > 0), intersection_area / union_area, 0.0)
+
+
+def _areas(boxes):
+    return (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+
+
+def _null_mask(boxes):
+    return (boxes[:, 0] == boxes[:, 2]) | (boxes[:, 1] == boxes[:, 3])
@@ -0,0 +1,208 @@
+from collections.abc import Mapping, Sequence
+
+import numpy as np
+
+# Keys of the dicts the views stand in for, in the order associate_results has always produced them
+ELEMENT_KEYS = ('type', 'confidence', 'bbox', 'associated_text')
+TEXT_ITEM_KEYS = ('type', 'confidence', 'bbox', 'text')
+OCR_KEYS = ('text', 'bbox', 'confidence')
+
+
+class CompactAnalysis(Sequence):
+    """Associated analysis output stored column-wise instead of as one dict per item.
+
+    Row i is an output item: type_ids[i] indexes the interned types table, bboxes/confidences
+    are float64 arrays and texts[i] is the text of a standalone text item (None for elements).
+    The text blocks associated with row i are rows text_offsets[i]:text_offsets[i + 1] of the
+    ocr_* columns. Indexing returns lightweight read-only views that behave like the item dicts
+    (item['bbox'], item.get('type'), item['associated_text'], ...), so code written for the
+    list-of-dicts format keeps working. Use json_default when serializing.
+    """
+
+    def __init__(self, types, type_ids, bboxes, confidences, texts, text_offsets,
+                 ocr_texts, ocr_bboxes, ocr_confidences, extras=None, int_text_boxes=True):
+        self.types = tuple(types)
+        self.type_ids = type_ids
+        self.bboxes = bboxes
+        self.confidences = confidences
+        self.texts = texts
+        self.text_offsets = text_offsets
+        self.ocr_texts = ocr_texts
+        self.ocr_bboxes = ocr_bboxes # int32, like the OCR parser's integer boxes
+        self.ocr_confidences = ocr_confidences
+        self.extras = extras or {} # Additional element keys (e.g. track_id): key -> per-row list, _MISSING where absent
+        self.int_text_boxes = int_text_boxes # Standalone text boxes are the OCR parser's integers
+
+    @classmethod
+    def empty(cls):
+        return cls((), np.zeros(0, dtype=np.int32), np.zeros((0, 4)), np.zeros(0), [], np.zeros(1, dtype=np.int64),
+                   [], np.zeros((0, 4), dtype=np.int32), np.zeros(0))
+
+    @classmethod
+    def from_items(cls, items):
+        """Builds a CompactAnalysis from the list-of-dicts form (associate_results output or loaded JSON)."""
+        types = []
+        type_lookup = {}
+        type_ids, bboxes, confidences, texts, offsets = [], [], [], [], [0]
+        ocr_texts, ocr_bboxes, ocr_confidences = [], [], []
+        extra_keys = []
+        for item in items:
+            if 'text' not in item:
+                extra_keys.extend(key for key in item if key not in ELEMENT_KEYS and key != 'index' and key not in extra_keys)
+        extras = {key: [] for key in extra_keys}
+        for item in items:
+            if item['type'] not in type_lookup:
+                type_lookup[item['type']] = len(types)
+                types.append(item['type'])
+            type_ids.append(type_lookup[item['type']])
+            bboxes.append(list(item['bbox']))
+            confidences.append(item['confidence'])
+            texts.append(item.get('text'))
+            for ocr_res in item.get('associated_text', []):
+                ocr_texts.append(ocr_res['text'])
+                ocr_bboxes.append(list(ocr_res['bbox']))
+                ocr_confidences.append(ocr_res['confidence'])
+            offsets.append(len(ocr_texts))
+            for key in extra_keys:
+                extras[key].append(item.get(key, _MISSING) if 'text' not in item else _MISSING)
+
+        # Keep float coordinates if anything upstream produced them, so nothing is rounded away
+        int_text_boxes = all(type(value) is int for text, bbox in zip(texts, bboxes) if text is not None for value in bbox)
+        int_ocr_boxes = all(type(value) is int for bbox in ocr_bboxes for value in bbox)
+        return cls(types, np.array(type_ids, dtype=np.int32), np.array(bboxes, dtype=np.float64).reshape(-1, 4),
+                   np.array(confidences, dtype=np.float64), texts, np.array(offsets, dtype=np.int64),
+                   ocr_texts, np.array(ocr_bboxes, dtype=np.int32 if int_ocr_boxes else np.float64).reshape(-1, 4),
+                   np.array(ocr_confidences, dtype=np.float64), extras, int_text_boxes)
+
+    def __len__(self):
+        return len(self.type_ids)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [CompactItem(self, row) for row in range(len(self))[index]]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('CompactAnalysis index out of range')
+        return CompactItem(self, index)
+
+    def nbytes(self):
+        """Approximate memory held by the columns, in bytes."""
+        arrays = (self.type_ids, self.bboxes, self.confidences, self.text_offsets, self.ocr_bboxes, self.ocr_confidences)
+        size = sum(array.nbytes for array in arrays)
+        for column in (self.texts, self.ocr_texts):
+            if hasattr(column, 'nbytes'):
+                size += column.nbytes # Packed column (see binary_results.StringColumn)
+            else:
+                size += sum(len(text) + 49 for text in column if text is not None) + 8 * len(column)
+        return size
+
+    def to_list(self):
+        """Materializes the plain list-of-dicts form."""
+        return [item.to_dict() for item in self]
+
+
+class _Missing:
+    pass
+
+
+_MISSING = _Missing()
+
+
+class CompactItem(Mapping):
+    """Read-only dict-like view of one row of a CompactAnalysis."""
+
+    __slots__ = ('_result', '_row')
+
+    def __init__(self, result, row):
+        self._result = result
+        self._row = row
+
+    def _is_text(self):
+        return self._result.texts[self._row] is not None
+
+    def _keys(self):
+        if self._is_text():
+            return TEXT_ITEM_KEYS + ('index',)
+        extra_keys = tuple(key for key, values in self._result.extras.items() if values[self._row] is not _MISSING)
+        return ELEMENT_KEYS + extra_keys + ('index',)
+
+    def __getitem__(self, key):
+        result, row = self._result, self._row
+        if key == 'type':
+            return result.types[result.type_ids[row]]
+        if key == 'confidence':
+            return float(result.confidences[row])
+        if key == 'bbox':
+            bbox = result.bboxes[row].tolist()
+            # Standalone text keeps the OCR parser's integer coordinates
+            return [int(value) for value in bbox] if self._is_text() and result.int_text_boxes else bbox
+        if key == 'index':
+            return row
+        if key == 'text' and self._is_text():
+            return result.texts[row]
+        if key == 'associated_text' and not self._is_text():
+            start, end = result.text_offsets[row], result.text_offsets[row + 1]
+            return [CompactText(result, position) for position in range(start, end)]
+        values = result.extras.get(key)
+        if values is not None and not self._is_text() and values[row] is not _MISSING:
+            return values[row]
+        raise KeyError(key)
+
+    def __iter__(self):
+        return iter(self._keys())
+
+    def __len__(self):
+        return len(self._keys())
+
+    def to_dict(self):
+        item = {}
+        for key in self._keys():
+            value = self[key]
+            item[key] = [text.to_dict() for text in value] if key == 'associated_text' else value
+        return item
+
+    def __repr__(self):
+        return repr(self.to_dict())
+
+
+class CompactText(Mapping):
+    """Read-only dict-like view of one associated OCR text block."""
+
+    __slots__ = ('_result', '_position')
+
+    def __init__(self, result, position):
+        self._result = result
+        self._position = position
+
+    def __getitem__(self, key):
+        if key == 'text':
+            return self._result.ocr_texts[self._position]
+        if key == 'bbox':
+            return self._result.ocr_bboxes[self._position].tolist()
+        if key == 'confidence':
+            return float(self._result.ocr_confidences[self._position])
+        raise KeyError(key)
+
+    def __iter__(self):
+        return iter(OCR_KEYS)
+
+    def __len__(self):
+        return len(OCR_KEYS)
+
+    def to_dict(self):
+        return {key: self[key] for key in OCR_KEYS}
+
+    def __repr__(self):
+        return repr(self.to_dict())
+
+
+def json_default(obj):
+    """json.dump(s) hook for CompactAnalysis and its views: json.dumps(data, default=json_default)."""
+    if isinstance(obj, CompactAnalysis):
+        return obj.to_list()
+    if isinstance(obj, (CompactItem, CompactText)):
+        return obj.to_dict()
+    if isinstance(obj, np.generic):
+        return obj.item()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
@@ -1,48 +1,282 @@
+import hashlib
 import json
 import os
+import sys
+import threading
+from collections import OrderedDict
+
+from binary_results import load_analysis_binary, save_analysis_binary
+from compact_results import CompactAnalysis, json_default
+from perceptual_index import PerceptualIndex, dhash, rescale_results
+from result_store import JsonResultStore, SQLiteResultStore, output_names
+
+# 'json' keeps one cache file per analysis plus an <image>_output.json (and .abin) per image;
+# 'sqlite' keeps everything in output/results.sqlite3 (export JSON with src/result_store.py).
+# Only the 'json' store uses the memory-mapped .abin format; 'sqlite' keeps results as JSON
+# text in the database and parses it on every lookup.
+RESULT_STORES = ('json', 'sqlite')
+# Default memory budget for the in-memory analysis cache
+DEFAULT_MEMORY_CACHE_BYTES = 256 * 1024 * 1024
+
+
+def compute_image_hash(image_bytes):
+    """SHA-256 of the encoded image file contents."""
+    return hashlib.sha256(image_bytes).hexdigest()
+
+
+def estimate_size(obj):
+    """Approximate memory footprint in bytes of a JSON-like structure (dicts, lists, scalars)."""
+    if isinstance(obj, CompactAnalysis):
+        return obj.nbytes()
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        for key, value in obj.items():
+            size += sys.getsizeof(key) + estimate_size(value)
+    elif isinstance(obj, (list, tuple)):
+        for value in obj:
+            size += estimate_size(value)
+    return size
+
+
+def make_cache_key(image_hash, analysis_signature):
+    """Cache key for an image analyzed with a given model/parameter signature
+    (see AnalysisCore.cache_signature). Any change to either gives a new key."""
+    signature_json = json.dumps(analysis_signature, sort_keys=True)
+    return hashlib.sha256(f'{image_hash}:{signature_json}'.encode('utf-8')).hexdigest()
+
+
+def image_fingerprint(image_cv, analysis_signature):
+    """Perceptual hash, signature digest and size of a decoded image, for near-duplicate lookup."""
+    signature_json = json.dumps(analysis_signature, sort_keys=True)
+    height, width = image_cv.shape[:2]
+    return {
+        'phash': dhash(image_cv),
+        'signature_digest': hashlib.sha256(signature_json.encode('utf-8')).hexdigest()[:16],
+        'image_size': [width, height]
+    }
+
 
 class DataManager:
-    def __init__(self, output_dir):
-        self._analysis_cache = {}
+    def __init__(self, output_dir, store_backend='json', memory_budget_bytes=DEFAULT_MEMORY_CACHE_BYTES):
+        # LRU of key -> (cached_data, size in bytes); least recently used first
+        self._analysis_cache = OrderedDict()
+        self._cache_bytes = 0
+        self.memory_budget_bytes = memory_budget_bytes
+        # Guards the in-memory cache and the perceptual index, which the app's analysis worker
+        # and the GUI thread both use
+        self._lock = threading.RLock()
+        self._cache_stats = {'hits': 0, 'misses': 0, 'store_hits': 0, 'near_duplicate_hits': 0, 'evictions': 0}
         self.output_dir = output_dir
         # Ensure cache directory exists
         if not os.path.exists(self.output_dir):
             os.makedirs(self.output_dir)
             print(f"Created output directory: {self.output_dir}")
+        if store_backend not in RESULT_STORES:
+            print(f"Warning: Unknown result store '{store_backend}', using 'json'")
+            store_backend = 'json'
+        self.store_backend = store_backend
+        # Content-addressed results that survive restarts, keyed by make_cache_key()
+        if store_backend == 'sqlite':
+            self.result_store = SQLiteResultStore(os.path.join(self.output_dir, 'results.sqlite3'))
+        else:
+            self.result_store = JsonResultStore(os.path.join(self.output_dir, 'cache'))
+        self._perceptual_index = None # Built from the store on the first near-duplicate lookup
+
+    def get_cached_analysis(self, image_path, cache_key=None):
+        """Retrieves cached analysis data, from memory first and then from the persistent store.
+
+        With a cache_key the lookup is by image content and model signature, so a renamed copy
+        still hits while an edited image or new weights miss. Without one it falls back to the path.
+        """
+        memory_key = cache_key or image_path
+        with self._lock:
+            entry = self._analysis_cache.get(memory_key)
+            if entry is not None:
+                self._analysis_cache.move_to_end(memory_key)
+                self._cache_stats['hits'] += 1
+                return entry[0]
+            self._cache_stats['misses'] += 1
+
+        cached_data = None
+        if cache_key:
+            record = self.result_store.get(cache_key)
+            if record is not None:
+                print(f"Analysis for {image_path or cache_key} found in persistent cache.")
+                with self._lock:
+                    self._cache_stats['store_hits'] += 1
+                cached_data = {
+                    'analysis_data': record['analysis_data'],
+                    'yolo_results': record['yolo_results'],
+                    'ocr_results': record['ocr_results']
+                }
+                self._remember(cache_key, cached_data)
+        return cached_data
+
+    def _remember(self, memory_key, cached_data):
+        """Adds an entry to the in-memory LRU, evicting the least recently used entries to stay within budget."""
+        size = estimate_size(cached_data)
+        with self._lock:
+            old_entry = self._analysis_cache.pop(memory_key, None)
+            if old_entry is not None:
+                self._cache_bytes -= old_entry[1]
+            if self.memory_budget_bytes is not None and size > self.memory_budget_bytes:
+                # Bigger than the whole budget: keeping it would flush everything else
+                return
+            self._analysis_cache[memory_key] = (cached_data, size)
+            self._cache_bytes += size
+            while self.memory_budget_bytes is not None and self._cache_bytes > self.memory_budget_bytes:
+                # Results are written through to the persistent store when cached, so evicting
+                # only drops the memory copy; the next lookup reloads it from disk
+                _, (_, evicted_size) = self._analysis_cache.popitem(last=False)
+                self._cache_bytes -= evicted_size
+                self._cache_stats['evictions'] += 1
+
+    def find_near_duplicate(self, fingerprint, max_distance):
+        """Looks for a stored analysis of a perceptually identical image (e.g. re-encoded or resized)
+        within max_distance bits of the fingerprint's hash. Returns its cached data rescaled to the
+        fingerprint's image size, or None."""
+        with self._lock:
+            if self._perceptual_index is None:
+                perceptual_index = PerceptualIndex()
+                for phash, signature_digest, cache_key, width, height in self.result_store.iter_perceptual_hashes():
+                    perceptual_index.add(phash, signature_digest, cache_key, width, height)
+                self._perceptual_index = perceptual_index
+                print(f"Perceptual index loaded with {len(self._perceptual_index)} entries.")
+
+        width, height = fingerprint['image_size']
+        match = self._perceptual_index.find(fingerprint['phash'], fingerprint['signature_digest'], width, height, max_distance)
+        if match is None:
+            return None
+        cache_key, match_width, match_height, distance = match
+        cached_data = self.get_cached_analysis(None, cache_key)
+        if cached_data is None:
+            return None
+        print(f"Near-duplicate analysis found (Hamming distance {distance}, {match_width}x{match_height} -> {width}x{height}).")
+        with self._lock:
+            self._cache_stats['near_duplicate_hits'] += 1
+        if (match_width, match_height) == (width, height):
+            return cached_data
+        return rescale_results(cached_data, width / match_width, height / match_height)
 
-    def get_cached_analysis(self, image_path):
-        """Retrieves cached analysis data for a given image path."""
-        return self._analysis_cache.get(image_path)
+    def cache_stats(self):
+        """Returns hit/miss/eviction counters and current memory use of the in-memory cache."""
+        with self._lock:
+            return dict(self._cache_stats, entries=len(self._analysis_cache), bytes=self._cache_bytes,
+                        budget_bytes=self.memory_budget_bytes)
 
-    def cache_analysis(self, image_path, analysis_data, yolo_results, ocr_results):
-        """Caches analysis results in memory and saves to a JSON file."""
+    def cache_analysis(self, image_path, analysis_data, yolo_results, ocr_results, cache_key=None, image_hash=None,
+                       fingerprint=None):
+        """Caches analysis results in memory and saves to a JSON file.
+
+        With a cache_key the results are also written to the persistent store, and with a
+        fingerprint (see image_fingerprint) they become findable by find_near_duplicate.
+        """
         if image_path:
-             cached_data = {
-                 'analysis_data': analysis_data,
-                 'yolo_results': yolo_results,
-                 'ocr_results': ocr_results
-             }
-             self._analysis_cache[image_path] = cached_data
-             print(f"Analysis results cached in memory for {image_path}")
+             self.remember_analysis(image_path, analysis_data, yolo_results, ocr_results, cache_key)
              self._save_to_json(image_path, analysis_data)
+             if cache_key:
+                 self.store_analysis(cache_key, image_path, analysis_data, yolo_results, ocr_results, image_hash, fingerprint)
+
+    def remember_analysis(self, image_path, analysis_data, yolo_results, ocr_results, cache_key=None):
+        """Caches analysis results in memory only; pair with save_analysis/store_analysis to persist them."""
+        cached_data = {
+            'analysis_data': analysis_data,
+            'yolo_results': yolo_results,
+            'ocr_results': ocr_results
+        }
+        self._remember(cache_key or image_path, cached_data)
+        print(f"Analysis results cached in memory for {image_path}")
+
+    @staticmethod
+    def _store_record(image_path, analysis_data, yolo_results, ocr_results, image_hash, fingerprint):
+        record = {
+            'image_hash': image_hash,
+            'image_path': os.path.abspath(image_path) if image_path else None,
+            'analysis_data': analysis_data,
+            'yolo_results': yolo_results,
+            'ocr_results': ocr_results
+        }
+        if fingerprint:
+            record.update(fingerprint)
+        return record
+
+    def _index_fingerprint(self, cache_key, fingerprint):
+        # Only needed once the index exists; otherwise it is loaded from the store with this entry in it
+        with self._lock:
+            if fingerprint and self._perceptual_index is not None:
+                width, height = fingerprint['image_size']
+                self._perceptual_index.add(fingerprint['phash'], fingerprint['signature_digest'], cache_key, width, height)
+
+    def store_analysis(self, cache_key, image_path, analysis_data, yolo_results, ocr_results, image_hash=None, fingerprint=None):
+        """Writes analysis results to the persistent store only. Returns False if the write failed."""
+        if not self.result_store.put(cache_key, self._store_record(image_path, analysis_data, yolo_results, ocr_results, image_hash, fingerprint)):
+            return False
+        self._index_fingerprint(cache_key, fingerprint)
+        return True
+
+    def store_analyses(self, entries):
+        """Bulk version of store_analysis for batch runs. entries are
+        (cache_key, image_path, analysis_data, yolo_results, ocr_results, image_hash, fingerprint) tuples.
+        Returns the set of cache keys that could not be stored."""
+        records = [(cache_key, self._store_record(image_path, analysis_data, yolo_results, ocr_results, image_hash, fingerprint))
+                   for cache_key, image_path, analysis_data, yolo_results, ocr_results, image_hash, fingerprint in entries]
+        if isinstance(self.result_store, SQLiteResultStore):
+            # One transaction for the whole batch: it is stored completely or not at all
+            failed_keys = set() if self.result_store.put_many(records) else {cache_key for cache_key, _ in records}
+        else:
+            failed_keys = {cache_key for cache_key, record in records if not self.result_store.put(cache_key, record)}
+        for entry in entries:
+            if entry[0] not in failed_keys:
+                self._index_fingerprint(entry[0], entry[6])
+        return failed_keys
+
+    def save_analysis(self, image_path, analysis_data, output_name=None):
+        """Writes analysis results to the output directory without keeping them in memory.
+        output_name overrides the output file name (see output_names)."""
+        self._save_to_json(image_path, analysis_data, output_name)
+
+    def close(self):
+        """Closes the persistent store."""
+        if isinstance(self.result_store, SQLiteResultStore):
+            self.result_store.close()
+
+    def _output_base(self, image_path, output_name=None):
+        if output_name is None:
+            output_name = os.path.splitext(os.path.basename(image_path))[0]
+        return os.path.join(self.output_dir, f'{output_name}_output')
 
-    def _save_to_json(self, image_path, analysis_data):
+    def _save_to_json(self, image_path, analysis_data, output_name=None):
         """Saves the analysis data to a JSON file."""
+        if self.store_backend == 'sqlite':
+            # The database holds the results; per-image files are only written on export
+            return
         if image_path and analysis_data is not None:
+            output_base = self._output_base(image_path, output_name)
+            json_output_path = f'{output_base}.json'
+            # Written under a temporary name and moved into place, so readers never see a partial file
+            temp_path = f'{json_output_path}.{os.getpid()}.tmp'
             try:
-                base_filename = os.path.splitext(os.path.basename(image_path))[0]
-                json_output_path = os.path.join(self.output_dir, f'{base_filename}_output.json')
-                with open(json_output_path, 'w') as f:
-                    json.dump(analysis_data, f, indent=4)
+                with open(temp_path, 'w') as f:
+                    json.dump(analysis_data, f, indent=4, default=json_default)
+                os.replace(temp_path, json_output_path)
                 print(f"JSON output saved successfully to {json_output_path}")
             except Exception as e:
                 print(f"Error saving JSON to file {json_output_path}: {e}")
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+                # No binary copy either: it must never stand in for a JSON output that wasn't written
+                return
+            # Binary copy for fast reloading and directory statistics (see binary_results)
+            binary_output_path = f'{output_base}.abin'
+            try:
+                save_analysis_binary(binary_output_path, analysis_data)
+            except Exception as e:
+                print(f"Error saving binary output to {binary_output_path}: {e}")
 
     def load_analysis_from_json(self, image_path):
         """Loads analysis data from a JSON file if it exists."""
         if image_path:
-            base_filename = os.path.splitext(os.path.basename(image_path))[0]
-            json_output_path = os.path.join(self.output_dir, f'{base_filename}_output.json')
+            json_output_path = f'{self._output_base(image_path)}.json'
             if os.path.exists(json_output_path):
                 try:
                     with open(json_output_path, 'r') as f:
@@ -53,7 +287,23 @@ class DataManager:
                     print(f"Error loading JSON from file {json_output_path}: {e}")
         return None
 
+    def load_analysis_from_binary(self, image_path):
+        """Loads analysis data from the binary output file if it exists. The result is a
+        memory-mapped CompactAnalysis; nothing is parsed until items are accessed."""
+        if image_path:
+            binary_output_path = f'{self._output_base(image_path)}.abin'
+            if os.path.exists(binary_output_path):
+                try:
+                    analysis_data, _, _ = load_analysis_binary(binary_output_path)
+                    print(f"Analysis data loaded from binary file: {binary_output_path}")
+                    return analysis_data
+                except Exception as e:
+                    print(f"Error loading binary analysis from {binary_output_path}: {e}")
+        return None
+
     def clear_cache(self):
         """Clears the in-memory cache."""
-        self._analysis_cache = {}
+        with self._lock:
+            self._analysis_cache = OrderedDict()
+            self._cache_bytes = 0
         print("Analysis cache cleared.")
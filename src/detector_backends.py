@@ -0,0 +1,208 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+
+import cv2
+import numpy as np
+from ultralytics import YOLO
+
+# 'torch' runs the .pt weights directly; the others export them once and run
+# the exported model through ONNX Runtime or OpenVINO. All of them go through
+# ultralytics' predictor, so letterboxing, NMS and the Results objects are the same.
+# 'onnx_int8' is a post-training quantized ONNX model built by quantize_detector().
+DETECTOR_BACKENDS = ('torch', 'onnx', 'openvino', 'onnx_int8')
+# Digests of the weights and exports, kept in the export cache directory and keyed on each
+# file's path, size and modification time, so hundreds of MB aren't re-read on every start
+DIGEST_CACHE_NAME = 'digests.json'
+
+_digest_memo = {} # path -> ([size, mtime_ns], digest), for this process
+_digest_lock = threading.Lock()
+
+
+def file_digest(path, chunk_size=1 << 20):
+    """SHA-256 hex digest of a file's contents."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def cached_file_digest(path, cache_dir):
+    """file_digest of path, remembered in <cache_dir>/digests.json until the file's size or
+    modification time changes."""
+    path = os.path.abspath(path)
+    stat = os.stat(path)
+    stamp = [stat.st_size, stat.st_mtime_ns]
+    with _digest_lock:
+        memo = _digest_memo.get(path)
+    if memo is not None and memo[0] == stamp:
+        return memo[1]
+
+    cache_path = os.path.join(cache_dir, DIGEST_CACHE_NAME)
+    try:
+        with open(cache_path, 'r') as f:
+            entries = json.load(f)
+    except (OSError, ValueError):
+        entries = {}
+    entry = entries.get(path)
+    if entry is not None and entry['stamp'] == stamp:
+        digest = entry['sha256']
+    else:
+        digest = file_digest(path)
+        entries[path] = {'stamp': stamp, 'sha256': digest}
+        # Another process may write the cache at the same time; losing its entry only costs a re-hash
+        temp_path = f'{cache_path}.{os.getpid()}.tmp'
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+            with open(temp_path, 'w') as f:
+                json.dump(entries, f, indent=1)
+            os.replace(temp_path, cache_path)
+        except OSError as e:
+            print(f"Warning: Could not update the digest cache {cache_path}: {e}")
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+    with _digest_lock:
+        _digest_memo[path] = (stamp, digest)
+    return digest
+
+
+def _default_cache_dir(weights_path):
+    return os.path.join(os.path.dirname(weights_path), 'exported')
+
+
+def exported_model_path(weights_path, backend, imgsz=640, cache_dir=None):
+    """Where the exported artifact for these weights lives. The name includes the weights digest,
+    so updated weights never reuse a stale export."""
+    cache_dir = cache_dir or _default_cache_dir(weights_path)
+    stem = os.path.splitext(os.path.basename(weights_path))[0]
+    name = f"{stem}_{cached_file_digest(weights_path, cache_dir)[:16]}_{imgsz}"
+    if backend == 'onnx':
+        return os.path.join(cache_dir, f"{name}.onnx")
+    if backend == 'onnx_int8':
+        return os.path.join(cache_dir, f"{name}_int8.onnx")
+    # ultralytics recognizes OpenVINO models by the _openvino_model directory suffix
+    return os.path.join(cache_dir, f"{name}_openvino_model")
+
+
+def export_detector(weights_path, backend, imgsz=640, cache_dir=None):
+    """Exports the .pt weights for the given backend once and returns the cached artifact path.
+
+    ultralytics writes the export next to the weights it is given, so the weights are copied into
+    a private temporary directory first and the result is moved into the cache with os.replace.
+    Processes exporting at the same time then never touch each other's files; the last one wins.
+    """
+    target_path = exported_model_path(weights_path, backend, imgsz, cache_dir)
+    if os.path.exists(target_path):
+        print(f"Using cached {backend} export: {target_path}")
+        return target_path
+
+    print(f"Exporting {weights_path} to {backend} (one-time)...")
+    os.makedirs(os.path.dirname(target_path), exist_ok=True)
+    # On the cache's file system, so the final os.replace is a rename
+    temp_dir = tempfile.mkdtemp(prefix='export_', dir=os.path.dirname(target_path))
+    try:
+        temp_weights = os.path.join(temp_dir, os.path.basename(weights_path))
+        shutil.copy2(weights_path, temp_weights)
+        # dynamic=True keeps the batch dimension free so run_yolo_batch works on exported models
+        exported_path = YOLO(temp_weights).export(format=backend, imgsz=imgsz, dynamic=True, half=False)
+        try:
+            os.replace(str(exported_path), target_path)
+        except OSError:
+            # A directory export (OpenVINO) can't replace one another process has just finished
+            if not os.path.exists(target_path):
+                raise
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+    print(f"Exported {backend} model cached at {target_path}")
+    return target_path
+
+
+def detector_digest(weights_path, backend='torch', imgsz=640):
+    """Digest of the model artifact a backend actually runs (the .pt, .onnx or OpenVINO files)."""
+    cache_dir = _default_cache_dir(weights_path)
+    if backend == 'torch':
+        return cached_file_digest(weights_path, cache_dir)
+    model_path = exported_model_path(weights_path, backend, imgsz)
+    if os.path.isdir(model_path):
+        digest = hashlib.sha256()
+        for name in sorted(os.listdir(model_path)):
+            digest.update(cached_file_digest(os.path.join(model_path, name), cache_dir).encode('ascii'))
+        return digest.hexdigest()
+    return cached_file_digest(model_path, cache_dir)
+
+
+def load_detector(weights_path, backend='torch', imgsz=640):
+    """Returns a YOLO model running on the selected backend."""
+    if backend not in DETECTOR_BACKENDS:
+        raise ValueError(f"Unknown detector backend '{backend}', expected one of {DETECTOR_BACKENDS}")
+    if backend == 'torch':
+        return YOLO(weights_path)
+    if backend == 'onnx_int8':
+        int8_path = exported_model_path(weights_path, backend, imgsz)
+        if not os.path.exists(int8_path):
+            # Quantization needs calibration screenshots, so it can't happen implicitly here
+            raise FileNotFoundError(f"No INT8 model at {int8_path}; create it with src/quantize_report.py")
+        return YOLO(int8_path, task='detect')
+    return YOLO(export_detector(weights_path, backend, imgsz), task='detect')
+
+
+def letterbox_tensor(image_cv, imgsz=640):
+    """Preprocesses a BGR image the way the ultralytics predictor does for exported models:
+    letterbox to imgsz x imgsz with grey padding, RGB, CHW, float32 in [0, 1], batch of one."""
+    height, width = image_cv.shape[:2]
+    scale = min(imgsz / height, imgsz / width)
+    new_width, new_height = int(round(width * scale)), int(round(height * scale))
+    resized = cv2.resize(image_cv, (new_width, new_height), interpolation=cv2.INTER_LINEAR)
+    canvas = np.full((imgsz, imgsz, 3), 114, dtype=np.uint8)
+    top, left = (imgsz - new_height) // 2, (imgsz - new_width) // 2
+    canvas[top:top + new_height, left:left + new_width] = resized
+    tensor = canvas[:, :, ::-1].transpose(2, 0, 1).astype(np.float32) / 255.0
+    return np.ascontiguousarray(tensor[None])
+
+
+def quantize_detector(weights_path, calibration_images, imgsz=640, force=False):
+    """Builds the INT8 ONNX profile by static post-training quantization, calibrated on
+    calibration_images (a list of screenshot paths). Returns the INT8 model path."""
+    import onnx
+    from onnxruntime.quantization import CalibrationDataReader, QuantFormat, QuantType, quantize_static
+
+    int8_path = exported_model_path(weights_path, 'onnx_int8', imgsz)
+    if os.path.exists(int8_path) and not force:
+        print(f"Using cached INT8 model: {int8_path}")
+        return int8_path
+    if not calibration_images:
+        raise ValueError("At least one calibration image is required for INT8 quantization")
+
+    fp32_path = export_detector(weights_path, 'onnx', imgsz)
+    input_name = onnx.load(fp32_path, load_external_data=False).graph.input[0].name
+
+    class ScreenshotCalibrationReader(CalibrationDataReader):
+        """Feeds letterboxed calibration screenshots to the quantizer one at a time."""
+        def __init__(self):
+            self._paths = iter(calibration_images)
+
+        def get_next(self):
+            for image_path in self._paths:
+                image_cv = cv2.imread(image_path)
+                if image_cv is not None:
+                    return {input_name: letterbox_tensor(image_cv, imgsz)}
+                print(f"Warning: Skipping unreadable calibration image {image_path}")
+            return None
+
+    print(f"Quantizing {fp32_path} to INT8 with {len(calibration_images)} calibration images...")
+    quantize_static(fp32_path, int8_path, ScreenshotCalibrationReader(),
+                    quant_format=QuantFormat.QDQ, per_channel=True,
+                    activation_type=QuantType.QUInt8, weight_type=QuantType.QInt8)
+
+    # ultralytics reads class names and stride from the model metadata; carry it over
+    fp32_model = onnx.load(fp32_path)
+    int8_model = onnx.load(int8_path)
+    del int8_model.metadata_props[:]
+    int8_model.metadata_props.extend(fp32_model.metadata_props)
+    onnx.save(int8_model, int8_path)
+    print(f"INT8 model saved to {int8_path}")
+    return int8_path
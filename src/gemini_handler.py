@@ -1,23 +1,82 @@
 import json
 import os
+import queue
+import threading
+import time
 import google.generativeai as genai
 from typing import Dict, List, Any
 from datetime import datetime
 from collections import deque
 
+from compact_results import json_default
+
+# Default limit in seconds for one streamed response (config key 'request_timeout')
+DEFAULT_REQUEST_TIMEOUT = 60
+# How often (seconds) a streamed response checks for cancellation and its deadline while waiting for a chunk
+STREAM_POLL_INTERVAL = 0.1
+
+
+class ResponseCancelled(Exception):
+    """Raised by GeminiHandler.stream_response when its cancel_event is set."""
+
+
+class FakeResponseChunk:
+    """Stand-in for a streamed generate_content chunk."""
+    def __init__(self, text: str):
+        self.text = text
+
+
+class FakeGenerativeModel:
+    """Offline stand-in for genai.GenerativeModel, for trying the chat and streaming paths
+    without an API key or network: set "model": "fake" in config/config.json.
+
+    Answers every prompt with response_text, streamed a few words per chunk with chunk_delay
+    seconds between chunks.
+    """
+    def __init__(self, response_text: str = None, words_per_chunk: int = 3, chunk_delay: float = 0.05):
+        self.response_text = response_text
+        self.words_per_chunk = max(1, words_per_chunk)
+        self.chunk_delay = chunk_delay
+
+    def _answer(self, prompt: str) -> str:
+        if self.response_text is not None:
+            return self.response_text
+        return f"This is an offline test response from the fake model. The prompt was {len(prompt)} characters long."
+
+    def _stream(self, text: str):
+        words = text.split(' ')
+        for start in range(0, len(words), self.words_per_chunk):
+            time.sleep(self.chunk_delay)
+            chunk = ' '.join(words[start:start + self.words_per_chunk])
+            yield FakeResponseChunk(chunk if start + self.words_per_chunk >= len(words) else chunk + ' ')
+
+    def generate_content(self, prompt: str, stream: bool = False, **kwargs):
+        text = self._answer(prompt)
+        return self._stream(text) if stream else FakeResponseChunk(text)
+
+
 class GeminiHandler:
-    def __init__(self, config_path: str, max_history: int = 10):
+    def __init__(self, config_path: str, max_history: int = 10, model=None):
         self.config_path = config_path
         self.history = []
         self.conversation_history = deque(maxlen=max_history)
         self.current_analysis_data = None
         self.current_image_name = None
+        # Stays None (chat disabled) unless an API key is configured or a model is passed in
+        self.model = model
+        self.request_timeout = DEFAULT_REQUEST_TIMEOUT
+        if model is not None:
+            return
 
         try:
             with open(config_path, 'r') as f:
                 config = json.load(f)
                 api_key = config.get('gemini_api_key')
-                if api_key:
+                self.request_timeout = config.get('request_timeout', DEFAULT_REQUEST_TIMEOUT)
+                if config.get('model') == 'fake':
+                    self.model = FakeGenerativeModel()
+                    print("Using the offline fake model for the AI assistant")
+                elif api_key:
                     genai.configure(api_key=api_key)
                     # Get model configuration from config file
                     model_name = config.get('model', 'gemini-pro')
@@ -82,7 +141,7 @@ class GeminiHandler:
         Current Image: {self.current_image_name or 'Not specified'}
         
         Current Analysis Data:
-        {json.dumps(self.current_analysis_data, indent=2) if self.current_analysis_data else 'No analysis data available'}
+        {json.dumps(self.current_analysis_data, indent=2, default=json_default) if self.current_analysis_data else 'No analysis data available'}
 
         {self._format_conversation_history()}
 
@@ -105,6 +164,81 @@ class GeminiHandler:
 
         return prompt
 
+    def _record_exchange(self, user_query: str, response: str, image_name: str = None):
+        """Adds a question and its answer to the conversation history."""
+        self.conversation_history.append({
+            "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "role": "user",
+            "content": user_query,
+            "image": image_name
+        })
+        self.conversation_history.append({
+            "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "role": "assistant",
+            "content": response,
+            "image": image_name
+        })
+
+    def _pump_stream(self, prompt: str, request_timeout: float, chunk_queue):
+        """Runs the streaming request, putting ('chunk', text) items on chunk_queue and then
+        ('done', None) or ('error', exception). Runs on a helper thread of stream_response."""
+        try:
+            # The request timeout bounds the wait for each network read
+            response = self.model.generate_content(prompt, stream=True, request_options={'timeout': request_timeout})
+            for chunk in response:
+                chunk_queue.put(('chunk', chunk.text))
+            chunk_queue.put(('done', None))
+        except Exception as e:
+            chunk_queue.put(('error', e))
+
+    def stream_response(self, user_query: str, analysis_data: List[Dict[str, Any]], image_name: str = None,
+                        cancel_event=None, timeout: float = None):
+        """Generates a response with generate_content(..., stream=True), yielding text chunks as they arrive.
+
+        Setting cancel_event (a threading.Event) stops the stream with ResponseCancelled; after
+        timeout seconds (default: request_timeout) it stops with TimeoutError. Both are checked
+        every STREAM_POLL_INTERVAL seconds, also while the model hasn't sent anything yet: the
+        request runs on a helper thread, which is abandoned if the stream is stopped. The exchange
+        is added to the conversation history only if the response completes. Blocking; run it
+        on a worker thread (see ui_workers.ChatWorker).
+        """
+        if not self.model:
+            raise RuntimeError("Gemini model not properly initialized. Please check your API key and configuration.")
+
+        timeout = self.request_timeout if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+        self.current_analysis_data = analysis_data
+        self.current_image_name = image_name
+        prompt = self._create_context_aware_prompt(user_query)
+
+        def remaining_time():
+            if cancel_event is not None and cancel_event.is_set():
+                raise ResponseCancelled()
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise TimeoutError(f"No complete response within {timeout} seconds")
+            return remaining
+
+        chunk_queue = queue.Queue()
+        threading.Thread(target=self._pump_stream, args=(prompt, remaining_time(), chunk_queue),
+                         name="chat-stream", daemon=True).start()
+        chunks = []
+        while True:
+            remaining = remaining_time()
+            try:
+                kind, value = chunk_queue.get(timeout=min(STREAM_POLL_INTERVAL, remaining))
+            except queue.Empty:
+                continue
+            if kind == 'error':
+                raise value
+            if kind == 'done':
+                break
+            if value:
+                chunks.append(value)
+                yield value
+
+        self._record_exchange(user_query, self._format_response(''.join(chunks)), image_name)
+
     def generate_response(self, user_query: str, analysis_data: List[Dict[str, Any]], image_name: str = None) -> str:
         if not self.model:
             return "Error: Gemini model not properly initialized. Please check your API key and configuration."
@@ -124,18 +258,7 @@ class GeminiHandler:
             formatted_response = self._format_response(response.text)
             
             # Add to conversation history with timestamp
-            self.conversation_history.append({
-                "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                "role": "user",
-                "content": user_query,
-                "image": image_name
-            })
-            self.conversation_history.append({
-                "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                "role": "assistant",
-                "content": formatted_response,
-                "image": image_name
-            })
+            self._record_exchange(user_query, formatted_response, image_name)
 
             return formatted_response
 
@@ -0,0 +1,115 @@
+import gzip
+import io
+import json
+import os
+import zlib
+
+from compact_results import json_default
+
+# Compression is picked from the file extension unless given explicitly
+COMPRESSIONS = (None, 'gzip', 'zstd')
+
+
+def _compression_for(path, compression):
+    if compression != 'auto':
+        if compression not in COMPRESSIONS:
+            raise ValueError(f"Unknown compression '{compression}', expected one of {COMPRESSIONS}")
+        return compression
+    if path.endswith('.gz'):
+        return 'gzip'
+    if path.endswith('.zst'):
+        return 'zstd'
+    return None
+
+
+def _open_text(path, mode, compression):
+    """Opens a (possibly compressed) text stream. mode is 'a' or 'r'."""
+    if compression == 'gzip':
+        # Appending to a .gz adds a new gzip member; readers see one continuous stream
+        return gzip.open(path, mode + 't', encoding='utf-8')
+    if compression == 'zstd':
+        try:
+            import zstandard
+        except ImportError:
+            raise ImportError("zstd compression needs the 'zstandard' package (pip install zstandard)")
+        if mode == 'a':
+            return io.TextIOWrapper(zstandard.ZstdCompressor().stream_writer(open(path, 'ab')), encoding='utf-8')
+        return io.TextIOWrapper(zstandard.ZstdDecompressor().stream_reader(open(path, 'rb'), read_across_frames=True),
+                                encoding='utf-8')
+    return open(path, mode, encoding='utf-8')
+
+
+class JsonlWriter:
+    """Append-only JSON Lines sink: one compact JSON record per line.
+
+    Records are buffered and written in chunks of flush_every lines, so a crash loses at most
+    one chunk and a large run never holds more than that in memory.
+    """
+
+    def __init__(self, path, compression='auto', flush_every=100):
+        self.path = path
+        self.compression = _compression_for(path, compression)
+        self.flush_every = max(1, flush_every)
+        self.records_written = 0
+        self._pending = []
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._file = _open_text(path, 'a', self.compression)
+
+    def write(self, record):
+        """Queues one record; the chunk is written out every flush_every records."""
+        self._pending.append(json.dumps(record, separators=(',', ':'), default=json_default))
+        if len(self._pending) >= self.flush_every:
+            self.flush()
+
+    def flush(self):
+        """Writes the pending records to the file."""
+        if self._pending:
+            self._file.write('\n'.join(self._pending) + '\n')
+            self.records_written += len(self._pending)
+            self._pending = []
+        self._file.flush()
+
+    def close(self):
+        """Flushes the remaining records and closes the file."""
+        if self._file is not None:
+            self.flush()
+            self._file.close()
+            self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def iter_jsonl(path, compression='auto'):
+    """Lazily yields the records of a JSON Lines file written by JsonlWriter, one at a time.
+
+    A run that was killed mid-write can leave a truncated file: reading stops with a warning
+    at the last complete line, and a last line without its newline is skipped.
+    """
+    with _open_text(path, 'r', _compression_for(path, compression)) as f:
+        lines = iter(f)
+        line_number = 0
+        while True:
+            try:
+                line = next(lines)
+            except StopIteration:
+                break
+            except (EOFError, zlib.error) as e:
+                # A compressed stream cut off mid-block
+                print(f"Warning: {path} is truncated after line {line_number}, ignoring the rest: {e}")
+                break
+            line_number += 1
+            if not line.endswith('\n'):
+                # JsonlWriter ends every record with a newline, so this one was cut off
+                print(f"Warning: Skipping incomplete last line {line_number} in {path}")
+                break
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError as e:
+                print(f"Warning: Skipping unreadable line {line_number} in {path}: {e}")
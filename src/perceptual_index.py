@@ -0,0 +1,93 @@
+import threading
+
+import cv2
+import numpy as np
+
+# 16x16 difference hash = 256 bits. A 64-bit hash (8x8) is too coarse for UI screenshots:
+# whole dialogs that differ only in their text collapse onto the same hash.
+HASH_SIZE = 16
+HASH_BYTES = HASH_SIZE * HASH_SIZE // 8
+ASPECT_TOLERANCE = 0.01 # Relative aspect-ratio difference allowed when reusing a result at another size
+
+# Number of set bits in every byte value, for Hamming distances over packed hashes
+_POPCOUNT = np.array([bin(value).count('1') for value in range(256)], dtype=np.uint16)
+
+
+def dhash(image_cv, hash_size=HASH_SIZE):
+    """Difference hash of an image as a hex string: the sign of horizontal gradients on a
+    downscaled greyscale copy. Survives re-encoding and resizing; changes with the layout."""
+    grey = cv2.cvtColor(image_cv, cv2.COLOR_BGR2GRAY) if image_cv.ndim == 3 else image_cv
+    small = cv2.resize(grey, (hash_size + 1, hash_size), interpolation=cv2.INTER_AREA)
+    bits = small[:, 1:] > small[:, :-1]
+    return np.packbits(bits.flatten()).tobytes().hex()
+
+
+class PerceptualIndex:
+    """In-memory index of perceptual hashes for near-duplicate lookup by Hamming distance.
+
+    Entries are grouped by analysis signature digest, so a match always comes from the same
+    models and settings. Hashes are kept packed in one uint8 matrix per signature and scanned
+    with a popcount table, which takes milliseconds even for 100k entries.
+    Safe to share between threads (the app's analysis worker adds while the GUI thread looks up).
+    """
+
+    def __init__(self):
+        self._groups = {} # signature digest -> {'hashes': [...], 'rows': ndarray or None, 'entries': [...]}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        with self._lock:
+            return sum(len(group['entries']) for group in self._groups.values())
+
+    def add(self, phash, signature_digest, cache_key, width, height):
+        """Adds an analysis to the index."""
+        with self._lock:
+            group = self._groups.setdefault(signature_digest, {'hashes': [], 'rows': None, 'entries': []})
+            group['hashes'].append(bytes.fromhex(phash))
+            group['entries'].append((cache_key, width, height))
+            group['rows'] = None # Rebuilt on the next lookup
+
+    def find(self, phash, signature_digest, width, height, max_distance):
+        """Returns (cache_key, width, height, distance) of the closest entry with the same
+        signature and aspect ratio within max_distance bits, or None."""
+        with self._lock:
+            group = self._groups.get(signature_digest)
+            if not group or not group['entries']:
+                return None
+            if group['rows'] is None:
+                group['rows'] = np.frombuffer(b''.join(group['hashes']), dtype=np.uint8).reshape(-1, HASH_BYTES)
+            # entries only ever grows, so it can be read outside the lock for the rows matched here
+            rows, entries = group['rows'], group['entries']
+
+        query = np.frombuffer(bytes.fromhex(phash), dtype=np.uint8)
+        distances = _POPCOUNT[np.bitwise_xor(rows, query)].sum(axis=1)
+        aspect = width / height
+        for entry_index in np.argsort(distances, kind='stable'):
+            distance = int(distances[entry_index])
+            if distance > max_distance:
+                break
+            cache_key, entry_width, entry_height = entries[entry_index]
+            # Rescaling boxes only makes sense for the same screen at another size, not a cropped one
+            if abs(entry_width / entry_height - aspect) <= ASPECT_TOLERANCE * aspect:
+                return cache_key, entry_width, entry_height, distance
+        return None
+
+
+def _scale_bbox(bbox, scale_x, scale_y, as_int):
+    scaled = [bbox[0] * scale_x, bbox[1] * scale_y, bbox[2] * scale_x, bbox[3] * scale_y]
+    return [int(round(value)) for value in scaled] if as_int else scaled
+
+
+def rescale_results(cached_data, scale_x, scale_y):
+    """Copy of cached analysis data ({analysis_data, yolo_results, ocr_results}) with every bbox
+    scaled. Integer boxes (OCR) stay integers."""
+    def scale_item(item):
+        item = dict(item)
+        if 'bbox' in item:
+            item['bbox'] = _scale_bbox(item['bbox'], scale_x, scale_y, all(isinstance(value, int) for value in item['bbox']))
+        if 'associated_text' in item:
+            item['associated_text'] = [scale_item(ocr_res) for ocr_res in item['associated_text']]
+        return item
+
+    return {key: [scale_item(item) for item in (cached_data.get(key) or [])]
+            for key in ('analysis_data', 'yolo_results', 'ocr_results')}
@@ -0,0 +1,98 @@
+import argparse
+import json
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+
+from analysis_config import load_analysis_config
+from batch_main import collect_image_paths
+from detector_backends import load_detector, quantize_detector
+
+# FP32 baselines first so the INT8 row can be compared against them
+REPORT_PROFILES = ('torch', 'onnx', 'onnx_int8')
+
+
+def measure_latency(model, images, imgsz=640, warmup_runs=2):
+    """Times single-image predict calls. Returns mean/p50/p95 latency in ms and throughput."""
+    for image_cv in images[:warmup_runs]:
+        model.predict(source=image_cv, imgsz=imgsz, conf=0.25, verbose=False)
+
+    latencies = []
+    for image_cv in images:
+        start_time = time.perf_counter()
+        model.predict(source=image_cv, imgsz=imgsz, conf=0.25, verbose=False)
+        latencies.append((time.perf_counter() - start_time) * 1000.0)
+    latencies = np.asarray(latencies)
+    return {
+        'mean_ms': float(latencies.mean()),
+        'p50_ms': float(np.percentile(latencies, 50)),
+        'p95_ms': float(np.percentile(latencies, 95)),
+        'images_per_second': float(1000.0 / latencies.mean()),
+    }
+
+
+def measure_accuracy(model, data_yaml, imgsz=640):
+    """Runs ultralytics validation on a labelled dataset and returns mAP50 and mAP50-95."""
+    metrics = model.val(data=data_yaml, imgsz=imgsz, batch=1, verbose=False, plots=False)
+    return {'map50': float(metrics.box.map50), 'map50_95': float(metrics.box.map)}
+
+
+def main(argv=None):
+    base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    parser = argparse.ArgumentParser(description="Build the INT8 YOLO profile and compare it with the FP32 weights.")
+    parser.add_argument('--calibration', nargs='+', required=True,
+                        help="Screenshots (files, directories or globs) used to calibrate INT8 quantization.")
+    parser.add_argument('--calibration-limit', type=int, default=200, help="Maximum number of calibration images.")
+    parser.add_argument('--bench', nargs='+', default=None,
+                        help="Images used for latency measurement (default: the calibration images).")
+    parser.add_argument('--data', default=None,
+                        help="ultralytics dataset YAML with labelled screenshots; enables the mAP comparison.")
+    parser.add_argument('--force', action='store_true', help="Re-quantize even if an INT8 model is cached.")
+    parser.add_argument('-o', '--output', default=os.path.join(base_dir, 'output', 'quantization_report.json'),
+                        help="Where to write the JSON report.")
+    args = parser.parse_args(argv)
+
+    weights_path = load_analysis_config(base_dir)['yolo_model_path']
+    calibration_paths = collect_image_paths(args.calibration)[:args.calibration_limit]
+    quantize_detector(weights_path, calibration_paths, force=args.force)
+
+    bench_paths = collect_image_paths(args.bench) if args.bench else calibration_paths
+    bench_images = [image for image in (cv2.imread(path) for path in bench_paths) if image is not None]
+    if not bench_images:
+        print("No readable benchmark images.")
+        return 1
+
+    report = {'weights': weights_path, 'benchmark_images': len(bench_images), 'profiles': {}}
+    for profile in REPORT_PROFILES:
+        print(f"Measuring {profile}...")
+        model = load_detector(weights_path, profile)
+        result = measure_latency(model, bench_images)
+        if args.data:
+            result.update(measure_accuracy(model, args.data))
+        report['profiles'][profile] = result
+
+    baseline = report['profiles']['torch']
+    for profile, result in report['profiles'].items():
+        result['speedup_vs_torch'] = baseline['mean_ms'] / result['mean_ms']
+        if 'map50_95' in result:
+            result['map50_95_delta_vs_torch'] = result['map50_95'] - baseline['map50_95']
+
+    print(f"\n{'profile':<10} {'mean ms':>9} {'p95 ms':>9} {'img/s':>7} {'speedup':>8} {'mAP50':>7} {'mAP50-95':>9}")
+    for profile, result in report['profiles'].items():
+        map50 = f"{result['map50']:.3f}" if 'map50' in result else '-'
+        map50_95 = f"{result['map50_95']:.3f}" if 'map50_95' in result else '-'
+        print(f"{profile:<10} {result['mean_ms']:>9.1f} {result['p95_ms']:>9.1f} {result['images_per_second']:>7.2f} "
+              f"{result['speedup_vs_torch']:>7.2f}x {map50:>7} {map50_95:>9}")
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=4)
+    print(f"\nReport saved to {args.output}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,330 @@
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+import threading
+from datetime import datetime
+
+from binary_results import load_analysis_binary, save_analysis_binary
+from compact_results import json_default
+
+
+def output_names(image_paths):
+    """Maps image paths to the names of their output files (without the _output suffix).
+    The name is the image's file name, plus a short hash of its full path where several
+    images share a file name (e.g. a/img.png and b/img.png in one batch run)."""
+    paths_by_stem = {}
+    for image_path in dict.fromkeys(image_paths): # Each path once, in order
+        stem = os.path.splitext(os.path.basename(image_path))[0]
+        # Compared case-insensitively, since Windows file names are
+        paths_by_stem.setdefault(stem.lower(), []).append((image_path, stem))
+    names = {}
+    for paths in paths_by_stem.values():
+        for image_path, stem in paths:
+            if len(paths) == 1:
+                names[image_path] = stem
+            else:
+                path_hash = hashlib.sha1(os.path.abspath(image_path).encode('utf-8')).hexdigest()[:8]
+                names[image_path] = f'{stem}_{path_hash}'
+    return names
+
+
+class JsonResultStore:
+    """Persistent, content-addressed analysis store: one JSON record per cache key.
+
+    Records live at <root>/<key[:2]>/<key>.json so no directory grows too large. The results
+    themselves go to a memory-mapped <key>.abin next to it (see binary_results), so reloading
+    an analysis doesn't parse JSON; results outside the standard schema stay in the JSON record.
+    Perceptual hashes of stored records are appended to <root>/phash_index.tsv.
+    """
+
+    RESULT_KEYS = ('analysis_data', 'yolo_results', 'ocr_results')
+
+    def __init__(self, root_dir):
+        self.root_dir = root_dir
+        os.makedirs(self.root_dir, exist_ok=True)
+        self._phash_index_path = os.path.join(self.root_dir, 'phash_index.tsv')
+
+    def _record_path(self, cache_key):
+        return os.path.join(self.root_dir, cache_key[:2], f'{cache_key}.json')
+
+    def _binary_path(self, cache_key):
+        return os.path.join(self.root_dir, cache_key[:2], f'{cache_key}.abin')
+
+    def get(self, cache_key):
+        """Returns the stored record for cache_key, or None."""
+        record_path = self._record_path(cache_key)
+        if not os.path.exists(record_path):
+            return None
+        try:
+            with open(record_path, 'r') as f:
+                record = json.load(f)
+            if record.get('results_format') == 'binary':
+                record.update(zip(self.RESULT_KEYS, load_analysis_binary(self._binary_path(cache_key))))
+            return record
+        except Exception as e:
+            print(f"Error reading cached analysis {record_path}: {e}")
+            return None
+
+    def put(self, cache_key, record):
+        """Stores a record under cache_key, replacing any previous one. Returns False if the write failed."""
+        record = dict(record, cache_key=cache_key)
+        record.setdefault('created_at', datetime.now().isoformat(timespec='seconds'))
+        record_path = self._record_path(cache_key)
+        os.makedirs(os.path.dirname(record_path), exist_ok=True)
+        try:
+            # The binary file is complete before the record that points to it is written
+            save_analysis_binary(self._binary_path(cache_key), *(record[key] for key in self.RESULT_KEYS))
+            record = {key: value for key, value in record.items() if key not in self.RESULT_KEYS}
+            record['results_format'] = 'binary'
+        except Exception as e:
+            print(f"Keeping JSON results for {cache_key}: {e}")
+        # Write to a temporary file first so readers never see a half-written record
+        temp_path = f'{record_path}.{os.getpid()}.tmp'
+        try:
+            with open(temp_path, 'w') as f:
+                json.dump(record, f, default=json_default)
+            os.replace(temp_path, record_path)
+        except Exception as e:
+            print(f"Error writing cached analysis {record_path}: {e}")
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            return False
+        if record.get('phash'):
+            width, height = record['image_size']
+            # One short line per append, so concurrent batch workers don't interleave entries
+            with open(self._phash_index_path, 'a') as f:
+                f.write(f"{record['phash']}\t{record['signature_digest']}\t{cache_key}\t{width}\t{height}\n")
+        return True
+
+    def iter_perceptual_hashes(self):
+        """Yields (phash, signature_digest, cache_key, width, height) for every stored record that has one."""
+        if not os.path.exists(self._phash_index_path):
+            return
+        with open(self._phash_index_path, 'r') as f:
+            for line in f:
+                fields = line.rstrip('\n').split('\t')
+                if len(fields) == 5:
+                    yield fields[0], fields[1], fields[2], int(fields[3]), int(fields[4])
+
+
+class SQLiteResultStore:
+    """Analysis store backed by a single SQLite database in WAL mode.
+
+    Whole analyses are kept as JSON text in the analyses table; the elements table holds one
+    row per output item so element types can be queried without decoding every analysis.
+    WAL lets readers run alongside a writer, and several batch worker processes can write
+    to the same file (each write waits for the lock instead of failing).
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS analyses (
+            cache_key TEXT PRIMARY KEY,
+            image_hash TEXT,
+            image_path TEXT,
+            created_at TEXT NOT NULL,
+            analysis_data TEXT NOT NULL,
+            yolo_results TEXT,
+            ocr_results TEXT
+        );
+        CREATE TABLE IF NOT EXISTS elements (
+            cache_key TEXT NOT NULL REFERENCES analyses(cache_key) ON DELETE CASCADE,
+            item_index INTEGER NOT NULL,
+            type TEXT,
+            confidence REAL,
+            left REAL, top REAL, right REAL, bottom REAL,
+            text TEXT,
+            PRIMARY KEY (cache_key, item_index)
+        );
+        CREATE INDEX IF NOT EXISTS idx_analyses_image_hash ON analyses(image_hash);
+        CREATE INDEX IF NOT EXISTS idx_analyses_image_path ON analyses(image_path);
+        CREATE INDEX IF NOT EXISTS idx_analyses_created_at ON analyses(created_at);
+        CREATE INDEX IF NOT EXISTS idx_elements_type ON elements(type);
+        CREATE TABLE IF NOT EXISTS perceptual_hashes (
+            cache_key TEXT PRIMARY KEY REFERENCES analyses(cache_key) ON DELETE CASCADE,
+            phash TEXT NOT NULL,
+            signature_digest TEXT NOT NULL,
+            width INTEGER NOT NULL,
+            height INTEGER NOT NULL
+        );
+    """
+
+    def __init__(self, db_path, busy_timeout=30.0):
+        self.db_path = db_path
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        # One connection per store; the lock makes it safe to share between threads
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, timeout=busy_timeout, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock:
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            # NORMAL is durable across application crashes in WAL mode and avoids an fsync per commit
+            self._conn.execute('PRAGMA synchronous=NORMAL')
+            self._conn.execute('PRAGMA foreign_keys=ON')
+            self._conn.executescript(self.SCHEMA)
+
+    @staticmethod
+    def _element_rows(cache_key, analysis_data):
+        rows = []
+        for position, item in enumerate(analysis_data or []):
+            bbox = item.get('bbox') or [None] * 4
+            text = item.get('text')
+            if text is None and item.get('associated_text'):
+                text = ' '.join(ocr_res.get('text', '') for ocr_res in item['associated_text'])
+            rows.append((cache_key, item.get('index', position), item.get('type'), item.get('confidence'),
+                         bbox[0], bbox[1], bbox[2], bbox[3], text))
+        return rows
+
+    def _record_from_row(self, row):
+        return {
+            'cache_key': row['cache_key'],
+            'image_hash': row['image_hash'],
+            'image_path': row['image_path'],
+            'created_at': row['created_at'],
+            'analysis_data': json.loads(row['analysis_data']),
+            'yolo_results': json.loads(row['yolo_results']) if row['yolo_results'] else [],
+            'ocr_results': json.loads(row['ocr_results']) if row['ocr_results'] else [],
+        }
+
+    def get(self, cache_key):
+        """Returns the stored record for cache_key, or None."""
+        try:
+            with self._lock:
+                row = self._conn.execute('SELECT * FROM analyses WHERE cache_key = ?', (cache_key,)).fetchone()
+            return self._record_from_row(row) if row else None
+        except Exception as e:
+            print(f"Error reading cached analysis {cache_key} from {self.db_path}: {e}")
+            return None
+
+    def put(self, cache_key, record):
+        """Stores a record under cache_key, replacing any previous one. Returns False if the write failed."""
+        return self.put_many([(cache_key, record)])
+
+    def put_many(self, records):
+        """Stores (cache_key, record) pairs in a single transaction. Returns False if the write
+        failed, in which case none of the records were stored."""
+        created_at = datetime.now().isoformat(timespec='seconds')
+        analysis_rows = []
+        element_rows = []
+        phash_rows = []
+        # Byte-identical copies in one batch share a cache key; the last record wins, as with
+        # separate puts (duplicate element rows would fail the whole transaction)
+        unique_records = {}
+        for cache_key, record in records:
+            unique_records.pop(cache_key, None)
+            unique_records[cache_key] = record
+        for cache_key, record in unique_records.items():
+            analysis_rows.append((cache_key, record.get('image_hash'), record.get('image_path'),
+                                  record.get('created_at', created_at),
+                                  json.dumps(record['analysis_data'], separators=(',', ':'), default=json_default),
+                                  json.dumps(record.get('yolo_results'), separators=(',', ':'), default=json_default),
+                                  json.dumps(record.get('ocr_results'), separators=(',', ':'), default=json_default)))
+            element_rows.extend(self._element_rows(cache_key, record['analysis_data']))
+            if record.get('phash'):
+                width, height = record['image_size']
+                phash_rows.append((cache_key, record['phash'], record['signature_digest'], width, height))
+        if not analysis_rows:
+            return True
+        try:
+            with self._lock, self._conn:
+                # Replacing an analysis cascades to its old element rows
+                self._conn.executemany('INSERT OR REPLACE INTO analyses VALUES (?, ?, ?, ?, ?, ?, ?)', analysis_rows)
+                self._conn.executemany('INSERT INTO elements VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)', element_rows)
+                self._conn.executemany('INSERT INTO perceptual_hashes VALUES (?, ?, ?, ?, ?)', phash_rows)
+        except Exception as e:
+            print(f"Error writing {len(analysis_rows)} analyses to {self.db_path}: {e}")
+            return False
+        return True
+
+    def find_by_image_hash(self, image_hash):
+        """Returns every record stored for an image, newest first (one per model/parameter signature)."""
+        with self._lock:
+            rows = self._conn.execute('SELECT * FROM analyses WHERE image_hash = ? ORDER BY created_at DESC',
+                                      (image_hash,)).fetchall()
+        return [self._record_from_row(row) for row in rows]
+
+    def find_by_path(self, image_path):
+        """Returns the newest record stored for an image path, or None."""
+        with self._lock:
+            row = self._conn.execute('SELECT * FROM analyses WHERE image_path = ? ORDER BY created_at DESC LIMIT 1',
+                                     (os.path.abspath(image_path),)).fetchone()
+        return self._record_from_row(row) if row else None
+
+    def iter_perceptual_hashes(self):
+        """Yields (phash, signature_digest, cache_key, width, height) for every stored record that has one."""
+        with self._lock:
+            rows = self._conn.execute('SELECT phash, signature_digest, cache_key, width, height FROM perceptual_hashes').fetchall()
+        for row in rows:
+            yield tuple(row)
+
+    def count_elements_by_type(self):
+        """Returns {element type: number of items} over all stored analyses."""
+        with self._lock:
+            rows = self._conn.execute('SELECT type, COUNT(*) FROM elements GROUP BY type').fetchall()
+        return {row[0]: row[1] for row in rows}
+
+    def iter_records(self, since=None):
+        """Yields stored records in insertion order, optionally only those created at or after `since` (ISO string)."""
+        query = 'SELECT * FROM analyses'
+        params = ()
+        if since:
+            query += ' WHERE created_at >= ?'
+            params = (since,)
+        with self._lock:
+            rows = self._conn.execute(query + ' ORDER BY rowid', params).fetchall()
+        for row in rows:
+            yield self._record_from_row(row)
+
+    def export_json(self, output_dir, since=None):
+        """Writes each stored analysis to <output_dir>/<image>_output.json, the app's usual JSON format.
+        Images that share a file name are told apart as in batch runs (see output_names); where one
+        image has several stored analyses, the newest one is kept. Returns the number of files written."""
+        os.makedirs(output_dir, exist_ok=True)
+        query = 'SELECT image_path, cache_key FROM analyses'
+        params = ()
+        if since:
+            query += ' WHERE created_at >= ?'
+            params = (since,)
+        with self._lock:
+            sources = [image_path or cache_key for image_path, cache_key in self._conn.execute(query, params).fetchall()]
+        names = output_names(sources)
+        written_paths = set()
+        for record in self.iter_records(since):
+            json_output_path = os.path.join(output_dir, f"{names[record['image_path'] or record['cache_key']]}_output.json")
+            # Written under a temporary name and moved into place, so an interrupted export leaves no partial file
+            temp_path = f'{json_output_path}.{os.getpid()}.tmp'
+            try:
+                with open(temp_path, 'w') as f:
+                    json.dump(record['analysis_data'], f, indent=4)
+                os.replace(temp_path, json_output_path)
+                written_paths.add(json_output_path)
+            except Exception as e:
+                print(f"Error exporting JSON to {json_output_path}: {e}")
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+        return len(written_paths)
+
+    def close(self):
+        """Closes the database connection."""
+        with self._lock:
+            self._conn.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export analyses from the SQLite result store to per-image JSON files.")
+    parser.add_argument('database', help="Path to the results database (e.g. output/results.sqlite3).")
+    parser.add_argument('output_dir', help="Directory for the <image>_output.json files.")
+    parser.add_argument('--since', default=None, help="Only export analyses created at or after this ISO timestamp.")
+    args = parser.parse_args(argv)
+
+    store = SQLiteResultStore(args.database)
+    written = store.export_json(args.output_dir, since=args.since)
+    store.close()
+    print(f"Exported {written} JSON files to {args.output_dir}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
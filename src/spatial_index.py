@@ -0,0 +1,60 @@
+import math
+from collections import defaultdict
+
+# Upper bound on grid cells per axis so one huge box can't blow up the index
+MAX_CELLS_PER_AXIS = 128
+
+
+class GridIndex:
+    """Uniform grid over axis-aligned boxes, used to find the boxes a query box may overlap.
+
+    Boxes are (left, top, right, bottom) tuples with left <= right and top <= bottom.
+    """
+
+    def __init__(self, boxes, cell_size=None):
+        self._boxes = list(boxes)
+        self._cells = defaultdict(list)
+        self._cols = self._rows = None # Occupied column/row range, set once the grid is filled
+        if not self._boxes:
+            self.cell_size = 1.0
+            return
+
+        if cell_size is None:
+            # The median box size keeps most boxes within a handful of cells
+            sizes = sorted(max(right - left, bottom - top) for left, top, right, bottom in self._boxes)
+            extent = max(max(right for _, _, right, _ in self._boxes) - min(left for left, _, _, _ in self._boxes),
+                         max(bottom for _, _, _, bottom in self._boxes) - min(top for _, top, _, _ in self._boxes))
+            cell_size = max(sizes[len(sizes) // 2], extent / MAX_CELLS_PER_AXIS, 1.0)
+        self.cell_size = float(cell_size)
+
+        for box_index, box in enumerate(self._boxes):
+            for cell in self._cells_for(*box):
+                self._cells[cell].append(box_index)
+        self._cols = (min(col for col, _ in self._cells), max(col for col, _ in self._cells))
+        self._rows = (min(row for _, row in self._cells), max(row for _, row in self._cells))
+
+    def _cells_for(self, left, top, right, bottom):
+        col_start, col_end = math.floor(left / self.cell_size), math.floor(right / self.cell_size)
+        row_start, row_end = math.floor(top / self.cell_size), math.floor(bottom / self.cell_size)
+        if self._cols is not None:
+            # Queries never need to look outside the occupied part of the grid
+            col_start, col_end = max(col_start, self._cols[0]), min(col_end, self._cols[1])
+            row_start, row_end = max(row_start, self._rows[0]), min(row_end, self._rows[1])
+        for col in range(col_start, col_end + 1):
+            for row in range(row_start, row_end + 1):
+                yield col, row
+
+    def query(self, left, top, right, bottom):
+        """Returns the indices (ascending) of boxes that overlap or touch the query box."""
+        if not self._boxes:
+            return []
+        candidates = set()
+        for cell in self._cells_for(left, top, right, bottom):
+            bucket = self._cells.get(cell)
+            if bucket:
+                candidates.update(bucket)
+        return sorted(
+            box_index for box_index in candidates
+            if self._boxes[box_index][0] <= right and self._boxes[box_index][2] >= left
+            and self._boxes[box_index][1] <= bottom and self._boxes[box_index][3] >= top
+        )
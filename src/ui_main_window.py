@@ -1,18 +1,21 @@
 import sys
 import os
-from PyQt6.QtWidgets import (QApplication, QWidget, QVBoxLayout, QPushButton, QHBoxLayout,
+from PyQt6.QtWidgets import (QWidget, QVBoxLayout, QPushButton, QHBoxLayout,
                              QLabel, QFileDialog, QMessageBox, QSizePolicy, QGroupBox, QTextEdit,
                              QProgressBar, QTabWidget, QLineEdit, QScrollArea)
-from PyQt6.QtGui import QPixmap, QImage, QPainter, QColor, QFont, QWheelEvent, QPen
+from PyQt6.QtGui import QPixmap, QImage, QPainter, QColor, QFont, QWheelEvent, QPen, QTextCursor
 from PyQt6.QtCore import Qt, QRectF, QPoint, pyqtSignal, QPointF
 import cv2
+import numpy as np
 import json
 from datetime import datetime
 
 # Import modular components
-from ui_widgets import ZoomableLabel, draw_annotations
-from analysis_core import AnalysisCore
-from data_manager import DataManager
+from ui_widgets import ZoomableLabel
+from compact_results import json_default
+from analysis_config import load_analysis_config, memory_budget_bytes
+from ui_workers import AnalysisWorker, ChatWorker, ModelLoaderThread
+from data_manager import DataManager, compute_image_hash, image_fingerprint, make_cache_key
 from gemini_handler import GeminiHandler
 
 
@@ -78,6 +81,16 @@ class UIOcrApp(QWidget):
         self.process_button.clicked.connect(self.process_image)
         self.process_button.setEnabled(False)
         info_controls_layout.addWidget(self.process_button)
+
+        # Stops the running analysis at its next stage boundary
+        self.cancel_button = QPushButton("Cancel Analysis")
+        self.cancel_button.clicked.connect(self.cancel_analysis)
+        self.cancel_button.setEnabled(False)
+        info_controls_layout.addWidget(self.cancel_button)
+
+        # Model loading state; the models load in the background after the window is shown
+        self.model_status_label = QLabel("Loading models...")
+        info_controls_layout.addWidget(self.model_status_label)
         info_controls_layout.addStretch(1) # Add stretch to push buttons to the top
 
         # Add Chat Interface
@@ -102,7 +115,7 @@ class UIOcrApp(QWidget):
         self.chat_input.returnPressed.connect(self.send_chat_message)
         chat_input_layout.addWidget(self.chat_input)
         self.send_button = QPushButton("Send")
-        self.send_button.clicked.connect(self.send_chat_message)
+        self.send_button.clicked.connect(self.handle_send_button)
         chat_input_layout.addWidget(self.send_button)
         chat_layout.addLayout(chat_input_layout)
 
@@ -201,22 +214,24 @@ class UIOcrApp(QWidget):
 
         self.original_image_cv = None # Store original image as OpenCV format
         self.original_image_path = None
+        self.original_image_hash = None # Content hash of the loaded file, for the persistent cache
         self.analysis_data = None # Store the processed JSON output data
 
         # Store raw YOLO and OCR results for drawing
         self._yolo_results = []
         self._ocr_results = []
 
-        # Update model path
-        yolo_model_path = os.path.join(self.models_dir, 'yolov8m_for_ocr', 'weights', 'best.pt')
-        ocr_params = {
-            'lang': 'en',
-            'use_textline_orientation': False,
-            'use_doc_orientation_classify': False,
-            'use_doc_unwarping': False,
-        }
-        self.analysis_core = AnalysisCore(yolo_model_path, ocr_params)
-        self.data_manager = DataManager(output_dir=self.output_dir)
+        # The analysis core is built on a background thread (see _start_model_loading)
+        self.analysis_core = None
+        self._analysis_signature = None # Model/parameter part of the cache key, set once models are loaded
+        self._pending_analysis = False # Set when an analysis is requested before the models are ready
+        self._analysis_worker = None # The running AnalysisWorker, if any
+        self._analysis_queued = False # Set when Run Analysis is clicked while an analysis is running
+        self._chat_worker = None # The ChatWorker streaming the current AI response, if any
+        # Model path, OCR parameters and storage settings come from the shared analysis config
+        self.analysis_config = load_analysis_config(self.base_dir)
+        self.data_manager = DataManager(output_dir=self.output_dir, store_backend=self.analysis_config['result_store'],
+                                        memory_budget_bytes=memory_budget_bytes(self.analysis_config))
 
         # Initialize Gemini handler with config path
         gemini_config_path = os.path.join(self.config_dir, 'config.json')
@@ -232,12 +247,75 @@ class UIOcrApp(QWidget):
         self.output_tabs.currentChanged.connect(self.handle_tab_changed)
         self._active_tab_index = 0 # Default to the first tab
 
-        # Check if models loaded successfully
-        if not self.analysis_core.yolo_model or not self.analysis_core.ocr_model:
+        self._start_model_loading()
+
+    def _start_model_loading(self):
+        """Loads YOLO and PaddleOCR on a background thread so the window appears immediately."""
+        self._loading_models = True
+        self._model_loader = ModelLoaderThread(self.analysis_config, self)
+        self._model_loader.progress.connect(self.handle_model_load_progress)
+        self._model_loader.models_loaded.connect(self.handle_models_loaded)
+        self._model_loader.start()
+
+    def handle_model_load_progress(self, message, percent):
+        """Shows model loading progress in the status label."""
+        self.model_status_label.setText(f"{message} ({percent}%)")
+
+    def handle_models_loaded(self, analysis_core):
+        """Enables processing once the background model load has finished."""
+        self.analysis_core = analysis_core
+        self._loading_models = False
+        if not self._models_ready():
+             self.model_status_label.setText("Models failed to load. Processing disabled.")
+             self._pending_analysis = False
              QMessageBox.critical(self, "Model Loading Error", "One or both AI models failed to load during initialization. Processing disabled.")
              self.process_button.setEnabled(False)
+             return
+
+        timings = self.analysis_core.warmup_timings
+        if timings:
+             cold = timings['yolo'][0] + timings['ocr'][0]
+             warm = timings['yolo'][-1] + timings['ocr'][-1]
+             self.model_status_label.setText(f"Models ready (warm-up: first run {cold:.1f}s, steady state {warm:.1f}s).")
         else:
-             self.process_button.setEnabled(True)
+             self.model_status_label.setText("Models ready.")
+        self._analysis_signature = self.analysis_core.cache_signature()
+        self.process_button.setEnabled(self.original_image_cv is not None)
+        # Run the analysis that was requested while the models were still loading
+        if self._pending_analysis and self.original_image_cv is not None:
+             self._pending_analysis = False
+             self.process_image()
+
+    def _models_ready(self):
+        """True once both models have been loaded successfully."""
+        return self.analysis_core is not None and self.analysis_core.yolo_model is not None and self.analysis_core.ocr_model is not None
+
+    def _models_loading(self):
+        """True while the background model load is still running."""
+        return self._loading_models
+
+    def _analysis_cache_key(self):
+        """Persistent cache key for the loaded image, or None until the models are loaded."""
+        if self.original_image_hash is None or self._analysis_signature is None:
+            return None
+        return make_cache_key(self.original_image_hash, self._analysis_signature)
+
+    def closeEvent(self, event):
+        """Waits for background model loading and analysis and releases the analysis core on exit."""
+        if self._model_loader.isRunning():
+            self._model_loader.wait()
+        if self._analysis_worker is not None:
+            self._analysis_queued = False
+            self._analysis_worker.cancel()
+            self._analysis_worker.wait()
+        if self._chat_worker is not None:
+            self._chat_worker.cancel()
+            self._chat_worker.wait()
+        if self.analysis_core is not None:
+            self.analysis_core.close()
+        print(f"Analysis cache stats: {self.data_manager.cache_stats()}")
+        self.data_manager.close()
+        super().closeEvent(event)
 
 
     def handle_tab_changed(self, index):
@@ -308,7 +386,16 @@ class UIOcrApp(QWidget):
             self.last_directory = os.path.dirname(image_path)
             self._save_last_directory()  # Save the new last directory
             self.original_image_path = image_path
-            self.original_image_cv = cv2.imread(image_path)
+            self.original_image_hash = None
+            try:
+                # Decode from the bytes we hash so the cache key matches exactly what gets analyzed
+                with open(image_path, 'rb') as f:
+                    image_bytes = f.read()
+                self.original_image_hash = compute_image_hash(image_bytes)
+                self.original_image_cv = cv2.imdecode(np.frombuffer(image_bytes, dtype=np.uint8), cv2.IMREAD_COLOR)
+            except Exception as e:
+                print(f"Error reading image file {image_path}: {e}")
+                self.original_image_cv = None
 
             if self.original_image_cv is None:
                 QMessageBox.critical(self, "Error", "Cannot load image file using OpenCV.")
@@ -355,37 +442,23 @@ class UIOcrApp(QWidget):
                 self._ocr_results = []
 
                 # Enable process button only if models are loaded
-                if self.analysis_core.yolo_model and self.analysis_core.ocr_model:
-                    self.process_button.setEnabled(True)
-                else:
-                     self.process_button.setEnabled(False)
+                self.process_button.setEnabled(self._models_ready())
+                self._pending_analysis = False
 
                 # Check if analysis for this image is in cache
-                cached_data = self.data_manager.get_cached_analysis(self.original_image_path)
+                cached_data = self.data_manager.get_cached_analysis(self.original_image_path, self._analysis_cache_key())
                 if cached_data:
                     print(f"Loading analysis from cache for {self.original_image_path}")
-                    self.analysis_data = cached_data['analysis_data']
-                    self._yolo_results = cached_data['yolo_results']
-                    self._ocr_results = cached_data['ocr_results']
-
-                    # Display cached JSON
-                    try:
-                         json_data_str = json.dumps(self.analysis_data, indent=4)
-                         self.json_output_text.setText(json_data_str)
-                         self.json_output_text.setPlaceholderText("")
-                    except Exception as json_e:
-                         self.json_output_text.setText(f"Error displaying cached JSON: {json_e}")
-                         print(f"Error displaying cached JSON: {json_e}")
-
-                    # Redraw annotations on all labels from cached results
-                    self.draw_and_set_annotated_images()
+                    # Annotations and JSON text are drawn on the worker thread from the cached results
+                    self._start_analysis_worker(cached_data=cached_data)
 
+                elif self._models_loading():
+                    # Queue the analysis; it starts automatically once the models are ready
+                    self._pending_analysis = True
+                    self.model_status_label.setText("Image queued; analysis will start when the models are ready.")
                 else:
                     # If not in cache, ensure process button is enabled (if models loaded)
-                    if self.analysis_core.yolo_model and self.analysis_core.ocr_model:
-                         self.process_button.setEnabled(True)
-                    else:
-                         self.process_button.setEnabled(False)
+                    self.process_button.setEnabled(self._models_ready())
 
 
     def process_image(self):
@@ -393,133 +466,156 @@ class UIOcrApp(QWidget):
             QMessageBox.warning(self, "Warning", "Please load an image first.")
             return
 
-        if not self.analysis_core.yolo_model or not self.analysis_core.ocr_model:
+        if self._models_loading():
+             self._pending_analysis = True
+             self.model_status_label.setText("Analysis queued; it will start when the models are ready.")
+             return
+
+        if not self._models_ready():
              QMessageBox.critical(self, "Error", "AI models failed to load. Cannot process.")
              return
 
+        if self._analysis_worker is not None:
+             # Repeat clicks are queued: one more run starts when the current one is done,
+             # for whichever image is loaded by then
+             self._analysis_queued = True
+             self.model_status_label.setText("Analysis queued; it will start when the current one finishes.")
+             return
+
         # Check if analysis is already cached for this image
-        cached_data = self.data_manager.get_cached_analysis(self.original_image_path)
+        cached_data = self.data_manager.get_cached_analysis(self.original_image_path, self._analysis_cache_key())
         if cached_data:
              print(f"Analysis for {self.original_image_path} found in cache. Skipping reprocessing.")
-             self.analysis_data = cached_data['analysis_data']
-             self._yolo_results = cached_data['yolo_results']
-             self._ocr_results = cached_data['ocr_results']
-
-             try:
-                 json_data_str = json.dumps(self.analysis_data, indent=4)
-                 self.json_output_text.setText(json_data_str)
-                 self.json_output_text.setPlaceholderText("")
-             except Exception as json_e:
-                 self.json_output_text.setText(f"Error displaying cached JSON: {json_e}")
-                 print(f"Error displaying cached JSON: {json_e}")
-
-             self.draw_and_set_annotated_images()
-
-             self.process_button.setEnabled(True)
-             self.load_button.setEnabled(True)
-             self.setCursor(Qt.CursorShape.ArrowCursor)
-             # self.hover_info_text.setPlaceholderText("Hover over an element or text in the image to see its details here.") # removed
-             self.json_output_text.setPlaceholderText("")
-             self.progress_bar.setValue(100)
-             self.progress_bar.hide()
-             return # Exit the function as we used cache
-
-
-        self.process_button.setEnabled(False) # Disable during processing
-        self.load_button.setEnabled(False)
-        self.setCursor(Qt.CursorShape.WaitCursor) # Show busy cursor
-        # self.hover_info_text.setPlaceholderText("Processing...") # removed
+             self._start_analysis_worker(cached_data=cached_data)
+             return
+
+        # The near-duplicate lookup (and storing a hit) reads and writes the result store, so the worker does it
+        fingerprint = image_fingerprint(self.original_image_cv, self._analysis_signature)
+        self._start_analysis_worker(fingerprint=fingerprint,
+                                    near_duplicate_distance=self.analysis_config['near_duplicate_distance'])
+
+    def _start_analysis_worker(self, cached_data=None, fingerprint=None, near_duplicate_distance=None):
+        """Runs the analysis of the loaded image (or only the drawing, for cached results) on an
+        AnalysisWorker thread, so the window stays responsive."""
+        if self._analysis_worker is not None:
+             self._analysis_queued = True
+             return
+
         self.json_output_text.setPlaceholderText("Processing...")
         # Clear highlights and previous results displays on processing start
         self.all_image_label.set_highlight(None)
         self.ocr_image_label.set_highlight(None)
         self.yolo_image_label.set_highlight(None)
         self.combined_image_label.set_highlight(None)
-        # self.hover_info_text.clear() # removed
         self.json_output_text.clear()
         self.analysis_data = None
         self._yolo_results = []
         self._ocr_results = []
 
-
-        self.progress_bar.show() # Show the progress bar
         self.progress_bar.setValue(5) # Initial progress
-        QApplication.processEvents() # Process events to update UI
-
-        try:
-            # Run analysis core
-            self._yolo_results, self._ocr_results = self.analysis_core.run_analysis(self.original_image_cv)
-
-            self.progress_bar.setValue(70) # Progress after core analysis
-            QApplication.processEvents()
-
-            # Associate results and generate final JSON
-            self.analysis_data = self.analysis_core.associate_results(self._yolo_results, self._ocr_results)
-
-            self.progress_bar.setValue(80) # Progress after association
-            QApplication.processEvents()
-
-            # Display Raw JSON Output
-            try:
-                 json_data_str = json.dumps(self.analysis_data, indent=4)
-                 self.json_output_text.setText(json_data_str)
-                 self.json_output_text.setPlaceholderText("")
-            except Exception as json_e:
-                 self.json_output_text.setText(f"Error displaying JSON: {json_e}")
-                 print(f"Error displaying JSON: {json_e}")
-
-            # Clear chat history when new analysis is done
-            self.gemini_handler.clear_history()
-            self.chat_display.clear()
-            self.chat_display.setPlaceholderText("Ask questions about the detected elements...")
-
-            # Draw Annotations and Update Image Labels
-            self.draw_and_set_annotated_images()
-            self.progress_bar.setValue(90) # Progress after drawing
-            QApplication.processEvents()
-
-            # Cache results
-            self.data_manager.cache_analysis(self.original_image_path, self.analysis_data, self._yolo_results, self._ocr_results)
-
-        except Exception as e:
-            QMessageBox.critical(self, "Error", f"An error occurred during processing: {e}")
-            import traceback
-            traceback.print_exc()
-        finally:
-            self.progress_bar.setValue(100) # Set to 100% on completion/error
-            self.progress_bar.hide() # Hide the progress bar
-            self.process_button.setEnabled(True) # Re-enable button
-            self.load_button.setEnabled(True)
-            self.setCursor(Qt.CursorShape.ArrowCursor) # Restore cursor
-            # self.hover_info_text.setPlaceholderText("Hover over an element or text in the image to see its details here.") # removed
-            self.json_output_text.setPlaceholderText("")
-
-
-    def draw_and_set_annotated_images(self):
-        """Draws annotations based on current results and sets pixmaps for all labels."""
-        if self.original_image_cv is None:
+        self.progress_bar.setFormat("Starting analysis... %p%")
+        self.progress_bar.show()
+        self.cancel_button.setEnabled(True)
+
+        self._analysis_worker = AnalysisWorker(self.analysis_core, self.data_manager, self.original_image_cv,
+                                               self.original_image_path, self.original_image_hash,
+                                               self._analysis_cache_key(), fingerprint, cached_data,
+                                               near_duplicate_distance, self)
+        self._analysis_worker.stage_progress.connect(self.handle_analysis_stage)
+        self._analysis_worker.partial_results.connect(self.handle_partial_results)
+        self._analysis_worker.analysis_finished.connect(self.handle_analysis_finished)
+        self._analysis_worker.analysis_failed.connect(self.handle_analysis_failed)
+        self._analysis_worker.analysis_cancelled.connect(self.handle_analysis_cancelled)
+        self._analysis_worker.finished.connect(self._analysis_worker.deleteLater)
+        self._analysis_worker.start()
+
+    def cancel_analysis(self):
+        """Cancels the running analysis and any queued one."""
+        if self._analysis_worker is not None:
+             self._analysis_queued = False
+             self._analysis_worker.cancel()
+             self.cancel_button.setEnabled(False)
+             self.progress_bar.setFormat("Cancelling... %p%")
+
+    def handle_analysis_stage(self, stage, percent):
+        """Shows which analysis stage has finished."""
+        stage_names = {'yolo': "UI elements detected", 'ocr': "Text recognized",
+                       'association': "Text associated", 'rendering': "Annotations drawn"}
+        self.progress_bar.setValue(percent)
+        self.progress_bar.setFormat(f"{stage_names.get(stage, stage)}... %p%")
+
+    def _is_current_image(self, result):
+        """False for results of an image that has since been replaced by another one."""
+        return result['image_path'] == self.original_image_path and result['image_hash'] == self.original_image_hash
+
+    def handle_partial_results(self, stage, result):
+        """Shows each stage's results as soon as it finishes: YOLO boxes first, then the OCR
+        text, then the associated analysis (JSON output and hover info)."""
+        if not self._is_current_image(result):
+             return
+        if stage == 'yolo':
+             self._yolo_results = result['yolo_results']
+        elif stage == 'ocr':
+             self._ocr_results = result['ocr_results']
+        elif stage == 'association':
+             self.analysis_data = result['analysis_data']
+        if 'images' in result:
+             self._set_annotated_images(result['images'])
+
+    def handle_analysis_finished(self, result):
+        """Displays the results of a finished AnalysisWorker."""
+        self.data_manager.remember_analysis(result['image_path'], result['analysis_data'], result['yolo_results'],
+                                            result['ocr_results'], result['cache_key'])
+        if not self._is_current_image(result):
+             # Another image was loaded while this one was analyzed; its results are cached for later
+             print(f"Analysis of {result['image_path']} finished after another image was loaded; not displaying it.")
+             self._analysis_worker_done()
              return
 
-        # Draw images for each tab using the draw_annotations helper
-        # Tab 0 & 3: All Annotations (No initial annotations, only on hover) and Combined (Both annotations)
-        # Use the original image for the base of all drawings
-        base_image = self.original_image_cv
-
-        # Tab 0: All Annotations + Info (No annotations drawn initially)
-        all_tab_base_pixmap = draw_annotations(base_image, yolo_elements=None, ocr_text_blocks=None)
-        self.all_image_label.setPixmap(all_tab_base_pixmap)
-
-        # Tab 1: PaddleOCR Annotations only
-        ocr_annotated_pixmap = draw_annotations(base_image, yolo_elements=None, ocr_text_blocks=self._ocr_results)
-        self.ocr_image_label.setPixmap(ocr_annotated_pixmap)
-
-        # Tab 2: YOLO Annotations only (with associated text)
-        yolo_annotated_pixmap = draw_annotations(base_image, yolo_elements=self._yolo_results, ocr_text_blocks=None, draw_yolo_associated_text=True, draw_element_type=True)
-        self.yolo_image_label.setPixmap(yolo_annotated_pixmap)
-
-        # Tab 3: Combined Annotated Image (Both YOLO and OCR annotations)
-        combined_annotated_pixmap = draw_annotations(base_image, yolo_elements=self._yolo_results, ocr_text_blocks=self._ocr_results, draw_element_type=True)
-        self.combined_image_label.setPixmap(combined_annotated_pixmap)
+        self.analysis_data = result['analysis_data']
+        self._yolo_results = result['yolo_results']
+        self._ocr_results = result['ocr_results']
+        self.json_output_text.setText(result['json_text'])
+        self.json_output_text.setPlaceholderText("")
+        self._set_annotated_images(result['images'])
+
+        if not result['from_cache']:
+             # Clear chat history when new analysis is done
+             self.gemini_handler.clear_history()
+             self.chat_display.clear()
+             self.chat_display.setPlaceholderText("Ask questions about the detected elements...")
+        self._analysis_worker_done()
+
+    def handle_analysis_failed(self, message):
+        """Reports an analysis error."""
+        self.json_output_text.setPlaceholderText("")
+        self._analysis_worker_done()
+        QMessageBox.critical(self, "Error", f"An error occurred during processing: {message}")
+
+    def handle_analysis_cancelled(self):
+        """Resets the display after a cancelled analysis."""
+        self.json_output_text.setPlaceholderText("Analysis cancelled.")
+        self._analysis_worker_done()
+
+    def _analysis_worker_done(self):
+        """Restores the controls after an analysis and starts the queued one, if any."""
+        self._analysis_worker = None
+        self.progress_bar.setValue(100)
+        self.progress_bar.hide()
+        self.cancel_button.setEnabled(False)
+        self.process_button.setEnabled(self._models_ready())
+        if self._analysis_queued:
+             self._analysis_queued = False
+             self.process_image()
+
+    def _set_annotated_images(self, images):
+        """Shows QImages rendered by AnalysisWorker on the image labels (any of 'all', 'ocr',
+        'yolo', 'combined'), keeping each label's zoom and pan."""
+        labels = {'all': self.all_image_label, 'ocr': self.ocr_image_label,
+                  'yolo': self.yolo_image_label, 'combined': self.combined_image_label}
+        for name, image in images.items():
+             # QPixmaps may only be created on the GUI thread, so the conversion happens here
+             labels[name].update_pixmap(QPixmap.fromImage(image))
 
 
     def image_label_for_tab_index(self, index):
@@ -661,8 +757,21 @@ class UIOcrApp(QWidget):
             # For other keys, call the base class implementation
             super().keyPressEvent(event)
 
+    def handle_send_button(self):
+        """The Send button doubles as Stop while a response is streaming."""
+        if self._chat_worker is not None:
+            self._chat_worker.cancel()
+            self.send_button.setEnabled(False)
+            self.send_button.setText("Stopping...")
+        else:
+            self.send_chat_message()
+
     def send_chat_message(self):
-        """Handle sending chat messages to Gemini."""
+        """Handle sending chat messages to Gemini. The response is streamed into the chat on a ChatWorker."""
+        if self._chat_worker is not None:
+            # One response at a time; the question stays in the input box
+            return
+
         if not self.analysis_data:
             QMessageBox.warning(self, "Warning", "Please run analysis first before asking questions.")
             return
@@ -674,19 +783,41 @@ class UIOcrApp(QWidget):
         # Display user message
         self.chat_display.append(f"\nYou: {user_query}")
         self.chat_input.clear()
+        self.chat_display.append("\nAI: ")
 
         # Get image name from the current image path
         image_name = os.path.basename(self.original_image_path) if self.original_image_path else None
-        response = self.gemini_handler.generate_response(user_query, self.analysis_data, image_name)
-        
-        # Display AI response
-        self.chat_display.append(f"\nAI: {response}\n")
-        
+        self._chat_worker = ChatWorker(self.gemini_handler, user_query, self.analysis_data, image_name, self)
+        self._chat_worker.chunk_received.connect(self.handle_chat_chunk)
+        self._chat_worker.response_finished.connect(lambda: self._chat_worker_done("\n"))
+        self._chat_worker.response_failed.connect(lambda message: self._chat_worker_done(f"Error generating response: {message}\n"))
+        self._chat_worker.response_cancelled.connect(lambda: self._chat_worker_done(" [stopped]\n"))
+        self._chat_worker.finished.connect(self._chat_worker.deleteLater)
+        self.send_button.setText("Stop")
+        self._chat_worker.start()
+
+    def _append_chat_text(self, text):
+        """Appends text at the end of the chat without starting a new paragraph, and scrolls to it."""
+        cursor = self.chat_display.textCursor()
+        cursor.movePosition(QTextCursor.MoveOperation.End)
+        cursor.insertText(text)
+        self.chat_display.setTextCursor(cursor)
         # Scroll to bottom
         self.chat_display.verticalScrollBar().setValue(
             self.chat_display.verticalScrollBar().maximum()
         )
 
+    def handle_chat_chunk(self, text):
+        """Shows the next piece of the streamed AI response."""
+        self._append_chat_text(text)
+
+    def _chat_worker_done(self, closing_text):
+        """Ends the streamed response in the chat and restores the Send button."""
+        self._append_chat_text(closing_text)
+        self._chat_worker = None
+        self.send_button.setText("Send")
+        self.send_button.setEnabled(True)
+
     def download_annotated_image(self):
         """Handle downloading the annotated image."""
         if not self.combined_image_label._current_pixmap:
@@ -746,7 +877,7 @@ class UIOcrApp(QWidget):
             try:
                 # Save the JSON data with proper formatting
                 with open(file_path, 'w') as f:
-                    json.dump(self.analysis_data, f, indent=4)
+                    json.dump(self.analysis_data, f, indent=4, default=json_default)
                 QMessageBox.information(self, "Success", f"JSON data saved successfully to:\n{file_path}")
                 
                 # Update last directory to the save location
@@ -771,7 +902,7 @@ class UIOcrApp(QWidget):
             with open(config_path, 'w') as f:
                 json.dump(config, f, indent=4)
             QMessageBox.information(self, "Gemini API Key", "API key saved. The AI assistant will use this key from now on.")
-            # Re-initialize GeminiHandler with new key
+            # Re-initialize GeminiHandler with new key; a response still streaming keeps the old one
             self.gemini_handler = GeminiHandler(config_path=config_path)
         except Exception as e:
             QMessageBox.critical(self, "Error", f"Failed to save API key: {e}")
@@ -51,6 +51,15 @@ class ZoomableLabel(QLabel):
         self._total_pan_offset = QPointF(0, 0) # Reset pan offset when new image is loaded
         self._apply_scale() # Apply this initial scale
 
+    def update_pixmap(self, pixmap: QPixmap):
+        """Replaces the pixmap with another rendering of the same image (e.g. with more annotations),
+        keeping the user's zoom and pan. A pixmap of a different size is set like setPixmap."""
+        if self._original_pixmap is None or self._original_pixmap.size() != pixmap.size():
+            self.setPixmap(pixmap)
+            return
+        self._original_pixmap = pixmap
+        self._apply_scale()
+
     def _calculate_fit_scale(self):
          """Calculates the scale needed to fit the original pixmap into the current label size."""
          if self._original_pixmap:
@@ -394,7 +403,13 @@ class ZoomableLabel(QLabel):
 
 
 def draw_annotations(image_cv, yolo_elements=None, ocr_text_blocks=None, draw_yolo_associated_text=False, draw_element_type=False):
-    """Draws YOLO and/or OCR annotations on a copy of the OpenCV image."""
+    """Draws YOLO and/or OCR annotations on a copy of the OpenCV image and returns a QPixmap (GUI thread only)."""
+    return QPixmap.fromImage(render_annotations(image_cv, yolo_elements, ocr_text_blocks, draw_yolo_associated_text, draw_element_type))
+
+
+def render_annotations(image_cv, yolo_elements=None, ocr_text_blocks=None, draw_yolo_associated_text=False, draw_element_type=False):
+    """Draws YOLO and/or OCR annotations on a copy of the OpenCV image and returns a QImage.
+    Unlike QPixmap, QImage can be painted on worker threads."""
     # Create a deep copy to draw on without modifying the original image
     annotated_image_cv = image_cv.copy()
 
@@ -478,4 +493,4 @@ def draw_annotations(image_cv, yolo_elements=None, ocr_text_blocks=None, draw_yo
 
 
     painter.end()
-    return QPixmap.fromImage(q_image)
\ No newline at end of file
+    return q_image
\ No newline at end of file
@@ -0,0 +1,195 @@
+import json
+import threading
+import traceback
+
+from PyQt6.QtCore import QThread, pyqtSignal
+
+from analysis_core import AnalysisCore
+from compact_results import json_default
+from gemini_handler import ResponseCancelled
+from ui_widgets import render_annotations
+
+# Progress bar value reached when each stage of an analysis finishes
+STAGE_PROGRESS = {'yolo': 40, 'ocr': 70, 'association': 80, 'rendering': 95}
+
+
+class AnalysisCancelled(Exception):
+    """Raised inside AnalysisWorker to stop at the next stage boundary."""
+
+
+class ModelLoaderThread(QThread):
+    """Builds the AnalysisCore (YOLO + PaddleOCR) off the GUI thread."""
+    progress = pyqtSignal(str, int) # Status message and percent complete
+    models_loaded = pyqtSignal(object) # The AnalysisCore, or None if construction failed
+
+    def __init__(self, analysis_config, parent=None):
+        super().__init__(parent)
+        self.analysis_config = analysis_config
+
+    def run(self):
+        try:
+            analysis_core = AnalysisCore.from_config(self.analysis_config, progress_callback=self.progress.emit)
+        except Exception as e:
+            print(f"Error loading models in background: {e}")
+            analysis_core = None
+        self.models_loaded.emit(analysis_core)
+
+
+class AnalysisWorker(QThread):
+    """Runs one analysis off the GUI thread: inference, association, persisting the results,
+    drawing the annotated images and formatting the JSON text.
+
+    Each stage publishes what it can as soon as it finishes (partial_results): the YOLO boxes
+    right after detection, the OCR text after recognition, then the associated results. With
+    cached_data the inference stages are skipped and only the rendering runs. With a
+    near_duplicate_distance, a stored analysis of a near-identical image (see
+    DataManager.find_near_duplicate) is looked up first and, if found, used like cached_data. Annotated images
+    are emitted as QImages; the GUI thread converts them to QPixmaps.
+    Cancelling takes effect at the next stage boundary, since a running model call can't be interrupted.
+    """
+    stage_progress = pyqtSignal(str, int) # Finished stage ('yolo', 'ocr', 'association', 'rendering') and percent
+    partial_results = pyqtSignal(str, object) # Finished stage and a dict with its results and the images drawn from them
+    analysis_finished = pyqtSignal(object) # dict with the results, rendered images and JSON text
+    analysis_failed = pyqtSignal(str)
+    analysis_cancelled = pyqtSignal()
+
+    def __init__(self, analysis_core, data_manager, image_cv, image_path, image_hash=None, cache_key=None,
+                 fingerprint=None, cached_data=None, near_duplicate_distance=None, parent=None):
+        super().__init__(parent)
+        self.analysis_core = analysis_core
+        self.data_manager = data_manager
+        self.image_cv = image_cv
+        self.image_path = image_path
+        self.image_hash = image_hash
+        self.cache_key = cache_key
+        self.fingerprint = fingerprint
+        self.cached_data = cached_data
+        self.near_duplicate_distance = near_duplicate_distance
+        self._cancel_requested = False
+        self._yolo_results = None
+
+    def cancel(self):
+        """Asks the worker to stop; analysis_cancelled is emitted once it has."""
+        self._cancel_requested = True
+
+    def _check_cancelled(self):
+        if self._cancel_requested:
+            raise AnalysisCancelled()
+
+    def _stage_finished(self, stage, results=None):
+        self._check_cancelled()
+        self.stage_progress.emit(stage, STAGE_PROGRESS[stage])
+        # Draw what this stage made visible. In concurrent mode this runs while OCR is still going.
+        if stage == 'yolo':
+            self._yolo_results = results
+            self._publish(stage, yolo_results=results, images={
+                'yolo': render_annotations(self.image_cv, yolo_elements=results, draw_yolo_associated_text=True, draw_element_type=True),
+                'combined': render_annotations(self.image_cv, yolo_elements=results, draw_element_type=True)
+            })
+        elif stage == 'ocr':
+            self._publish(stage, ocr_results=results, images={
+                'ocr': render_annotations(self.image_cv, ocr_text_blocks=results),
+                'combined': render_annotations(self.image_cv, yolo_elements=self._yolo_results, ocr_text_blocks=results, draw_element_type=True)
+            })
+
+    def _publish(self, stage, **payload):
+        self._check_cancelled()
+        self.partial_results.emit(stage, dict(payload, image_path=self.image_path, image_hash=self.image_hash))
+
+    def _reuse_near_duplicate(self):
+        """Looks up a near-duplicate analysis and stores it for this image. Returns its cached data or None."""
+        cached_data = self.data_manager.find_near_duplicate(self.fingerprint, self.near_duplicate_distance)
+        if cached_data:
+            # Keep it under this file's own key so reopening it is an exact hit. No fingerprint:
+            # copies of copies must not drift further and further from the analyzed original.
+            self.data_manager.save_analysis(self.image_path, cached_data['analysis_data'])
+            if self.cache_key and not self.data_manager.store_analysis(self.cache_key, self.image_path, cached_data['analysis_data'],
+                                                                       cached_data['yolo_results'], cached_data['ocr_results'],
+                                                                       self.image_hash):
+                raise RuntimeError("Could not write the analysis to the result store.")
+        return cached_data
+
+    def run(self):
+        try:
+            if self.cached_data is None and self.near_duplicate_distance is not None and self.fingerprint:
+                self.cached_data = self._reuse_near_duplicate()
+                self._check_cancelled()
+            if self.cached_data is None:
+                yolo_results, ocr_results = self.analysis_core.run_analysis(self.image_cv, stage_callback=self._stage_finished)
+                # Compact (array-backed) result: much smaller in memory and in the cache, same dict-style access
+                analysis_data = self.analysis_core.associate_results(yolo_results, ocr_results, compact=True)
+                self._stage_finished('association')
+                self._publish('association', analysis_data=analysis_data)
+                # Persist here so the disk writes stay off the GUI thread too; the GUI thread
+                # only adds the results to the in-memory cache (DataManager.remember_analysis)
+                self.data_manager.save_analysis(self.image_path, analysis_data)
+                # A result that isn't stored must not be cached in memory either: the LRU would later
+                # drop it as if it could be reloaded from the store. analysis_failed reports it instead.
+                if self.cache_key and not self.data_manager.store_analysis(self.cache_key, self.image_path, analysis_data,
+                                                                           yolo_results, ocr_results, self.image_hash,
+                                                                           self.fingerprint):
+                    raise RuntimeError("Could not write the analysis to the result store.")
+            else:
+                analysis_data = self.cached_data['analysis_data']
+                yolo_results = self.cached_data['yolo_results']
+                ocr_results = self.cached_data['ocr_results']
+
+            # All Annotations tab: no annotations drawn initially, only on hover
+            images = {'all': render_annotations(self.image_cv)}
+            if self.cached_data is not None:
+                # A fresh analysis already sent the other images with its partial results
+                images['ocr'] = render_annotations(self.image_cv, ocr_text_blocks=ocr_results)
+                images['yolo'] = render_annotations(self.image_cv, yolo_elements=yolo_results, draw_yolo_associated_text=True, draw_element_type=True)
+                images['combined'] = render_annotations(self.image_cv, yolo_elements=yolo_results, ocr_text_blocks=ocr_results, draw_element_type=True)
+            json_text = json.dumps(analysis_data, indent=4, default=json_default)
+            self._stage_finished('rendering')
+
+            self.analysis_finished.emit({
+                'image_path': self.image_path,
+                'image_hash': self.image_hash,
+                'cache_key': self.cache_key,
+                'from_cache': self.cached_data is not None,
+                'analysis_data': analysis_data,
+                'yolo_results': yolo_results,
+                'ocr_results': ocr_results,
+                'images': images, # Only those not already sent with partial_results
+                'json_text': json_text
+            })
+        except AnalysisCancelled:
+            print(f"Analysis of {self.image_path} cancelled.")
+            self.analysis_cancelled.emit()
+        except Exception as e:
+            traceback.print_exc()
+            self.analysis_failed.emit(str(e))
+
+
+class ChatWorker(QThread):
+    """Streams one AI assistant response off the GUI thread (GeminiHandler.stream_response)."""
+    chunk_received = pyqtSignal(str) # Next piece of the response text
+    response_finished = pyqtSignal()
+    response_failed = pyqtSignal(str)
+    response_cancelled = pyqtSignal()
+
+    def __init__(self, gemini_handler, user_query, analysis_data, image_name=None, parent=None):
+        super().__init__(parent)
+        self.gemini_handler = gemini_handler
+        self.user_query = user_query
+        self.analysis_data = analysis_data
+        self.image_name = image_name
+        self._cancel_event = threading.Event()
+
+    def cancel(self):
+        """Stops the response at the next chunk; response_cancelled is emitted once it has."""
+        self._cancel_event.set()
+
+    def run(self):
+        try:
+            for chunk in self.gemini_handler.stream_response(self.user_query, self.analysis_data, self.image_name,
+                                                             cancel_event=self._cancel_event):
+                self.chunk_received.emit(chunk)
+            self.response_finished.emit()
+        except ResponseCancelled:
+            self.response_cancelled.emit()
+        except Exception as e:
+            print(f"Error generating response: {e}")
+            self.response_failed.emit(str(e))
@@ -0,0 +1,283 @@
+import argparse
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+
+import box_geometry
+from analysis_core import DIFF_THRESHOLD, INCREMENTAL_MARGIN, INCREMENTAL_MAX_CHANGED, _changed_regions, _overlaps
+from jsonl_sink import JsonlWriter
+
+VIDEO_EXTENSIONS = ('.mp4', '.mkv', '.avi', '.mov', '.webm')
+SAMPLE_SCALE = 0.5 # Frames are compared at half resolution when deciding whether to analyze them
+TRACK_IOU = 0.5 # Minimum IoU for a detection to continue an existing track of the same type
+
+
+def iter_frames(video_path, frame_step=1):
+    """Yields (frame_index, timestamp_ms, frame) from a video, decoding one frame at a time.
+    With frame_step > 1 only every frame_step-th frame is decoded."""
+    capture = cv2.VideoCapture(video_path)
+    if not capture.isOpened():
+        raise IOError(f"Cannot open video file {video_path}")
+    try:
+        frame_index = 0
+        while True:
+            if frame_index % frame_step:
+                # grab() advances without converting the frame to an image
+                if not capture.grab():
+                    break
+            else:
+                ok, frame = capture.read()
+                if not ok:
+                    break
+                yield frame_index, capture.get(cv2.CAP_PROP_POS_MSEC), frame
+            frame_index += 1
+    finally:
+        capture.release()
+
+
+def sample_changed_frames(frames, threshold=DIFF_THRESHOLD, min_changed_pixels=0):
+    """Filters a (frame_index, timestamp_ms, frame) stream down to the frames whose content differs
+    from the last frame let through: more than min_changed_pixels pixels changed by more than threshold."""
+    previous_small = None
+    for frame_index, timestamp_ms, frame in frames:
+        small = cv2.resize(frame, None, fx=SAMPLE_SCALE, fy=SAMPLE_SCALE, interpolation=cv2.INTER_AREA)
+        if previous_small is not None and previous_small.shape == small.shape:
+            changed_pixels = np.count_nonzero(cv2.absdiff(previous_small, small).max(axis=2) > threshold)
+            if changed_pixels <= min_changed_pixels:
+                continue
+        previous_small = small
+        yield frame_index, timestamp_ms, frame
+
+
+class ElementTracker:
+    """Follows YOLO elements from one analyzed frame to the next.
+
+    A detection continues the best-overlapping track of the same type. The track keeps the
+    greyscale pixels at its box; if the new frame has the same pixels there, the element is
+    unchanged and its text doesn't need to be read again.
+    """
+
+    def __init__(self, iou_threshold=TRACK_IOU, pixel_threshold=DIFF_THRESHOLD):
+        self.iou_threshold = iou_threshold
+        self.pixel_threshold = pixel_threshold
+        self._tracks = []
+        self._next_id = 0
+
+    @staticmethod
+    def _crop(grey, box):
+        x1, y1, x2, y2 = box
+        return grey[y1:y2, x1:x2].copy()
+
+    @staticmethod
+    def _pixel_box(bbox, width, height):
+        x1, y1, x2, y2 = bbox
+        return [max(0, int(x1)), max(0, int(y1)), min(width, int(np.ceil(x2))), min(height, int(np.ceil(y2)))]
+
+    def update(self, frame, elements):
+        """Matches this frame's elements to the tracks. Returns one track per element, in order;
+        each track dict has 'id', 'changed' (new element or different pixels) and 'texts'."""
+        grey = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        height, width = grey.shape
+        iou = box_geometry.pairwise_iou([element['bbox'] for element in elements], [track['bbox'] for track in self._tracks])
+
+        # Greedy matching, most-overlapping pairs first
+        pairs = sorted(((iou[i, j], i, j) for i in range(iou.shape[0]) for j in range(iou.shape[1])
+                        if iou[i, j] >= self.iou_threshold and elements[i]['type'] == self._tracks[j]['type']), reverse=True)
+        matched_tracks = {}
+        used_tracks = set()
+        for _, element_index, track_index in pairs:
+            if element_index not in matched_tracks and track_index not in used_tracks:
+                matched_tracks[element_index] = self._tracks[track_index]
+                used_tracks.add(track_index)
+
+        tracks = []
+        for element_index, element in enumerate(elements):
+            track = matched_tracks.get(element_index)
+            if track is not None:
+                # Compare the same pixel box in both frames, so box jitter between detections doesn't count as a change
+                crop = self._crop(grey, track['pixel_box'])
+                if crop.shape == track['crop'].shape and not np.count_nonzero(cv2.absdiff(crop, track['crop']) > self.pixel_threshold):
+                    track['changed'] = False
+                    tracks.append(track)
+                    continue
+                track['changed'] = True
+            else:
+                track = {'id': self._next_id, 'type': element['type'], 'changed': True}
+                self._next_id += 1
+            track['bbox'] = list(element['bbox'])
+            track['pixel_box'] = self._pixel_box(element['bbox'], width, height)
+            track['crop'] = self._crop(grey, track['pixel_box'])
+            track['texts'] = []
+            tracks.append(track)
+
+        # Elements that disappeared end their tracks
+        self._tracks = tracks
+        return tracks
+
+
+class VideoAnalyzer:
+    """Analyzes the frames of one recording in order, reusing OCR for unchanged elements.
+
+    YOLO runs on every analyzed frame. Text inside an element is read from its crop only when
+    the element is new or its pixels changed. In 'full' OCR mode, text outside elements is
+    re-read only in the screen regions that changed since the previous analyzed frame.
+    """
+
+    def __init__(self, analysis_core, margin=INCREMENTAL_MARGIN):
+        self.core = analysis_core
+        self.margin = margin
+        self.tracker = ElementTracker()
+        self._previous_frame = None
+        self._background_texts = []
+
+    @staticmethod
+    def _center_in(ocr_res, bbox, padding=0):
+        center_x = (ocr_res['bbox'][0] + ocr_res['bbox'][2]) / 2
+        center_y = (ocr_res['bbox'][1] + ocr_res['bbox'][3]) / 2
+        return bbox[0] - padding <= center_x <= bbox[2] + padding and bbox[1] - padding <= center_y <= bbox[3] + padding
+
+    def analyze(self, frame):
+        """Returns (yolo_results, ocr_results, stats) for the next frame of the recording."""
+        height, width = frame.shape[:2]
+        yolo_results = self.core.run_yolo(frame)
+        tracks = self.tracker.update(frame, yolo_results)
+        for element, track in zip(yolo_results, tracks):
+            element['track_id'] = track['id']
+        changed_tracks = [track for track in tracks if track['changed']]
+        padding = self.core.crop_padding
+
+        # Regions of the screen outside unchanged elements that need reading again
+        if self._previous_frame is None or self._previous_frame.shape != frame.shape:
+            regions = [[0, 0, width, height]]
+        else:
+            regions = _changed_regions(self._previous_frame, frame, margin=self.margin)
+        changed_area = sum((x2 - x1) * (y2 - y1) for x1, y1, x2, y2 in regions)
+        full_page = self.core.ocr_mode == 'full' and changed_area > INCREMENTAL_MAX_CHANGED * width * height
+
+        if full_page:
+            # Most of the screen changed: one page OCR is cheaper than many crops and serves every element
+            page_texts = self.core.run_ocr(frame)
+            for track in changed_tracks:
+                track['texts'] = [ocr_res for ocr_res in page_texts if self._center_in(ocr_res, track['bbox'], padding)]
+            background_texts = [ocr_res for ocr_res in page_texts
+                                if not any(self._center_in(ocr_res, element['bbox'], padding) for element in yolo_results)]
+        else:
+            if changed_tracks:
+                changed_elements = [{'bbox': track['bbox']} for track in changed_tracks]
+                crop_texts = self.core.run_crop_ocr(frame, changed_elements)
+                for track in changed_tracks:
+                    track['texts'] = [ocr_res for ocr_res in crop_texts if self._center_in(ocr_res, track['bbox'], padding)]
+            background_texts = []
+            if self.core.ocr_mode == 'full':
+                background_texts = self._update_background(frame, regions, yolo_results, padding)
+
+        # Nested elements can hold the same line; keep one copy of each
+        ocr_results = []
+        for ocr_res in [ocr_res for track in tracks for ocr_res in track['texts']] + background_texts:
+            if not any(existing['text'] == ocr_res['text'] and box_geometry.iou(existing['bbox'], ocr_res['bbox']) > 0.5
+                       for existing in ocr_results):
+                ocr_results.append(dict(ocr_res, bbox=list(ocr_res['bbox'])))
+
+        self._previous_frame = frame
+        self._background_texts = background_texts
+        stats = {'elements': len(tracks), 'reocr_elements': len(changed_tracks),
+                 'changed_area': changed_area / (width * height), 'full_page_ocr': full_page}
+        return yolo_results, ocr_results, stats
+
+    def _update_background(self, frame, regions, yolo_results, padding):
+        """Text outside elements: kept from the previous frame unless a changed region touches it,
+        and read again inside the changed regions."""
+        height, width = frame.shape[:2]
+        in_element = lambda ocr_res: any(self._center_in(ocr_res, element['bbox'], padding) for element in yolo_results)
+        background_texts = [ocr_res for ocr_res in self._background_texts
+                            if not any(_overlaps(ocr_res['bbox'], region) for region in regions) and not in_element(ocr_res)]
+        # Text in a region that lies inside an element belongs to that element's crop
+        regions = [region for region in regions
+                   if not any(box_geometry.contains([element['bbox'][0] - padding, element['bbox'][1] - padding,
+                                                     element['bbox'][2] + padding, element['bbox'][3] + padding], region)
+                              for element in yolo_results)]
+        if not regions:
+            return background_texts
+
+        windows = [[max(0, x1 - self.margin), max(0, y1 - self.margin), min(width, x2 + self.margin), min(height, y2 + self.margin)]
+                   for x1, y1, x2, y2 in regions]
+        crops = [np.ascontiguousarray(frame[y1:y2, x1:x2]) for x1, y1, x2, y2 in windows]
+        for region, (offset_x, offset_y, _, _), texts in zip(regions, windows, self.core.run_ocr_batch(crops)):
+            for ocr_res in texts:
+                x1, y1, x2, y2 = ocr_res['bbox']
+                ocr_res = dict(ocr_res, bbox=[x1 + offset_x, y1 + offset_y, x2 + offset_x, y2 + offset_y])
+                if self._center_in(ocr_res, region) and not in_element(ocr_res):
+                    background_texts.append(ocr_res)
+        return background_texts
+
+
+def analyze_video(analysis_core, video_path, frame_step=1, sample_threshold=DIFF_THRESHOLD, min_changed_pixels=0):
+    """Streams per-frame analyses of a video. Yields one dict per analyzed frame with frame_index,
+    timestamp_ms, analysis_data, stats and seconds; unchanged frames are skipped."""
+    analyzer = VideoAnalyzer(analysis_core)
+    frames = sample_changed_frames(iter_frames(video_path, frame_step), sample_threshold, min_changed_pixels)
+    for frame_index, timestamp_ms, frame in frames:
+        start_time = time.perf_counter()
+        yolo_results, ocr_results, stats = analyzer.analyze(frame)
+        analysis_data = analysis_core.associate_results(yolo_results, ocr_results)
+        yield {
+            'frame_index': frame_index,
+            'timestamp_ms': timestamp_ms,
+            'analysis_data': analysis_data,
+            'stats': stats,
+            'seconds': time.perf_counter() - start_time
+        }
+
+
+def main(argv=None):
+    base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    parser = argparse.ArgumentParser(description="Analyze a screen recording frame by frame.")
+    parser.add_argument('video', help="Video file (" + ", ".join(VIDEO_EXTENSIONS) + ").")
+    parser.add_argument('-o', '--output', default=None,
+                        help="JSON Lines file, one analyzed frame per line (default: output/<video>_frames.jsonl). "
+                             "A .gz or .zst extension compresses it.")
+    parser.add_argument('--frame-step', type=int, default=1, help="Only look at every N-th frame.")
+    parser.add_argument('--sample-threshold', type=int, default=DIFF_THRESHOLD,
+                        help="Per-pixel difference that counts as a change when deciding whether to analyze a frame.")
+    parser.add_argument('--min-changed-pixels', type=int, default=0,
+                        help="Frames with at most this many changed (half-resolution) pixels are skipped.")
+    args = parser.parse_args(argv)
+
+    from analysis_config import load_analysis_config
+    from analysis_core import AnalysisCore
+
+    output_path = args.output or os.path.join(
+        base_dir, 'output', f"{os.path.splitext(os.path.basename(args.video))[0]}_frames.jsonl")
+    os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+
+    core = AnalysisCore.from_config(load_analysis_config(base_dir), warmup_size=None)
+    if core.yolo_model is None or core.ocr_model is None:
+        print("Models failed to load.")
+        return 1
+
+    start_time = time.perf_counter()
+    analyzed = 0
+    try:
+        # Flushed every frame so consumers can follow the file while it is written
+        with JsonlWriter(output_path, flush_every=1) as writer:
+            for record in analyze_video(core, args.video, max(1, args.frame_step), args.sample_threshold, args.min_changed_pixels):
+                writer.write(record)
+                analyzed += 1
+                stats = record['stats']
+                print(f"Frame {record['frame_index']} ({record['timestamp_ms'] / 1000:.1f}s): {len(record['analysis_data'])} items, "
+                      f"{stats['reocr_elements']}/{stats['elements']} elements re-read in {record['seconds']:.2f}s")
+    except IOError as e:
+        print(f"Error: {e}")
+        return 1
+    finally:
+        core.close()
+
+    print(f"Analyzed {analyzed} frames in {time.perf_counter() - start_time:.1f}s. Results saved to {output_path}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
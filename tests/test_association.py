@@ -0,0 +1,170 @@
+import io
+import json
+import random
+from contextlib import redirect_stdout
+
+import pytest
+
+pytest.importorskip('cv2')
+pytest.importorskip('paddleocr')
+pytest.importorskip('ultralytics')
+QtCore = pytest.importorskip('PyQt6.QtCore')
+
+import analysis_core
+from compact_results import json_default
+
+TYPES = ['button', 'icon', 'input', 'checkbox']
+
+
+def reference_associate(yolo_results, ocr_results):
+    """The original QRectF loop from associate_results, kept verbatim as the reference.
+    QRectF(*bbox) reads [x1, y1, x2, y2] as (x, y, width, height); the engines keep that."""
+    QRectF = QtCore.QRectF
+    json_output_elements = json.loads(json.dumps(yolo_results)) if yolo_results else []
+    ocr_results_copy = json.loads(json.dumps(ocr_results)) if ocr_results else []
+    associated_ocr_indices = set()
+    json_output_elements.sort(key=lambda x: (x['bbox'][1], x['bbox'][0]))
+    ocr_results_copy.sort(key=lambda x: (x['bbox'][1], x['bbox'][0]))
+    for idx, element in enumerate(json_output_elements):
+        element['index'] = idx
+
+    for ocr_res in ocr_results_copy:
+        ocr_bbox_rect = QRectF(*ocr_res['bbox'])
+        best_match_element_index = -1
+        best_iou = 0.0
+        contained_in_element_index = -1
+        for elem_index, element in enumerate(json_output_elements):
+            element_bbox_rect = QRectF(*element['bbox'])
+            if element_bbox_rect.contains(ocr_bbox_rect):
+                contained_in_element_index = elem_index
+                break
+            intersection_rect = element_bbox_rect.intersected(ocr_bbox_rect)
+            if not intersection_rect.isEmpty():
+                intersection_area = intersection_rect.width() * intersection_rect.height()
+                ocr_area = ocr_bbox_rect.width() * ocr_bbox_rect.height()
+                element_area = element_bbox_rect.width() * element_bbox_rect.height()
+                union_area = ocr_area + element_area - intersection_area
+                iou = intersection_area / union_area if union_area > 0 else 0
+                if contained_in_element_index == -1 and iou > 0.3 and iou > best_iou:
+                    best_iou = iou
+                    best_match_element_index = elem_index
+        associated_element_index = contained_in_element_index if contained_in_element_index != -1 else best_match_element_index
+        if associated_element_index != -1:
+            json_output_elements[associated_element_index]['associated_text'].append(ocr_res)
+            try:
+                original_ocr_index = ocr_results.index(next(item for item in ocr_results if item['bbox'] == ocr_res['bbox'] and item['text'] == ocr_res['text']))
+                associated_ocr_indices.add(original_ocr_index)
+            except (ValueError, StopIteration):
+                pass
+
+    final_json_output_data = list(json_output_elements)
+    standalone_text_elements = []
+    for i, ocr_res in enumerate(ocr_results or []):
+        if i not in associated_ocr_indices:
+            standalone_text_elements.append({
+                "type": "text",
+                "confidence": ocr_res['confidence'],
+                "bbox": ocr_res['bbox'],
+                "text": ocr_res['text'],
+                "index": len(final_json_output_data) + len(standalone_text_elements)
+            })
+    standalone_text_elements.sort(key=lambda x: (x['bbox'][1], x['bbox'][0]))
+    final_json_output_data.extend(standalone_text_elements)
+    final_json_output_data.sort(key=lambda item: (0 if item.get('type') != 'text' else 1, item['bbox'][1], item['bbox'][0]))
+    for idx, item in enumerate(final_json_output_data):
+        item['index'] = idx
+    return final_json_output_data
+
+
+def reference_assignments(element_bboxes, ocr_bboxes):
+    """Element index the reference loop picks for each OCR box (-1 for none)."""
+    QRectF = QtCore.QRectF
+    assignments = []
+    for ocr_bbox in ocr_bboxes:
+        ocr_rect = QRectF(*ocr_bbox)
+        contained, best, best_iou = -1, -1, 0.0
+        for elem_index, element_bbox in enumerate(element_bboxes):
+            element_rect = QRectF(*element_bbox)
+            if element_rect.contains(ocr_rect):
+                contained = elem_index
+                break
+            intersection = element_rect.intersected(ocr_rect)
+            if not intersection.isEmpty():
+                intersection_area = intersection.width() * intersection.height()
+                union_area = ocr_rect.width() * ocr_rect.height() + element_rect.width() * element_rect.height() - intersection_area
+                iou = intersection_area / union_area if union_area > 0 else 0
+                if iou > 0.3 and iou > best_iou:
+                    best, best_iou = elem_index, iou
+        assignments.append(contained if contained != -1 else best)
+    return assignments
+
+
+def random_scene(rng, element_count, text_count):
+    """YOLO elements with float boxes and OCR blocks with integer boxes, like the real parsers produce.
+    Boxes are small and clustered so containment, overlaps and ties all occur."""
+    yolo_results = []
+    for _ in range(element_count):
+        x, y = float(rng.randint(0, 400)), float(rng.randint(0, 300))
+        yolo_results.append({'type': rng.choice(TYPES), 'confidence': rng.random(),
+                             'bbox': [x, y, x + rng.randint(0, 200) + 0.5, y + rng.randint(0, 80) + 0.25],
+                             'associated_text': []})
+    ocr_results = []
+    for position in range(text_count):
+        x, y = rng.randint(0, 450), rng.randint(0, 350)
+        ocr_results.append({'text': f't{position}', 'bbox': [x, y, x + rng.randint(0, 120), y + rng.randint(0, 30)],
+                            'confidence': rng.random()})
+    return yolo_results, ocr_results
+
+
+def make_core():
+    core = analysis_core.AnalysisCore.__new__(analysis_core.AnalysisCore)
+    core.association_engine = 'grid'
+    return core
+
+
+def associate(core, yolo_results, ocr_results, **kwargs):
+    with redirect_stdout(io.StringIO()):
+        return core.associate_results(yolo_results, ocr_results, **kwargs)
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_matchers_agree_with_reference_loop(seed):
+    rng = random.Random(seed)
+    for _ in range(20):
+        yolo_results, ocr_results = random_scene(rng, rng.randint(0, 30), rng.randint(0, 40))
+        element_bboxes = sorted((element['bbox'] for element in yolo_results), key=lambda bbox: (bbox[1], bbox[0]))
+        ocr_bboxes = [ocr_res['bbox'] for ocr_res in ocr_results]
+        expected = reference_assignments(element_bboxes, ocr_bboxes)
+        assert list(analysis_core._match_grid(element_bboxes, ocr_bboxes)) == expected
+        assert list(analysis_core._match_numpy(element_bboxes, ocr_bboxes)) == expected
+
+
+@pytest.mark.parametrize('engine', ['grid', 'numpy'])
+@pytest.mark.parametrize('seed', range(10))
+def test_associate_results_matches_reference(engine, seed):
+    rng = random.Random(1000 + seed)
+    core = make_core()
+    for _ in range(20):
+        yolo_results, ocr_results = random_scene(rng, rng.randint(0, 30), rng.randint(0, 40))
+        expected = json.dumps(reference_associate(yolo_results, ocr_results))
+        assert json.dumps(associate(core, yolo_results, ocr_results, engine=engine)) == expected
+        compact = associate(core, yolo_results, ocr_results, engine=engine, compact=True)
+        assert json.dumps(compact, default=json_default) == expected
+
+
+@pytest.mark.parametrize('engine', ['grid', 'numpy'])
+def test_duplicate_ocr_blocks_are_not_reported_twice(engine):
+    # The reference loop looked each associated block up by bbox and text, so the second of two
+    # identical blocks also showed up as standalone text. Both are now associated, once.
+    yolo_results = [{'type': 'button', 'confidence': 0.9, 'bbox': [10.0, 10.0, 200.0, 60.0], 'associated_text': []}]
+    ocr_block = {'text': 'OK', 'bbox': [20, 20, 60, 40], 'confidence': 0.8}
+    ocr_results = [ocr_block, dict(ocr_block)]
+
+    reference = reference_associate(yolo_results, ocr_results)
+    assert [item['type'] for item in reference] == ['button', 'text']
+
+    core = make_core()
+    for analysis in (associate(core, yolo_results, ocr_results, engine=engine),
+                     associate(core, yolo_results, ocr_results, engine=engine, compact=True)):
+        assert [item['type'] for item in analysis] == ['button']
+        assert [ocr_res['text'] for ocr_res in analysis[0]['associated_text']] == ['OK', 'OK']
@@ -0,0 +1,79 @@
+import json
+
+import numpy as np
+import pytest
+
+from binary_results import (load_analysis_binary, read_binary, save_analysis_binary, scan_statistics,
+                            write_binary)
+from compact_results import CompactAnalysis, json_default
+
+OCR_RESULTS = [
+    {'text': 'Sign in', 'bbox': [110, 105, 190, 125], 'confidence': 0.98},
+    {'text': 'Passwort vergessen? ✓', 'bbox': [20, 300, 240, 320], 'confidence': 0.87},
+]
+YOLO_RESULTS = [
+    {'type': 'button', 'confidence': 0.91, 'bbox': [100.5, 100.0, 200.25, 130.0], 'associated_text': []},
+    {'type': 'icon', 'confidence': 0.55, 'bbox': [300.0, 20.0, 330.0, 50.0], 'associated_text': []},
+]
+ANALYSIS_DATA = [
+    {'type': 'button', 'confidence': 0.91, 'bbox': [100.5, 100.0, 200.25, 130.0],
+     'associated_text': [OCR_RESULTS[0]], 'index': 0},
+    {'type': 'icon', 'confidence': 0.55, 'bbox': [300.0, 20.0, 330.0, 50.0], 'associated_text': [],
+     'track_id': 7, 'index': 1},
+    {'type': 'text', 'confidence': 0.87, 'bbox': [20, 300, 240, 320], 'text': 'Passwort vergessen? ✓', 'index': 2},
+]
+
+
+def as_json(data):
+    return json.dumps(data, default=json_default)
+
+
+def test_analysis_round_trip(tmp_path):
+    path = str(tmp_path / 'shot_output.abin')
+    save_analysis_binary(path, ANALYSIS_DATA, YOLO_RESULTS, OCR_RESULTS)
+    analysis_data, yolo_results, ocr_results = load_analysis_binary(path)
+    assert isinstance(analysis_data, CompactAnalysis)
+    assert as_json(analysis_data) == as_json(ANALYSIS_DATA)
+    assert yolo_results == YOLO_RESULTS
+    assert ocr_results == OCR_RESULTS
+
+
+def test_raw_results_are_optional(tmp_path):
+    path = str(tmp_path / 'shot_output.abin')
+    save_analysis_binary(path, ANALYSIS_DATA)
+    analysis_data, yolo_results, ocr_results = load_analysis_binary(path)
+    assert as_json(analysis_data) == as_json(ANALYSIS_DATA)
+    assert yolo_results is None and ocr_results is None
+
+
+def test_write_read_sections_are_memory_mapped(tmp_path):
+    path = str(tmp_path / 'sections.abin')
+    write_binary(path, {'analysis': CompactAnalysis.from_items(ANALYSIS_DATA), 'empty': CompactAnalysis.from_items([])})
+    sections = read_binary(path)
+    assert as_json(sections['analysis']) == as_json(ANALYSIS_DATA)
+    assert list(sections['empty']) == []
+    assert isinstance(sections['analysis'].bboxes.base, np.memmap)
+    assert list(read_binary(path, sections=['empty'])) == ['empty']
+    assert not list(tmp_path.glob('*.tmp'))
+
+
+def test_unsupported_schema_is_rejected(tmp_path):
+    with pytest.raises(ValueError):
+        save_analysis_binary(str(tmp_path / 'bad.abin'), [dict(ANALYSIS_DATA[2], language='de')])
+
+
+def test_not_a_binary_file(tmp_path):
+    path = tmp_path / 'shot_output.abin'
+    path.write_bytes(b'{"not": "binary"}' + bytes(16))
+    with pytest.raises(ValueError):
+        read_binary(str(path))
+
+
+def test_scan_statistics(tmp_path, capsys):
+    save_analysis_binary(str(tmp_path / 'a_output.abin'), ANALYSIS_DATA)
+    save_analysis_binary(str(tmp_path / 'b_output.abin'), ANALYSIS_DATA[:1])
+    (tmp_path / 'broken_output.abin').write_bytes(b'garbage' * 4)
+    stats = scan_statistics(str(tmp_path))
+    assert (stats['files'], stats['unreadable']) == (2, 1)
+    assert (stats['items'], stats['elements'], stats['texts'], stats['associated_texts']) == (4, 3, 1, 2)
+    assert stats['type_counts'] == {'button': 2, 'icon': 1, 'text': 1}
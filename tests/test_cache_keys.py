@@ -0,0 +1,47 @@
+import os
+
+import pytest
+
+pytest.importorskip('cv2')
+
+from data_manager import make_cache_key, output_names
+
+SIGNATURE = {'version': 3, 'detector_backend': 'torch', 'ocr_params': {'lang': 'en', 'use_angle_cls': True}}
+
+
+def test_cache_key_is_stable_and_ignores_key_order():
+    reordered = {'ocr_params': {'use_angle_cls': True, 'lang': 'en'}, 'detector_backend': 'torch', 'version': 3}
+    assert make_cache_key('abc', SIGNATURE) == make_cache_key('abc', reordered)
+
+
+def test_cache_key_changes_with_image_and_signature():
+    key = make_cache_key('abc', SIGNATURE)
+    assert make_cache_key('abd', SIGNATURE) != key
+    assert make_cache_key('abc', dict(SIGNATURE, detector_backend='onnx')) != key
+    assert make_cache_key('abc', dict(SIGNATURE, ocr_params={'lang': 'de', 'use_angle_cls': True})) != key
+
+
+def test_unique_file_names_are_kept():
+    names = output_names([os.path.join('shots', 'login.png'), os.path.join('shots', 'home.jpg')])
+    assert sorted(names.values()) == ['home', 'login']
+
+
+def test_shared_file_names_get_distinct_names():
+    a, b = os.path.join('shots', 'a', 'img.png'), os.path.join('shots', 'b', 'img.png')
+    names = output_names([a, b, os.path.join('shots', 'other.png')])
+    assert names[a] != names[b]
+    assert names[a].startswith('img_') and names[b].startswith('img_')
+    assert names[os.path.join('shots', 'other.png')] == 'other'
+    # The name depends only on the path, not on the other inputs' order
+    assert output_names([b, a]) == {a: names[a], b: names[b]}
+
+
+def test_shared_file_names_are_compared_case_insensitively():
+    a, b = os.path.join('a', 'Img.png'), os.path.join('b', 'img.PNG')
+    names = output_names([a, b])
+    assert names[a] != names[b] and names[a].startswith('Img_') and names[b].startswith('img_')
+
+
+def test_repeated_paths_keep_the_plain_name():
+    path = os.path.join('shots', 'login.png')
+    assert output_names([path, path]) == {path: 'login'}
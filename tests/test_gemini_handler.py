@@ -0,0 +1,55 @@
+import threading
+import time
+
+import pytest
+
+pytest.importorskip('google.generativeai')
+
+from gemini_handler import FakeGenerativeModel, GeminiHandler, ResponseCancelled
+
+RESPONSE_TEXT = "The dialog has an OK button and a Cancel button."
+
+
+def make_handler(chunk_delay=0.01):
+    model = FakeGenerativeModel(response_text=RESPONSE_TEXT, words_per_chunk=2, chunk_delay=chunk_delay)
+    return GeminiHandler('unused_config.json', model=model)
+
+
+def test_stream_completes_and_records_the_exchange():
+    handler = make_handler()
+    chunks = list(handler.stream_response("Which buttons are there?", [], 'dialog.png'))
+    assert len(chunks) > 1
+    assert ''.join(chunks) == RESPONSE_TEXT
+    assert [entry['role'] for entry in handler.conversation_history] == ['user', 'assistant']
+
+
+def test_cancel_mid_stream():
+    handler = make_handler()
+    cancel_event = threading.Event()
+    chunks = []
+    with pytest.raises(ResponseCancelled):
+        for chunk in handler.stream_response("Which buttons are there?", [], cancel_event=cancel_event):
+            chunks.append(chunk)
+            cancel_event.set()
+    assert len(chunks) == 1
+    assert not handler.conversation_history
+
+
+def test_cancel_before_the_first_chunk():
+    # The model takes 5 s to send anything; Stop must not wait for it
+    handler = make_handler(chunk_delay=5.0)
+    cancel_event = threading.Event()
+    threading.Timer(0.2, cancel_event.set).start()
+    start_time = time.monotonic()
+    with pytest.raises(ResponseCancelled):
+        list(handler.stream_response("Which buttons are there?", [], cancel_event=cancel_event))
+    assert time.monotonic() - start_time < 1.0
+
+
+def test_deadline_fires_while_the_stream_stalls():
+    handler = make_handler(chunk_delay=5.0)
+    start_time = time.monotonic()
+    with pytest.raises(TimeoutError):
+        list(handler.stream_response("Which buttons are there?", [], timeout=0.3))
+    assert time.monotonic() - start_time < 1.0
+    assert not handler.conversation_history
@@ -0,0 +1,55 @@
+import numpy as np
+import pytest
+
+pytest.importorskip('cv2')
+pytest.importorskip('paddleocr')
+pytest.importorskip('ultralytics')
+
+from analysis_core import DIFF_THRESHOLD, _changed_regions, _merge_regions
+
+
+def blank():
+    return np.zeros((300, 400, 3), dtype=np.uint8)
+
+
+def test_identical_images_have_no_changes():
+    assert _changed_regions(blank(), blank()) == []
+
+
+def test_differences_below_the_threshold_are_ignored():
+    changed = blank()
+    changed[10:20, 30:50] = DIFF_THRESHOLD
+    assert _changed_regions(blank(), changed) == []
+
+
+def test_separate_changes_give_separate_regions():
+    changed = blank()
+    changed[10:20, 30:50] = 255
+    changed[100:110, 200:210] = 255
+    assert sorted(_changed_regions(blank(), changed, margin=0)) == [[30, 10, 50, 20], [200, 100, 210, 110]]
+
+
+def test_nearby_changes_are_grouped_by_the_margin():
+    changed = blank()
+    changed[10:20, 30:50] = 255
+    changed[10:20, 60:70] = 255
+    regions = _changed_regions(blank(), changed, margin=32)
+    assert len(regions) == 1
+    x1, y1, x2, y2 = regions[0]
+    assert x1 <= 30 and y1 <= 10 and x2 >= 70 and y2 >= 20
+
+
+def test_merge_regions_is_transitive():
+    # The third box bridges the first two, which don't overlap each other
+    assert _merge_regions([[0, 0, 10, 10], [20, 0, 30, 10], [9, 0, 21, 10]]) == [[0, 0, 30, 10]]
+
+
+def test_merge_regions_joins_touching_boxes_only():
+    assert _merge_regions([[0, 0, 10, 10], [10, 0, 20, 10]]) == [[0, 0, 20, 10]]
+    assert sorted(_merge_regions([[0, 0, 10, 10], [11, 0, 20, 10]])) == [[0, 0, 10, 10], [11, 0, 20, 10]]
+
+
+def test_merge_regions_does_not_modify_its_input():
+    regions = [[0, 0, 10, 10], [5, 5, 15, 15]]
+    _merge_regions(regions)
+    assert regions == [[0, 0, 10, 10], [5, 5, 15, 15]]
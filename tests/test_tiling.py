@@ -0,0 +1,45 @@
+import pytest
+
+pytest.importorskip('cv2')
+pytest.importorskip('paddleocr')
+pytest.importorskip('ultralytics')
+
+from analysis_core import _merge_tiled_detections
+
+WIDTH, HEIGHT = 1000, 1000
+LEFT_TILE, RIGHT_TILE = (0, 0, 600, 600), (400, 0, 1000, 600)
+
+
+def element(element_type, bbox, confidence):
+    return {'type': element_type, 'confidence': confidence, 'bbox': bbox}
+
+
+def test_tile_boxes_are_moved_to_image_coordinates():
+    merged = _merge_tiled_detections([], [(RIGHT_TILE, [element('icon', [300, 300, 350, 340], 0.8)])], WIDTH, HEIGHT)
+    assert merged == [element('icon', [700, 300, 750, 340], 0.8)]
+
+
+def test_duplicate_of_the_full_image_pass_keeps_the_more_confident_box():
+    full_image = [element('button', [100, 100, 200, 150], 0.6)]
+    tiles = [(LEFT_TILE, [element('button', [101, 100, 200, 151], 0.9)])]
+    assert _merge_tiled_detections(full_image, tiles, WIDTH, HEIGHT) == [element('button', [101, 100, 200, 151], 0.9)]
+
+
+def test_other_types_are_not_merged():
+    full_image = [element('button', [100, 100, 200, 150], 0.6)]
+    tiles = [(LEFT_TILE, [element('icon', [100, 100, 200, 150], 0.9)])]
+    assert len(_merge_tiled_detections(full_image, tiles, WIDTH, HEIGHT)) == 2
+
+
+def test_seam_fragment_inside_a_complete_box_is_dropped():
+    # The left tile only sees the part of the input left of its edge at x=600. Its IoU with the
+    # whole box is low, but it lies entirely inside it, and complete boxes win over cut ones.
+    full_image = [element('input', [300, 400, 700, 450], 0.5)]
+    tiles = [(LEFT_TILE, [element('input', [500, 400, 600, 450], 0.95)])]
+    assert _merge_tiled_detections(full_image, tiles, WIDTH, HEIGHT) == full_image
+
+
+def test_box_at_the_image_border_is_not_treated_as_cut():
+    # The right tile ends at the image edge, so a box touching it is complete
+    tiles = [(RIGHT_TILE, [element('icon', [550, 10, 600, 60], 0.7)])]
+    assert _merge_tiled_detections([], tiles, WIDTH, HEIGHT) == [element('icon', [950, 10, 1000, 60], 0.7)]